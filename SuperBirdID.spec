@@ -13,12 +13,33 @@ a = Analysis(
         ('bird_reference.sqlite', '.'),
         ('birdinfo.json', '.'),  # 保留作为备用
         ('ebird_regions.json', '.'),  # eBird 国家和地区数据
+        ('country_boundaries.json', '.'),  # 离线国家边界（GPS国家判断）
+        ('admin1_points.json', '.'),  # 离线州/省城镇点（GPS区域判断）
         ('offline_ebird_data', 'offline_ebird_data'),
         ('exiftool_bundle', 'exiftool_bundle'),  # 完整的 ExifTool bundle（包含所有依赖）
         ('SuperBirdID_API.py', '.'),  # API 服务器模块
+        ('api_server.py', '.'),  # API 生产服务器启动器
+        ('admission_control.py', '.'),  # 识别请求准入控制
+        ('uploads.py', '.'),  # 图片上传接收（保留原始EXIF）
+        ('jobs.py', '.'),  # 异步识别任务（SQLite 持久化进度）
+        ('sqlite_store.py', '.'),  # SQLite 存储基类（线程独立连接、LRU淘汰）
+        ('result_cache.py', '.'),  # 识别结果缓存（按内容寻址，ETag）
+        ('stage_cache.py', '.'),  # 检测框和 logits 缓存（API/GUI/命令行共用）
+        ('metrics.py', '.'),  # 运行指标（Prometheus /metrics）
+        ('tracing.py', '.'),  # 请求耗时追踪（Chrome trace 导出）
         ('ebird_country_filter.py', '.'),  # eBird 过滤器模块
+        ('offline_geocoder.py', '.'),  # 离线地理编码模块
+        ('ebird_cache_store.py', '.'),  # eBird 物种列表缓存存储
+        ('geo_tiles.py', '.'),  # GPS位置缓存瓦片
+        ('http_client.py', '.'),  # 共享HTTP客户端（重试/熔断）
+        ('single_flight.py', '.'),  # 并发请求合并
+        ('region_mask.py', '.'),  # 区域物种掩码
+        ('species_pack.py', '.'),  # 离线物种列表打包文件
+        ('occurrence_filter.py', '.'),  # 离线分布位图筛选
+        ('species_catalog.py', '.'),  # 内存物种目录
+        ('species_search.py', '.'),  # 物种全文搜索
     ],
-    hiddenimports=['SuperBirdID_API', 'ebird_country_filter'],
+    hiddenimports=['SuperBirdID_API', 'api_server', 'admission_control', 'uploads', 'jobs', 'sqlite_store', 'result_cache', 'stage_cache', 'metrics', 'tracing', 'ebird_country_filter', 'ebird_cache_store', 'geo_tiles', 'http_client', 'single_flight', 'offline_geocoder', 'region_mask', 'species_pack', 'occurrence_filter', 'species_catalog', 'species_search'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
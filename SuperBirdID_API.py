@@ -7,26 +7,42 @@ SuperBirdID API服务器
 
 __version__ = "3.2.1"
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
-import base64
-from io import BytesIO
+import sys
 from PIL import Image
-import tempfile
 import torch
 import numpy as np
 import cv2
 import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # 导入核心识别模块
 from SuperBirdId import (
-    load_image, lazy_load_classifier, lazy_load_bird_info, lazy_load_database,
+    load_image, lazy_load_classifier, lazy_load_bird_info, lazy_load_database, lazy_load_species_catalog,
     extract_gps_from_exif, get_region_from_gps,
     write_bird_name_to_exif, get_bird_description_from_db,
     write_bird_caption_to_exif, get_user_data_dir, script_dir,
-    YOLOBirdDetector, YOLO_AVAILABLE, EBIRD_FILTER_AVAILABLE, DATABASE_AVAILABLE
+    lazy_load_stage_cache, get_classifier_model_file, YOLOBirdDetector, YOLO_AVAILABLE, EBIRD_FILTER_AVAILABLE,
+    DATABASE_AVAILABLE, YOLO_MODEL_PATH
 )
+from region_mask import RegionMaskIndex, get_region_mask_index
+from occurrence_filter import get_occurrence_filter
+from api_server import add_server_arguments, run_server
+from admission_control import AdmissionController, AdmissionRejected, LANES
+from uploads import UploadError, UploadTooLarge, remove_upload, save_base64_upload, save_upload
+from jobs import JobManager, JobStore, list_image_files
+from result_cache import ResultCache, make_cache_key
+from stage_cache import file_fingerprint
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, STAGE_DB_LOOKUP, STAGE_EBIRD_FILTER, STAGE_FORWARD, STAGE_LOAD_IMAGE,
+    STAGE_METADATA, STAGE_PREPROCESS, STAGE_YOLO, pipeline_metrics
+)
+from tracing import Trace, run_in_trace, use_trace
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -36,6 +52,7 @@ CORS(app)  # 允许跨域请求
 classifier = None
 bird_info_dict = None
 db_manager = None
+species_catalog = None
 ebird_filter = None
 
 # 全局配置（从 GUI 配置文件读取）
@@ -43,6 +60,51 @@ default_country_code = None
 default_region_code = None
 use_ebird_filter = True
 
+# 识别请求准入控制：同时执行的识别数（每个进程），超出的请求排队，队列满时返回429
+admission_controller = AdmissionController(
+    max_concurrent=int(os.environ.get('MAX_CONCURRENT_RECOGNITIONS', max(1, (os.cpu_count() or 4) // 4)))
+)
+
+
+def get_json_object():
+    """JSON 请求体；不是合法 JSON 或不是对象（数组、字符串等）时返回None"""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else None
+
+
+def get_request_lane(default='interactive'):
+    """请求通道：X-Priority 请求头或 priority 参数指定（interactive / bulk），未指定时使用 default"""
+    lane = (request.headers.get('X-Priority') or request.args.get('priority') or request.form.get('priority') or
+            (get_json_object() or {}).get('priority') or default)
+    return lane if lane in LANES else default
+
+
+def admission_rejected_response(error):
+    """准入被拒绝时的 429 响应（Retry-After 为建议的重试秒数）"""
+    response = jsonify({
+        'success': False,
+        'error': f'服务器繁忙（{error.reason}），请稍后重试',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def parse_option(value, default):
+    """解析请求参数：表单/查询参数是字符串，JSON 中是原生类型"""
+    if value is None:
+        return default
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no', 'off', '')
+    if isinstance(default, bool) and isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(default, int) and not isinstance(default, bool):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
 def load_gui_settings():
     """
     读取 GUI 配置文件，获取用户最后设置的国家/地区
@@ -69,23 +131,34 @@ def load_gui_settings():
 
 def ensure_models_loaded():
     """确保模型已加载"""
-    global classifier, bird_info_dict, db_manager, ebird_filter
+    global classifier, bird_info_dict, db_manager, species_catalog, ebird_filter
 
     if classifier is None:
         print("⏳ 正在加载分类器模型...")
+        start = time.perf_counter()
         classifier = lazy_load_classifier()
+        pipeline_metrics.set_model_load_time('classifier', time.perf_counter() - start)
         print("✓ 分类器模型加载完成")
 
     if bird_info_dict is None:
         print("⏳ 正在加载鸟种信息...")
+        start = time.perf_counter()
         bird_info_dict = lazy_load_bird_info()
+        pipeline_metrics.set_model_load_time('bird_info', time.perf_counter() - start)
         print("✓ 鸟种信息加载完成")
 
     if db_manager is None and DATABASE_AVAILABLE:
         print("⏳ 正在加载数据库...")
+        start = time.perf_counter()
         db_manager = lazy_load_database()
+        pipeline_metrics.set_model_load_time('database', time.perf_counter() - start)
         print("✓ 数据库加载完成")
 
+    if species_catalog is None:
+        start = time.perf_counter()
+        species_catalog = lazy_load_species_catalog()
+        pipeline_metrics.set_model_load_time('species_catalog', time.perf_counter() - start)
+
     if ebird_filter is None and EBIRD_FILTER_AVAILABLE:
         try:
             from ebird_country_filter import eBirdCountryFilter
@@ -95,10 +168,10 @@ def ensure_models_loaded():
         except Exception as e:
             print(f"⚠️ eBird过滤器加载失败: {e}")
 
-def predict_bird(image, top_k=3):
+def preprocess_image(image):
     """
-    使用分类器预测鸟类
-    返回: [(class_idx, confidence), ...]
+    分类器输入预处理
+    返回: 张量 (3, 224, 224)
     """
     # 确保图像是PIL Image
     if not isinstance(image, Image.Image):
@@ -118,15 +191,51 @@ def predict_bird(image, top_k=3):
     std = np.array([0.225, 0.224, 0.229])
 
     normalized_array = (bgr_array / 255.0 - mean) / std
-    input_tensor = torch.from_numpy(normalized_array).permute(2, 0, 1).unsqueeze(0).float()
+    return torch.from_numpy(normalized_array).permute(2, 0, 1).float()
+
+# 默认温度（温度锐化: 提升置信度）和请求可设置的范围
+DEFAULT_TEMPERATURE = 0.6
+MIN_TEMPERATURE = 0.1
+MAX_TEMPERATURE = 5.0
+MAX_TOP_K = 100
+
+def predict_logits_batch(images):
+    """
+    一次前向推理计算多张图片的分类器原始输出
+    返回: logits 张量 (N, num_classes)
+    """
+    with pipeline_metrics.time(STAGE_PREPROCESS, items=len(images)):
+        input_tensor = torch.stack([preprocess_image(image) for image in images])
 
     # 推理
-    with torch.no_grad():
-        output = classifier(input_tensor)
+    with pipeline_metrics.time(STAGE_FORWARD, items=len(images)), torch.no_grad():
+        return classifier(input_tensor)
+
+def logits_to_probabilities(logits, temperature=DEFAULT_TEMPERATURE):
+    """温度 softmax（logits 为 (num_classes,) 或 (N, num_classes)，可以是缓存的 numpy 数组）"""
+    logits = torch.as_tensor(logits)
+    return torch.nn.functional.softmax(logits / temperature, dim=-1)
+
+def predict_probabilities_batch(images, temperature=DEFAULT_TEMPERATURE):
+    """
+    一次前向推理计算多张图片所有类别的概率
+    返回: 概率张量 (N, num_classes)
+    """
+    return logits_to_probabilities(predict_logits_batch(images), temperature)
+
+def predict_probabilities(image):
+    """
+    使用分类器计算所有类别的概率
+    返回: 概率张量 (num_classes,)
+    """
+    return predict_probabilities_batch([image])[0]
 
-    # 温度锐化: 提升置信度 (T=0.6)
-    TEMPERATURE = 0.6
-    probabilities = torch.nn.functional.softmax(output[0] / TEMPERATURE, dim=0)
+def predict_bird(image, top_k=3):
+    """
+    使用分类器预测鸟类
+    返回: [(class_idx, confidence), ...]
+    """
+    probabilities = predict_probabilities(image)
 
     # 获取top-k结果
     top_probs, top_indices = torch.topk(probabilities, min(top_k, len(probabilities)))
@@ -140,16 +249,458 @@ def predict_bird(image, top_k=3):
 
     return results
 
+# ===== 识别流程的各个步骤（单张 /recognize 与批量 /recognize/batch 共用） =====
+yolo_detector = None
+yolo_lock = threading.Lock()  # Ultralytics 模型不保证多线程同时推理安全
+request_ebird_filter = None
+
+def get_yolo_detector():
+    """懒加载共享的YOLO检测器（只加载一次模型），不可用时返回None"""
+    global yolo_detector
+    if yolo_detector is None and YOLO_AVAILABLE:
+        with yolo_lock:
+            if yolo_detector is None:
+                start = time.perf_counter()
+                detector = YOLOBirdDetector()
+                pipeline_metrics.set_model_load_time('yolo', time.perf_counter() - start)
+                yolo_detector = detector if detector.model is not None else False
+    return yolo_detector or None
+
+def detect_birds(images, use_yolo=True, detection_keys=None):
+    """
+    YOLO裁剪（只处理长边大于640的图片，多张图片一次批量推理）
+    detection_keys: 与 images 对应的检测框缓存键（StageKeys.detection），有缓存的图片只裁剪不检测
+    返回: [(处理后的图片, YOLO信息或None, final)]，与输入顺序一致；
+    final 为 False 表示YOLO模型未加载或检测出错（使用了原图），这样得到的 logits 不应缓存
+    """
+    outputs = [(image, None, True) for image in images]
+    if not use_yolo or not YOLO_AVAILABLE:
+        return outputs
+    large = [i for i, image in enumerate(images) if max(image.size) > 640]
+    stage_cache = lazy_load_stage_cache() if detection_keys else None
+
+    detections = {}
+    if stage_cache:
+        for i in large:
+            detection = stage_cache.get_detection(detection_keys[i]) if detection_keys[i] else None
+            if detection is not None:
+                detections[i] = detection
+
+    missing = [i for i in large if i not in detections]
+    detector = get_yolo_detector() if missing else None
+    if detector:
+        with yolo_lock, pipeline_metrics.time(STAGE_YOLO, items=len(missing)):
+            found = detector.detect_birds([images[i] for i in missing])
+        for i, detection in zip(missing, found):
+            detections[i] = detection
+            if stage_cache and detection_keys[i] and not detection.get('failed'):
+                stage_cache.put_detection(detection_keys[i], detection)
+    else:
+        for i in missing:
+            outputs[i] = (images[i], None, False)
+
+    for i, detection in detections.items():
+        cropped, msg = YOLOBirdDetector.crop_detection(images[i], detection)
+        if cropped:
+            outputs[i] = (cropped, msg, True)
+        elif detection.get('failed'):
+            outputs[i] = (images[i], None, False)
+    return outputs
+
+def extract_gps_info(image_path):
+    """
+    从EXIF读取GPS并推断地区
+    返回: (纬度, 经度, gps_info字典)，无GPS时为 (None, None, None)
+    """
+    with pipeline_metrics.time(STAGE_METADATA):
+        lat, lon, location_info = extract_gps_from_exif(image_path)
+        if not (lat and lon):
+            return None, None, None
+        region, country_code, region_info = get_region_from_gps(lat, lon)
+    return lat, lon, {
+        'latitude': lat,
+        'longitude': lon,
+        'region': region,
+        'country_code': country_code,
+        'info': location_info
+    }
+
+def get_request_ebird_filter():
+    """识别请求使用的 eBird 过滤器（缓存在用户数据目录，创建一次后复用）"""
+    global request_ebird_filter
+    if request_ebird_filter is None:
+        from ebird_country_filter import eBirdCountryFilter
+        EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY', '60nan25sogpo')
+        cache_dir = os.path.join(get_user_data_dir(), 'ebird_cache')
+        offline_dir = os.path.join(script_dir, "offline_ebird_data")
+        request_ebird_filter = eBirdCountryFilter(EBIRD_API_KEY, cache_dir=cache_dir, offline_dir=offline_dir)
+    return request_ebird_filter
+
+def resolve_geo_filter(lat, lon, gps_info):
+    """
+    确定地理筛选的物种范围
+    返回: (eBird物种集合或None, 离线分布类别掩码或None, 筛选来源说明)
+    """
+    ebird_species_set = None
+    filter_source = "全球模式"
+
+    if use_ebird_filter and EBIRD_FILTER_AVAILABLE:
+        try:
+            ebird_filter = get_request_ebird_filter()
+
+            # 优先级 1：GPS 精确位置（25km 范围）
+            if lat and lon:
+                print(f"🎯 使用 GPS 精确位置筛选: ({lat:.3f}, {lon:.3f})")
+                ebird_species_set = ebird_filter.get_location_species_list(lat, lon, 25)
+                if ebird_species_set:
+                    filter_source = f"GPS 25km ({len(ebird_species_set)} 种)"
+                    print(f"✓ GPS 筛选成功: {len(ebird_species_set)} 个物种")
+                else:
+                    print("⚠️ GPS 筛选失败，尝试国家级别...")
+
+            # 优先级 2：配置文件中的国家/地区
+            if not ebird_species_set and default_country_code:
+                print(f"🌍 使用配置文件国家筛选: {default_country_code}")
+                region_code = default_region_code if default_region_code else default_country_code
+                ebird_species_set = ebird_filter.get_country_species_list(region_code)
+                if ebird_species_set:
+                    filter_source = f"配置国家 {region_code} ({len(ebird_species_set)} 种)"
+                    print(f"✓ 国家筛选成功: {len(ebird_species_set)} 个物种")
+                else:
+                    print("⚠️ 国家筛选失败")
+
+            # 优先级 3：GPS 推断的国家
+            if not ebird_species_set and gps_info and gps_info.get('country_code'):
+                gps_country = gps_info['country_code']
+                print(f"🌍 使用 GPS 推断国家筛选: {gps_country}")
+                ebird_species_set = ebird_filter.get_country_species_list(gps_country)
+                if ebird_species_set:
+                    filter_source = f"GPS 国家 {gps_country} ({len(ebird_species_set)} 种)"
+                    print(f"✓ GPS 国家筛选成功: {len(ebird_species_set)} 个物种")
+
+            if not ebird_species_set:
+                print("ℹ️ 所有筛选方法都失败，使用全球模式")
+                filter_source = "全球模式（无筛选）"
+
+        except Exception as e:
+            print(f"❌ eBird 筛选初始化失败: {e}")
+            import traceback
+            traceback.print_exc()
+            filter_source = "全球模式（筛选失败）"
+
+    # 离线分布筛选：eBird 数据不可用时，用 birdinfo 中的国家分布位直接得到类别掩码（无需网络和数据库）
+    occurrence_mask = None
+    if use_ebird_filter and not ebird_species_set:
+        occurrence_country = (default_country_code or (gps_info or {}).get('country_code') or '').split('-')[0]
+        occurrence = get_occurrence_filter(bird_info_dict) if occurrence_country else None
+        if occurrence and occurrence_country in occurrence:
+            occurrence_mask = torch.from_numpy(occurrence.class_mask(occurrence_country))
+            filter_source = f"离线分布 {occurrence_country} ({int(occurrence_mask.sum())} 种)"
+            print(f"✓ 离线分布筛选: {filter_source}")
+
+    return ebird_species_set, occurrence_mask, filter_source
+
+def build_recognition_response(probabilities, top_k, ebird_species_set, occurrence_mask, filter_source):
+    """
+    对一张图片的分类概率应用地理筛选，生成识别结果（不含 yolo_info / gps_info）
+    """
+    mask_index = get_region_mask_index(db_manager, len(probabilities)) if ebird_species_set else None
+    region_flags = None
+    geo_filtered = bool(ebird_species_set) or occurrence_mask is not None
+
+    if mask_index or occurrence_mask is not None:
+        # 区域掩码 top-k：直接取区域内的前 top_k 个物种（不受全局前100名限制），
+        # 另取全局前100名中区域外的前3个，用于"全部被过滤"时的提示
+        mask = mask_index.mask_for(ebird_species_set) if mask_index else occurrence_mask
+        top_probs, top_indices, inside = RegionMaskIndex.select_candidates(probabilities, mask, top_k, 3)
+        predictions = [(idx, prob * 100) for idx, prob in zip(top_indices.tolist(), top_probs.tolist())]
+        region_flags = dict(zip(top_indices.tolist(), inside.tolist()))
+    else:
+        # 获取更多候选结果用于逐个筛选
+        predict_top_k = 100 if ebird_species_set else top_k
+        top_probs, top_indices = torch.topk(probabilities, min(predict_top_k, len(probabilities)))
+        predictions = [(idx, prob * 100) for idx, prob in zip(top_indices.tolist(), top_probs.tolist())]
+
+    # 处理结果并应用 eBird 筛选
+    results = []
+    filtered_out = []  # 被筛选掉的结果
+
+    for class_idx, confidence in predictions:
+        # 跳过置信度过低的结果
+        if confidence < 5.0:
+            continue
+
+        # bird_info_dict 是数组，检查索引范围
+        if 0 <= class_idx < len(bird_info_dict):
+            bird_data = bird_info_dict[class_idx]
+
+            # bird_data 是列表: [cn_name, en_name, scientific_name, ...]
+            cn_name = bird_data[0] if len(bird_data) > 0 else "未知"
+            en_name = bird_data[1] if len(bird_data) > 1 else "Unknown"
+            scientific_name = bird_data[2] if len(bird_data) > 2 else ""
+
+            # eBird 筛选检查
+            ebird_match = False
+            should_filter_out = False
+
+            if region_flags is not None or (ebird_species_set and db_manager):
+                if region_flags is not None:
+                    in_region = region_flags.get(class_idx, False)
+                else:
+                    # 获取 eBird 代码（优先使用内存物种目录）
+                    if species_catalog and species_catalog.db_manager is not None:
+                        ebird_code = species_catalog.ebird_code(class_idx)
+                    else:
+                        ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
+                    in_region = bool(ebird_code and ebird_code in ebird_species_set)
+
+                if in_region:
+                    ebird_match = True
+                else:
+                    # 不在列表中，过滤掉
+                    should_filter_out = True
+                    filtered_out.append({
+                        'cn_name': cn_name,
+                        'en_name': en_name,
+                        'confidence': confidence
+                    })
+
+            # 如果不需要过滤，或者没有启用筛选，则添加到结果
+            if not should_filter_out:
+                # 从数据库获取详细描述
+                description = None
+                if DATABASE_AVAILABLE and db_manager:
+                    if species_catalog:
+                        # 描述按需读取并缓存在物种目录中
+                        description = species_catalog.get_descriptions(class_idx)[0]
+                    else:
+                        bird_detail = db_manager.get_bird_by_class_id(class_idx)
+                        if bird_detail:
+                            description = bird_detail.get('short_description_zh')
+
+                result_item = {
+                    'rank': len(results) + 1,
+                    'cn_name': cn_name,
+                    'en_name': en_name,
+                    'scientific_name': scientific_name,
+                    'confidence': float(confidence),
+                    'ebird_match': ebird_match
+                }
+
+                # 只在有描述时添加
+                if description:
+                    result_item['description'] = description
+
+                results.append(result_item)
+
+                # 只保留 top_k 个结果
+                if len(results) >= top_k:
+                    break
+
+    # 如果筛选后没有结果，记录被筛选的前几个
+    if geo_filtered and len(results) == 0 and len(filtered_out) > 0:
+        print(f"⚠️ eBird筛选导致所有结果被过滤")
+        print(f"   被过滤的前3个: {filtered_out[:3]}")
+        # 可以选择返回警告信息
+        # 这里我们仍返回空结果，但在响应中添加提示
+
+    # 返回结果
+    response = {
+        'success': True,
+        'results': results,
+        'filter_source': filter_source  # 添加筛选数据来源信息
+    }
+
+    # 如果所有结果都被过滤，添加警告
+    if geo_filtered and len(results) == 0 and len(filtered_out) > 0:
+        response['warning'] = f"地理筛选：未找到匹配结果。AI识别的前3个物种不在{filter_source}列表中"
+        response['filtered_top3'] = filtered_out[:3]
+
+    return response
+
+# ===== 识别结果缓存（按文件内容 + 参数 + 模型版本，持久化在用户数据目录的 result_cache.sqlite） =====
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE', '1') != '0'
+result_cache = None
+result_cache_lock = threading.Lock()
+model_version = None
+
+def get_result_cache():
+    """懒加载识别结果缓存，禁用或初始化失败时返回None"""
+    global result_cache
+    if result_cache is None and RESULT_CACHE_ENABLED:
+        with result_cache_lock:
+            if result_cache is None:
+                try:
+                    result_cache = ResultCache(os.path.join(get_user_data_dir(), 'result_cache.sqlite'))
+                    print("✓ 识别结果缓存已启用")
+                except Exception as e:
+                    print(f"⚠️ 识别结果缓存初始化失败: {e}")
+                    result_cache = False
+    return result_cache or None
+
+def get_model_version():
+    """模型版本标识（API版本 + 分类和检测模型文件的大小与修改时间），模型更新后旧缓存自动失效"""
+    global model_version
+    if model_version is None:
+        parts = [__version__]
+        for path in (get_classifier_model_file(), YOLO_MODEL_PATH):
+            fingerprint = file_fingerprint(path)
+            if fingerprint:
+                parts.append(fingerprint)
+        model_version = '|'.join(parts)
+    return model_version
+
+def parse_recognition_options(data):
+    """
+    解析并检查识别参数（/recognize、/recognize/batch、/jobs 共用）
+    返回: (use_yolo, use_gps, top_k, temperature)，参数无效时抛出 ValueError（错误信息直接返回给客户端）
+    """
+    try:
+        use_yolo = parse_option(data.get('use_yolo'), True)
+        use_gps = parse_option(data.get('use_gps'), True)
+        top_k = parse_option(data.get('top_k'), 3)
+        temperature = parse_option(data.get('temperature'), DEFAULT_TEMPERATURE)
+    except (TypeError, ValueError):
+        raise ValueError('top_k必须是整数，temperature必须是数字')
+    if not isinstance(use_yolo, bool) or not isinstance(use_gps, bool):
+        raise ValueError('use_yolo和use_gps必须是布尔值')
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f'top_k必须在1到{MAX_TOP_K}之间')
+    if not MIN_TEMPERATURE <= temperature <= MAX_TEMPERATURE:
+        raise ValueError(f'temperature必须在{MIN_TEMPERATURE}到{MAX_TEMPERATURE}之间')
+    return use_yolo, use_gps, top_k, temperature
+
+def recognition_params(use_yolo, use_gps, top_k, temperature=DEFAULT_TEMPERATURE):
+    """影响识别结果的参数（包括GUI配置中的默认地区和eBird筛选开关）"""
+    return {
+        'use_yolo': bool(use_yolo),
+        'use_gps': bool(use_gps),
+        'top_k': int(top_k),
+        'temperature': float(temperature),
+        'country_code': default_country_code,
+        'region_code': default_region_code,
+        'use_ebird': bool(use_ebird_filter)
+    }
+
+def get_content_hash(image_path, remember=True):
+    """
+    图片内容哈希，结果缓存键和中间结果缓存键共用（每个请求只读取一遍文件）；两个缓存都不可用时返回None
+    remember=False 用于上传的临时文件
+    """
+    cache = get_result_cache() or lazy_load_stage_cache()
+    if not cache:
+        return None
+    return cache.content_hash(image_path, remember=remember)
+
+def recognition_cache_key(content_hash, params):
+    """结果缓存键（同时用作 ETag），缓存不可用时返回None"""
+    if not content_hash or not get_result_cache():
+        return None
+    return make_cache_key(content_hash, params, get_model_version())
+
+def store_cached_result(cache_key, result):
+    if cache_key and result.get('success'):
+        cache = get_result_cache()
+        if cache:
+            cache.put(cache_key, result)
+
+# ===== 请求耗时追踪（Chrome trace 文件写入用户数据目录的 traces 子目录，可用 TRACE_DIR 指定） =====
+TRACE_DIR = os.environ.get('TRACE_DIR') or os.path.join(get_user_data_dir(), 'traces')
+
+def save_trace(trace):
+    """写入 Chrome trace 文件，返回路径（失败时返回None）"""
+    try:
+        path = trace.save(TRACE_DIR)
+        print(f"📈 追踪已保存: {path}")
+        return path
+    except OSError as e:
+        print(f"⚠️ 保存追踪失败: {e}")
+        return None
+
+def attach_trace(result, trace, timings, save):
+    """
+    按请求选项附加 timings 和追踪文件路径
+    返回新字典：缓存的结果可能被并发的相同请求共享，不能直接修改
+    """
+    if trace is None:
+        return result
+    trace.finish()
+    result = dict(result)
+    if timings:
+        result['timings'] = trace.get_timings()
+    if save:
+        result['trace_file'] = save_trace(trace)
+    return result
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    return jsonify({
+    response = {
         'status': 'ok',
         'service': 'SuperBirdID API',
         'version': '3.1.0',
         'yolo_available': YOLO_AVAILABLE,
         'ebird_available': EBIRD_FILTER_AVAILABLE
-    })
+    }
+
+    if EBIRD_FILTER_AVAILABLE:
+        from ebird_country_filter import species_memory_cache, background_refresher, ebird_flight
+        from http_client import get_http_client
+        response['species_cache'] = species_memory_cache.get_stats()
+        response['cache_refresh'] = background_refresher.get_stats()
+        response['request_coalescing'] = ebird_flight.get_stats()
+        response['http'] = get_http_client().get_metrics()
+
+    mask_index = get_region_mask_index(db_manager)
+    if mask_index:
+        response['region_masks'] = mask_index.get_stats()
+
+    response['admission'] = admission_controller.get_stats()
+    if result_cache:
+        response['result_cache'] = result_cache.get_stats()
+    stage_cache = lazy_load_stage_cache()
+    if stage_cache:
+        response['stage_cache'] = stage_cache.get_stats()
+    if job_manager:
+        response['jobs'] = job_manager.get_stats()
+    response['stages'] = pipeline_metrics.get_stats()
+
+    return jsonify(response)
+
+def collect_api_metrics():
+    """/metrics 输出时读取的即时值：识别排队深度、结果缓存和中间结果缓存的命中数"""
+    prefix = pipeline_metrics.prefix
+    admission = admission_controller.get_stats()
+    lanes = admission['lanes']
+    yield (f'{prefix}_recognitions_in_flight', 'gauge', '正在执行的识别数', [({}, admission['in_flight'])])
+    yield (f'{prefix}_recognition_queue_depth', 'gauge', '等待执行槽的识别请求数',
+           [({'lane': lane}, stats['queued']) for lane, stats in lanes.items()])
+    yield (f'{prefix}_recognitions_admitted_total', 'counter', '获得执行槽的识别请求数',
+           [({'lane': lane}, stats['admitted']) for lane, stats in lanes.items()])
+    yield (f'{prefix}_recognitions_rejected_total', 'counter', '因队列已满或等待超时被拒绝（429）的识别请求数',
+           [({'lane': lane, 'reason': reason}, stats[f'rejected_{reason}'])
+            for lane, stats in lanes.items() for reason in ('full', 'timeout')])
+
+    lookups = []
+    if result_cache:
+        lookups += [({'cache': 'result', 'result': 'hit'}, result_cache.hits),
+                    ({'cache': 'result', 'result': 'miss'}, result_cache.misses)]
+    stage_cache = lazy_load_stage_cache()
+    if stage_cache:
+        for stage, hits in stage_cache.hits.items():
+            lookups += [({'cache': stage, 'result': 'hit'}, hits),
+                        ({'cache': stage, 'result': 'miss'}, stage_cache.misses[stage])]
+    yield (f'{prefix}_cache_lookups_total', 'counter', '', lookups)
+
+pipeline_metrics.register_collector(collect_api_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def export_metrics():
+    """
+    Prometheus 指标（文本格式）：识别流程各阶段的耗时直方图和处理数，
+    GPS/eBird/识别结果/检测框/logits 缓存的命中数，识别排队深度，模型加载时间
+    """
+    return Response(pipeline_metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/recognize', methods=['POST'])
 def recognize_bird():
@@ -162,9 +713,23 @@ def recognize_bird():
         "image_base64": "base64_encoded_image",  // Base64编码的图片（二选一）
         "use_yolo": true,  // 是否使用YOLO裁剪（可选，默认true）
         "use_gps": true,  // 是否使用GPS过滤（可选，默认true）
-        "top_k": 3  // 返回前K个结果（可选，默认3）
+        "top_k": 3,  // 返回前K个结果（可选，默认3）
+        "temperature": 0.6,  // softmax 温度（可选，默认0.6）
+        "priority": "interactive",  // interactive 或 bulk（可选，也可用 X-Priority 请求头）
+        "timings": false,  // 返回各阶段耗时 timings（可选，默认false）
+        "trace": false  // 将本次请求的 Chrome trace 写入 traces 目录，返回 trace_file（可选，默认false）
     }
 
+    也可以直接上传图片文件（保留原始EXIF，GPS筛选可用；RAW文件无需base64编码）:
+    - multipart/form-data: 文件字段 image，其余参数作为表单字段
+    - 原始请求体: Content-Type 为 image/* 或 application/octet-stream，
+      参数放在查询字符串中，原文件名通过 filename 参数或 X-Filename 请求头传递（用于识别RAW格式）
+
+    服务器繁忙时返回 429，Retry-After 响应头为建议的重试秒数
+
+    相同文件（按内容）和参数的结果会被缓存（X-Cache 响应头为 HIT / MISS），成功的结果带 ETag；
+    请求带 If-None-Match 且文件和参数都未变化时返回 304，不解码图片
+
     返回 (JSON):
     {
         "success": true,
@@ -186,233 +751,487 @@ def recognize_bird():
         }
     }
     """
+    upload_path = None
     try:
         # 确保模型已加载
         ensure_models_loaded()
 
-        # 解析请求参数
-        data = request.get_json()
+        # 解析请求参数；上传的文件按块写入临时文件（在等待执行槽之前完成，慢速上传不占用执行槽）
+        content_type = request.mimetype or ''
+        if content_type == 'multipart/form-data':
+            upload = request.files.get('image')
+            if not upload:
+                return jsonify({'success': False, 'error': '缺少image文件字段'}), 400
+            upload_path = save_upload(upload.stream, upload.filename, upload.mimetype)
+            data = request.form.to_dict()
+        elif content_type.startswith('image/') or content_type == 'application/octet-stream':
+            filename = request.args.get('filename') or request.headers.get('X-Filename')
+            upload_path = save_upload(request.stream, filename, content_type)
+            data = request.args.to_dict()
+        else:
+            data = get_json_object()
 
-        if not data:
+        if not data and not upload_path:
             return jsonify({'success': False, 'error': '无效的请求体'}), 400
 
         # 获取图片
-        image = None
         image_path = data.get('image_path')
         image_base64 = data.get('image_base64')
-        temp_file = None
 
-        if image_path:
+        if upload_path:
+            image_path = upload_path
+        elif image_path:
             # 从文件路径加载
             if not os.path.exists(image_path):
                 return jsonify({'success': False, 'error': f'文件不存在: {image_path}'}), 404
-            image = load_image(image_path)
         elif image_base64:
-            # 从Base64解码
+            # Base64 按原始字节保存（不重新编码，保留EXIF）
             try:
-                image_data = base64.b64decode(image_base64)
-                image = Image.open(BytesIO(image_data))
-
-                # 创建临时文件用于EXIF读取
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-                image.save(temp_file.name, 'JPEG')
-                image_path = temp_file.name
+                upload_path = image_path = save_base64_upload(image_base64, data.get('filename'))
+            except UploadError:
+                raise
             except Exception as e:
                 return jsonify({'success': False, 'error': f'Base64解码失败: {e}'}), 400
         else:
-            return jsonify({'success': False, 'error': '必须提供image_path或image_base64'}), 400
+            return jsonify({'success': False, 'error': '必须提供image_path、image_base64或上传图片文件'}), 400
 
         # 获取参数
-        use_yolo = data.get('use_yolo', True)
-        use_gps = data.get('use_gps', True)
-        top_k = data.get('top_k', 3)
-
-        # YOLO裁剪（如果启用且图片足够大）
-        processed_image = image
-        yolo_msg = None
-        if use_yolo and YOLO_AVAILABLE:
-            width, height = image.size
-            if max(width, height) > 640:
-                detector = YOLOBirdDetector()
-                cropped, msg = detector.detect_and_crop_bird(image)
-                if cropped:
-                    processed_image = cropped
-                    yolo_msg = msg
-
-        # GPS信息提取
-        gps_info = None
-        lat, lon = None, None
-        if use_gps and image_path:
-            lat, lon, location_info = extract_gps_from_exif(image_path)
-            if lat and lon:
-                region, country_code, region_info = get_region_from_gps(lat, lon)
-                gps_info = {
-                    'latitude': lat,
-                    'longitude': lon,
-                    'region': region,
-                    'country_code': country_code,
-                    'info': location_info
-                }
-
-        # ===== 新增：eBird 地理筛选逻辑 =====
-        ebird_species_set = None
-        filter_source = "全球模式"
-
-        if use_ebird_filter and EBIRD_FILTER_AVAILABLE:
-            try:
-                # 初始化 eBird 过滤器
-                from ebird_country_filter import eBirdCountryFilter
-                EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY', '60nan25sogpo')
-                cache_dir = os.path.join(get_user_data_dir(), 'ebird_cache')
-                offline_dir = os.path.join(script_dir, "offline_ebird_data")
-                ebird_filter = eBirdCountryFilter(EBIRD_API_KEY, cache_dir=cache_dir, offline_dir=offline_dir)
-
-                # 优先级 1：GPS 精确位置（25km 范围）
-                if lat and lon:
-                    print(f"🎯 使用 GPS 精确位置筛选: ({lat:.3f}, {lon:.3f})")
-                    ebird_species_set = ebird_filter.get_location_species_list(lat, lon, 25)
-                    if ebird_species_set:
-                        filter_source = f"GPS 25km ({len(ebird_species_set)} 种)"
-                        print(f"✓ GPS 筛选成功: {len(ebird_species_set)} 个物种")
-                    else:
-                        print("⚠️ GPS 筛选失败，尝试国家级别...")
-
-                # 优先级 2：配置文件中的国家/地区
-                if not ebird_species_set and default_country_code:
-                    print(f"🌍 使用配置文件国家筛选: {default_country_code}")
-                    region_code = default_region_code if default_region_code else default_country_code
-                    ebird_species_set = ebird_filter.get_country_species_list(region_code)
-                    if ebird_species_set:
-                        filter_source = f"配置国家 {region_code} ({len(ebird_species_set)} 种)"
-                        print(f"✓ 国家筛选成功: {len(ebird_species_set)} 个物种")
-                    else:
-                        print("⚠️ 国家筛选失败")
+        try:
+            use_yolo, use_gps, top_k, temperature = parse_recognition_options(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        lane = get_request_lane()
+        timings = parse_option(data.get('timings'), False)
+        save = parse_option(data.get('trace'), False)
+        trace = Trace('recognize', image=os.path.basename(image_path)) if timings or save else None
+
+        def recognize():
+            # 有缓存的检测框和 logits 时只重新做 softmax 和地理筛选，不解码图片、不占用执行槽
+            item = load_recognition_input(image_path, use_yolo, use_gps, decode=False, remember=not upload_path,
+                                          content_hash=content_hash)
+            return recognize_inputs([item], use_yolo, top_k, temperature, lane)[0]
+
+        with use_trace(trace):
+            # 结果缓存键同时作为 ETag：客户端已有相同结果时直接返回 304，不解码图片
+            content_hash = get_content_hash(image_path, remember=not upload_path)
+            cache_key = recognition_cache_key(content_hash, recognition_params(use_yolo, use_gps, top_k, temperature))
+            if cache_key and request.if_none_match.contains(cache_key):
+                not_modified = Response(status=304)
+                not_modified.set_etag(cache_key)
+                return not_modified
+
+            if not cache_key:
+                return jsonify(attach_trace(recognize(), trace, timings, save))
+
+            # 相同文件和参数的并发请求只识别一次
+            result, hit = get_result_cache().get_or_compute(cache_key, recognize)
+
+        response = jsonify(attach_trace(result, trace, timings, save))
+        if result.get('success'):
+            response.set_etag(cache_key)
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except UploadTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+    finally:
+        # 清理临时文件
+        remove_upload(upload_path)
 
-                # 优先级 3：GPS 推断的国家
-                if not ebird_species_set and gps_info and gps_info.get('country_code'):
-                    gps_country = gps_info['country_code']
-                    print(f"🌍 使用 GPS 推断国家筛选: {gps_country}")
-                    ebird_species_set = ebird_filter.get_country_species_list(gps_country)
-                    if ebird_species_set:
-                        filter_source = f"GPS 国家 {gps_country} ({len(ebird_species_set)} 种)"
-                        print(f"✓ GPS 国家筛选成功: {len(ebird_species_set)} 个物种")
+# 批量识别：单次请求的图片数上限、默认批大小和预读线程数
+MAX_BATCH_IMAGES = 1000
+DEFAULT_BATCH_SIZE = 8
+BATCH_LOADER_THREADS = 4
 
-                if not ebird_species_set:
-                    print("ℹ️ 所有筛选方法都失败，使用全球模式")
-                    filter_source = "全球模式（无筛选）"
+def load_recognition_input(image_path, use_yolo, use_gps, decode=True, remember=True, content_hash=None):
+    """
+    读取一张图片的识别输入并确定其地理筛选范围（批量识别在线程池中执行，与上一批的推理重叠）
+    有缓存的 logits 时不解码图片；decode=False 时推迟到获得执行槽后再解码；remember=False 用于上传的临时文件；
+    content_hash 为已计算的内容哈希（与结果缓存键共用）
+    返回: {'image_path', 'image', 'logits', 'stage_keys', 'yolo_info', 'gps_info', 'geo'}
+    """
+    if not image_path or not os.path.exists(image_path):
+        raise FileNotFoundError(f'文件不存在: {image_path}')
+
+    stage_cache = lazy_load_stage_cache()
+    stage_keys = stage_cache.keys_for(image_path, 'api', use_yolo and YOLO_AVAILABLE, remember,
+                                      content_hash=content_hash) if stage_cache else None
+    logits = stage_cache.get_logits(stage_keys.logits) if stage_keys else None
+
+    yolo_info = None
+    if logits is not None and use_yolo:
+        detection = stage_cache.get_detection(stage_keys.detection)
+        if detection and detection.get('bbox'):
+            yolo_info = YOLOBirdDetector.detection_info(detection)
+
+    lat, lon, gps_info = extract_gps_info(image_path) if use_gps else (None, None, None)
+    with pipeline_metrics.time(STAGE_EBIRD_FILTER):
+        geo = resolve_geo_filter(lat, lon, gps_info)
+
+    image = None
+    if logits is None and decode:
+        with pipeline_metrics.time(STAGE_LOAD_IMAGE):
+            image = load_image(image_path)
+    return {
+        'image_path': image_path,
+        'image': image,
+        'logits': logits,
+        'stage_keys': stage_keys,
+        'yolo_info': yolo_info,
+        'gps_info': gps_info,
+        'geo': geo
+    }
 
-            except Exception as e:
-                print(f"❌ eBird 筛选初始化失败: {e}")
-                import traceback
-                traceback.print_exc()
-                filter_source = "全球模式（筛选失败）"
+def recognize_inputs(inputs, use_yolo, top_k, temperature=DEFAULT_TEMPERATURE, lane='interactive'):
+    """
+    识别一批输入：只对没有缓存 logits 的图片做解码、YOLO检测和前向推理（在 lane 通道获取执行槽），
+    再对全部图片做温度 softmax 和地理筛选
+    返回: 与输入顺序一致的结果字典列表
 
-        # 执行识别（获取更多候选结果用于筛选）
-        predict_top_k = 100 if ebird_species_set else top_k
-        predictions = predict_bird(processed_image, top_k=predict_top_k)
+    Raises:
+        AdmissionRejected: 需要推理但服务器繁忙
+    """
+    pending = [item for item in inputs if item['logits'] is None]
+    if pending:
+        with admission_controller.admit(lane):
+            for item in pending:
+                if item['image'] is None:
+                    with pipeline_metrics.time(STAGE_LOAD_IMAGE):
+                        item['image'] = load_image(item['image_path'])
+            processed = detect_birds([item['image'] for item in pending], use_yolo,
+                                     [item['stage_keys'].detection if item['stage_keys'] else None for item in pending])
+            logits = predict_logits_batch([image for image, _, _ in processed])
+
+        stage_cache = lazy_load_stage_cache()
+        for item, (_, yolo_msg, final), item_logits in zip(pending, processed, logits):
+            item['logits'] = item_logits
+            item['yolo_info'] = yolo_msg
+            if stage_cache and item['stage_keys'] and final:
+                stage_cache.put_logits(item['stage_keys'].logits, item_logits)
 
-        # 处理结果并应用 eBird 筛选
-        results = []
-        filtered_out = []  # 被筛选掉的结果
+    results = []
+    for item in inputs:
+        with pipeline_metrics.time(STAGE_DB_LOOKUP):
+            result = build_recognition_response(logits_to_probabilities(item['logits'], temperature), top_k,
+                                                *item['geo'])
+        result.update({'yolo_info': item['yolo_info'], 'gps_info': item['gps_info']})
+        results.append(result)
+    return results
 
-        for class_idx, confidence in predictions:
-            # 跳过置信度过低的结果
-            if confidence < 5.0:
-                continue
+def prepare_batch_item(image_path, use_yolo, use_gps, params):
+    """
+    批量识别和异步任务的预读：先查结果缓存，未命中时才读取识别输入
+    返回: (缓存键, 缓存的结果, None) 或 (缓存键, None, load_recognition_input 的返回值)
+    """
+    if not image_path or not os.path.exists(image_path):
+        raise FileNotFoundError(f'文件不存在: {image_path}')
+    content_hash = get_content_hash(image_path)
+    cache_key = recognition_cache_key(content_hash, params)
+    cached = get_result_cache().lookup(cache_key) if cache_key else None
+    if cached is not None:
+        return cache_key, cached, None
+    return cache_key, None, load_recognition_input(image_path, use_yolo, use_gps, content_hash=content_hash)
+
+def ndjson_line(item):
+    return json.dumps(item, ensure_ascii=False) + '\n'
+
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """
+    批量识别，以 NDJSON 流式返回（每行一张图片的结果，按完成顺序输出）
 
-            # bird_info_dict 是数组，检查索引范围
-            if 0 <= class_idx < len(bird_info_dict):
-                bird_data = bird_info_dict[class_idx]
+    请求体 (JSON):
+    {
+        "image_paths": ["/path/a.jpg", "/path/b.nef"],
+        "use_yolo": true,  // 可选，默认true
+        "use_gps": true,  // 可选，默认true
+        "top_k": 3,  // 可选，默认3
+        "temperature": 0.6,  // 可选，默认0.6
+        "batch_size": 8,  // 每批一起做YOLO检测和分类的图片数（可选，默认8）
+        "priority": "bulk",  // 可选，默认 bulk
+        "timings": false,  // 最后一行附加整个批量请求的各阶段耗时（可选）
+        "trace": false  // 将整个批量请求的 Chrome trace 写入 traces 目录（可选）
+    }
 
-                # bird_data 是列表: [cn_name, en_name, scientific_name, ...]
-                cn_name = bird_data[0] if len(bird_data) > 0 else "未知"
-                en_name = bird_data[1] if len(bird_data) > 1 else "Unknown"
-                scientific_name = bird_data[2] if len(bird_data) > 2 else ""
+    返回 (application/x-ndjson)，每行:
+    {"index": 0, "image_path": "...", "success": true, "results": [...], "yolo_info": ..., "gps_info": ..., "filter_source": "..."}
+    出错的图片: {"index": 1, "image_path": "...", "success": false, "error": "..."}
+    最后一行: {"done": true, "total": 2, "succeeded": 1, "elapsed_ms": 1234.5}（可选的 timings、trace_file）
+    """
+    data = get_json_object()
+    if not data or not isinstance(data.get('image_paths'), list):
+        return jsonify({'success': False, 'error': '必须提供image_paths列表'}), 400
 
-                # eBird 筛选检查
-                ebird_match = False
-                should_filter_out = False
+    image_paths = data['image_paths']
+    if len(image_paths) > MAX_BATCH_IMAGES:
+        return jsonify({'success': False, 'error': f'单次最多{MAX_BATCH_IMAGES}张图片'}), 400
+    if not all(isinstance(path, str) for path in image_paths):
+        return jsonify({'success': False, 'error': 'image_paths只能包含文件路径字符串'}), 400
 
-                if ebird_species_set and db_manager:
-                    # 获取 eBird 代码
-                    ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
+    try:
+        use_yolo, use_gps, top_k, temperature = parse_recognition_options(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        batch_size = max(1, min(parse_option(data.get('batch_size'), DEFAULT_BATCH_SIZE), 64))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'batch_size必须是整数'}), 400
 
-                    if ebird_code and ebird_code in ebird_species_set:
-                        ebird_match = True
+    ensure_models_loaded()
+    lane = get_request_lane(default='bulk')
+    params = recognition_params(use_yolo, use_gps, top_k, temperature)
+    timings = parse_option(data.get('timings'), False)
+    save = parse_option(data.get('trace'), False)
+    trace = Trace('recognize_batch', images=len(image_paths), batch_size=batch_size) if timings or save else None
+
+    def generate():
+        start = time.perf_counter()
+        succeeded = 0
+        chunks = [list(range(i, min(i + batch_size, len(image_paths)))) for i in range(0, len(image_paths), batch_size)]
+
+        with ThreadPoolExecutor(max_workers=BATCH_LOADER_THREADS) as pool:
+            def submit(chunk):
+                return [(index, pool.submit(run_in_trace, trace, prepare_batch_item, image_paths[index],
+                                            use_yolo, use_gps, params))
+                        for index in chunk]
+
+            pending = submit(chunks[0]) if chunks else []
+            for chunk_no in range(len(chunks)):
+                loading = pending
+                # 预读下一批图片，与本批的检测和分类重叠
+                pending = submit(chunks[chunk_no + 1]) if chunk_no + 1 < len(chunks) else []
+
+                items = []
+                for index, future in loading:
+                    try:
+                        cache_key, cached, loaded = future.result()
+                    except Exception as e:
+                        yield ndjson_line({'index': index, 'image_path': image_paths[index],
+                                           'success': False, 'error': str(e)})
+                        continue
+                    if cached is not None:
+                        succeeded += 1
+                        yield ndjson_line(dict(cached, index=index, image_path=image_paths[index], cached=True))
                     else:
-                        # 不在列表中，过滤掉
-                        should_filter_out = True
-                        filtered_out.append({
-                            'cn_name': cn_name,
-                            'en_name': en_name,
-                            'confidence': confidence
-                        })
-
-                # 如果不需要过滤，或者没有启用筛选，则添加到结果
-                if not should_filter_out:
-                    # 从数据库获取详细描述
-                    description = None
-                    if DATABASE_AVAILABLE and db_manager:
-                        bird_detail = db_manager.get_bird_by_class_id(class_idx)
-                        if bird_detail:
-                            description = bird_detail.get('short_description_zh')
-
-                    result_item = {
-                        'rank': len(results) + 1,
-                        'cn_name': cn_name,
-                        'en_name': en_name,
-                        'scientific_name': scientific_name,
-                        'confidence': float(confidence),
-                        'ebird_match': ebird_match
-                    }
-
-                    # 只在有描述时添加
-                    if description:
-                        result_item['description'] = description
-
-                    results.append(result_item)
+                        items.append((index, cache_key, loaded))
+                if not items:
+                    continue
+
+                # 本批推理完成后再输出，避免客户端读取慢时占用执行槽
+                lines = []
+                try:
+                    with use_trace(trace):
+                        results = recognize_inputs([loaded for _, _, loaded in items], use_yolo, top_k,
+                                                   temperature, lane)
+                    for (index, cache_key, _), result in zip(items, results):
+                        store_cached_result(cache_key, result)
+                        result.update({'index': index, 'image_path': image_paths[index]})
+                        lines.append(ndjson_line(result))
+                    succeeded += len(lines)
+                except AdmissionRejected as e:
+                    lines = [ndjson_line({'index': index, 'image_path': image_paths[index], 'success': False,
+                                          'error': f'服务器繁忙（{e.reason}），请稍后重试',
+                                          'retry_after': e.retry_after})
+                             for index, _, _ in items]
+                except Exception as e:
+                    lines = [ndjson_line({'index': index, 'image_path': image_paths[index],
+                                          'success': False, 'error': str(e)})
+                             for index, _, _ in items]
+                for line in lines:
+                    yield line
+
+        yield ndjson_line(attach_trace({'done': True, 'total': len(image_paths), 'succeeded': succeeded,
+                                        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)},
+                                       trace, timings, save))
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# ===== 异步识别任务（文件夹级别，进度持久化在用户数据目录的 jobs.sqlite） =====
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+MAX_JOB_RESULTS_PAGE = 1000
+job_manager = None
+job_manager_lock = threading.Lock()
+
+def process_job_batch(image_paths, options):
+    """
+    任务工作线程处理一批图片：并行读取，再以 bulk 通道批量识别
+    返回: 与 image_paths 顺序一致的结果字典列表
+    """
+    ensure_models_loaded()
+    use_yolo = options.get('use_yolo', True)
+    use_gps = options.get('use_gps', True)
+    top_k = options.get('top_k', 3)
+    temperature = options.get('temperature', DEFAULT_TEMPERATURE)
+    params = recognition_params(use_yolo, use_gps, top_k, temperature)
+    trace = Trace('job_batch', images=len(image_paths)) if options.get('trace') else None
+
+    results = [None] * len(image_paths)
+    loaded = []
+    with ThreadPoolExecutor(max_workers=BATCH_LOADER_THREADS) as pool:
+        futures = [pool.submit(run_in_trace, trace, prepare_batch_item, path, use_yolo, use_gps, params)
+                   for path in image_paths]
+        for index, future in enumerate(futures):
+            try:
+                cache_key, cached, item = future.result()
+            except Exception as e:
+                results[index] = {'success': False, 'error': str(e)}
+                continue
+            if cached is not None:
+                results[index] = dict(cached, cached=True)
+            else:
+                loaded.append((index, cache_key, item))
+
+    if loaded:
+        # 服务器繁忙（AdmissionRejected）时整批放回，稍后重试
+        with use_trace(trace):
+            recognized = recognize_inputs([item for _, _, item in loaded], use_yolo, top_k, temperature, 'bulk')
+        for (index, cache_key, _), result in zip(loaded, recognized):
+            store_cached_result(cache_key, result)
+            results[index] = result
+    if trace:
+        trace.finish()
+        save_trace(trace)
+    return results
 
-                    # 只保留 top_k 个结果
-                    if len(results) >= top_k:
-                        break
+def get_job_manager():
+    """懒加载任务管理器并启动工作线程（会继续处理上次未完成的任务），失败时返回None"""
+    global job_manager
+    with job_manager_lock:
+        if job_manager is None:
+            try:
+                store = JobStore(os.path.join(get_user_data_dir(), 'jobs.sqlite'))
+                job_manager = JobManager(store, process_job_batch, workers=JOB_WORKERS,
+                                         batch_size=DEFAULT_BATCH_SIZE, transient_errors=(AdmissionRejected,))
+                job_manager.start()
+                print(f"✓ 识别任务工作线程已启动（{JOB_WORKERS} 个）")
+            except Exception as e:
+                print(f"⚠️ 任务库初始化失败: {e}")
+                job_manager = False
+    return job_manager or None
 
-        # 如果筛选后没有结果，记录被筛选的前几个
-        if ebird_species_set and len(results) == 0 and len(filtered_out) > 0:
-            print(f"⚠️ eBird筛选导致所有结果被过滤")
-            print(f"   被过滤的前3个: {filtered_out[:3]}")
-            # 可以选择返回警告信息
-            # 这里我们仍返回空结果，但在响应中添加提示
+def job_manager_unavailable():
+    return jsonify({'success': False, 'error': '任务功能不可用'}), 503
 
-        # 清理临时文件
-        if temp_file:
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    提交异步识别任务，立即返回任务ID
 
-        # 返回结果
-        response = {
-            'success': True,
-            'results': results,
-            'yolo_info': yolo_msg,
-            'gps_info': gps_info,
-            'filter_source': filter_source  # 添加筛选数据来源信息
-        }
+    请求体 (JSON):
+    {
+        "directory": "/path/to/photos",  // 目录（与 image_paths 二选一）
+        "recursive": true,  // 是否包含子目录（可选，默认true）
+        "image_paths": ["/path/a.jpg"],  // 文件列表
+        "use_yolo": true,  // 可选，默认true
+        "use_gps": true,  // 可选，默认true
+        "top_k": 3,  // 可选，默认3
+        "temperature": 0.6,  // 可选，默认0.6
+        "trace": false  // 每批识别写入一个 Chrome trace 文件（可选，默认false）
+    }
 
-        # 如果所有结果都被过滤，添加警告
-        if ebird_species_set and len(results) == 0 and len(filtered_out) > 0:
-            response['warning'] = f"地理筛选：未找到匹配结果。AI识别的前3个物种不在{filter_source}列表中"
-            response['filtered_top3'] = filtered_out[:3]
+    返回 (202):
+    {"success": true, "job_id": "...", "total": 12345}
+    """
+    manager = get_job_manager()
+    if not manager:
+        return job_manager_unavailable()
+
+    data = get_json_object() or {}
+    directory = data.get('directory')
+    if directory:
+        if not os.path.isdir(directory):
+            return jsonify({'success': False, 'error': f'目录不存在: {directory}'}), 400
+        image_paths = list_image_files(directory, recursive=parse_option(data.get('recursive'), True))
+        source = directory
+    elif isinstance(data.get('image_paths'), list):
+        image_paths = data['image_paths']
+        if not all(isinstance(path, str) for path in image_paths):
+            return jsonify({'success': False, 'error': 'image_paths只能包含文件路径字符串'}), 400
+        source = None
+    else:
+        return jsonify({'success': False, 'error': '必须提供directory或image_paths列表'}), 400
 
-        return jsonify(response)
+    if not image_paths:
+        return jsonify({'success': False, 'error': '没有找到图片文件'}), 400
 
-    except Exception as e:
-        import traceback
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+    try:
+        use_yolo, use_gps, top_k, temperature = parse_recognition_options(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    options = {'use_yolo': use_yolo, 'use_gps': use_gps, 'top_k': top_k, 'temperature': temperature,
+               'trace': parse_option(data.get('trace'), False)}
+
+    job_id = manager.submit(image_paths, options, source)
+    return jsonify({'success': True, 'job_id': job_id, 'total': len(image_paths)}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """最近的任务列表"""
+    manager = get_job_manager()
+    if not manager:
+        return job_manager_unavailable()
+    return jsonify({'success': True, 'jobs': manager.store.list_jobs()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    任务进度
+    返回: 状态、total/done/failed/remaining、progress（%）、images_per_minute、eta_seconds
+    """
+    manager = get_job_manager()
+    if not manager:
+        return job_manager_unavailable()
+    job = manager.store.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+    return jsonify(dict(job, success=True))
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """
+    分页读取任务结果: ?offset=0&limit=100&status=done|failed|pending
+    下一页的 offset 为本页最后一项的 index + 1
+    """
+    manager = get_job_manager()
+    if not manager:
+        return job_manager_unavailable()
+    if not manager.store.get_job(job_id):
+        return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_JOB_RESULTS_PAGE))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'offset和limit必须是整数'}), 400
+    items = manager.store.get_items(job_id, offset, limit, request.args.get('status'))
+    return jsonify({'success': True, 'job_id': job_id, 'items': items})
+
+@app.route('/jobs/<job_id>/<action>', methods=['POST'])
+def control_job(job_id, action):
+    """暂停 / 继续 / 取消任务: POST /jobs/<id>/pause | resume | cancel"""
+    manager = get_job_manager()
+    if not manager:
+        return job_manager_unavailable()
+    handlers = {'pause': manager.pause, 'resume': manager.resume, 'cancel': manager.cancel}
+    if action not in handlers:
+        return jsonify({'success': False, 'error': f'未知操作: {action}'}), 404
+
+    job = manager.store.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': f'任务不存在: {job_id}'}), 404
+    if not handlers[action](job_id):
+        return jsonify({'success': False, 'error': f'任务当前状态为 {job["status"]}，无法{action}'}), 409
+    return jsonify(dict(manager.store.get_job(job_id), success=True))
 
 @app.route('/bird/info', methods=['GET'])
 def get_bird_info():
@@ -457,6 +1276,55 @@ def get_bird_info():
             'error': str(e)
         }), 500
 
+@app.route('/bird/search', methods=['GET'])
+def search_bird():
+    """
+    搜索鸟种（英文名、简繁中文名、学名，支持前缀和拼音）
+
+    参数:
+    - q: 搜索词，如 "白头"、"bulb"、"Pycnonotus"、"btb"
+    - limit: 返回数量（默认10，最多50）
+
+    返回:
+    {
+        "success": true,
+        "query": "白头",
+        "results": [{"id": 1, "model_class_id": 0, "english_name": "...", "chinese_simplified": "...",
+                     "scientific_name": "...", "ebird_code": "..."}],
+        "elapsed_ms": 0.3
+    }
+    """
+    try:
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': '缺少q参数'}), 400
+
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit必须是整数'}), 400
+
+        database = lazy_load_database()
+        if not database:
+            return jsonify({'success': False, 'error': '数据库不可用'}), 503
+
+        start = time.perf_counter()
+        results = database.search_birds(query, limit=limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'elapsed_ms': round(elapsed_ms, 3)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/exif/write-title', methods=['POST'])
 def write_exif_title():
     """
@@ -521,6 +1389,62 @@ def write_exif_caption():
             'error': str(e)
         }), 500
 
+def release_connections():
+    """
+    fork worker 之前关闭主进程打开的 SQLite 连接和HTTP连接池
+    （连接不能跨进程共享，worker 进程会按需重新建立）
+    """
+    if db_manager:
+        db_manager.close()
+    if ebird_filter is not None:
+        ebird_filter.cache_store.close()
+    if result_cache:
+        result_cache.close()
+    stage_cache = lazy_load_stage_cache()
+    if stage_cache:
+        stage_cache.close()
+    if EBIRD_FILTER_AVAILABLE:
+        from http_client import get_http_client
+        get_http_client().session.close()
+
+
+def prepare_fork():
+    """gunicorn fork worker 之前在主进程中调用"""
+    release_connections()
+    # 每次抓取只到达一个 worker：各 worker 把指标快照写入本次启动专用的目录，/metrics 汇总所有 worker
+    pipeline_metrics.prepare_multiprocess(tempfile.mkdtemp(prefix='superbirdid-metrics-'))
+
+
+def configure_worker(worker_count):
+    """worker 进程启动后按进程数分配 PyTorch 线程，避免多个进程争抢CPU"""
+    threads = max(1, (os.cpu_count() or 1) // max(1, worker_count))
+    torch.set_num_threads(threads)
+    # 每个进程启动自己的任务工作线程（线程不能跨 fork 继承），继续处理未完成的任务
+    get_job_manager()
+    pipeline_metrics.start_multiprocess()
+    print(f"✓ worker {os.getpid()} 就绪（PyTorch {threads} 线程）")
+
+
+def test_request_validation():
+    """测试非对象的 JSON 请求体和非字符串的 image_paths 返回 400（不需要加载模型）"""
+    client = app.test_client()
+
+    for body in ([], "x", 42, None):
+        with app.test_request_context('/recognize/batch', method='POST', json=body):
+            assert get_request_lane(default='bulk') == 'bulk'
+        response = client.post('/recognize/batch', json=body)
+        assert response.status_code == 400, (body, response.status_code)
+        print(f"  ✓ 请求体 {json.dumps(body)} → 400")
+
+    for image_paths in ([123], [None], ["/tmp/a.jpg", {"path": "/tmp/b.jpg"}]):
+        response = client.post('/recognize/batch', json={'image_paths': image_paths})
+        assert response.status_code == 400, (image_paths, response.status_code)
+        assert 'image_paths' in response.get_json()['error']
+        print(f"  ✓ image_paths {json.dumps(image_paths)} → 400")
+
+    print("✓ 请求校验测试通过")
+
+
 if __name__ == '__main__':
     import argparse
 
@@ -528,16 +1452,25 @@ if __name__ == '__main__':
     parser.add_argument('--host', default='127.0.0.1', help='监听地址（默认127.0.0.1）')
     parser.add_argument('--port', type=int, default=5156, help='监听端口（默认5156）')
     parser.add_argument('--debug', action='store_true', help='启用调试模式')
+    parser.add_argument('--self-test', action='store_true', help='运行请求校验自检后退出')
+    add_server_arguments(parser)
 
     args = parser.parse_args()
+    if args.self_test:
+        test_request_validation()
+        sys.exit(0)
 
     print("=" * 60)
     print(f"🐦 SuperBirdID API 服务器 v{__version__}")
     print("=" * 60)
     print(f"监听地址: http://{args.host}:{args.port}")
     print(f"健康检查: http://{args.host}:{args.port}/health")
+    print(f"运行指标: http://{args.host}:{args.port}/metrics")
     print(f"识别接口: POST http://{args.host}:{args.port}/recognize")
+    print(f"批量识别: POST http://{args.host}:{args.port}/recognize/batch")
+    print(f"异步任务: POST http://{args.host}:{args.port}/jobs")
     print(f"鸟种信息: GET http://{args.host}:{args.port}/bird/info?cn_name=白头鹎")
+    print(f"鸟种搜索: GET http://{args.host}:{args.port}/bird/search?q=白头")
     print("=" * 60)
     print("按 Ctrl+C 停止服务器")
     print("=" * 60)
@@ -555,10 +1488,16 @@ if __name__ == '__main__':
 
     print(f"✓ eBird筛选: {'启用' if use_ebird_filter else '禁用'}")
 
-    # 预加载模型
-    print("\n正在预加载模型...")
-    ensure_models_loaded()
-    print("✓ 模型预加载完成\n")
+    def preload_models():
+        # 预加载模型（gunicorn 模式下在主进程中加载一次，worker 进程写时复制共享）
+        print("\n正在预加载模型...")
+        ensure_models_loaded()
+        if db_manager:
+            db_manager.get_search_index()  # 预先建立搜索索引，首次搜索无需等待
+        print("✓ 模型预加载完成\n")
 
     # 启动服务器
-    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+    run_server(app, args.host, args.port, server=args.server,
+               workers=args.workers, threads=args.threads, timeout=args.timeout,
+               preload=preload_models, before_fork=prepare_fork,
+               after_fork=configure_worker, debug=args.debug)
@@ -16,6 +16,7 @@ from tkinter import ttk, filedialog, messagebox
 from tkinter import font as tkfont
 from PIL import Image, ImageTk, ImageDraw
 import threading
+import time
 import os
 import sys
 import subprocess
@@ -33,11 +34,13 @@ except ImportError:
 # 导入核心识别模块
 from SuperBirdId import (
     load_image, lazy_load_classifier, lazy_load_bird_info,
-    lazy_load_database, extract_gps_from_exif, get_region_from_gps,
-    write_bird_name_to_exif, get_bird_description_from_db,
+    lazy_load_database, lazy_load_species_catalog, lazy_load_stage_cache, extract_gps_from_exif, get_region_from_gps,
+    write_bird_name_to_exif, get_bird_description_from_db, detect_bird_cached,
     YOLOBirdDetector, YOLO_AVAILABLE, EBIRD_FILTER_AVAILABLE,
     RAW_SUPPORT, script_dir, EXIFTOOL_AVAILABLE, EXIFTOOL_PATH
 )
+from region_mask import RegionMaskIndex, get_region_mask_index
+from occurrence_filter import get_occurrence_filter
 
 # 导入exiftool（用于写入EXIF）
 try:
@@ -222,6 +225,10 @@ class SuperBirdIDGUI:
 
         # 温度参数选择
         self.temperature = tk.DoubleVar(value=saved_settings.get('temperature', 0.5))
+
+        # 上一张图片的 logits 和GPS信息（更换国家、区域或温度时直接重新排序）
+        self.last_recognition = None
+        self.pending_species_region = None  # 重新排序时等待下载的地区代码
         # self.show_temp_comparison = tk.BooleanVar(value=False)  # 已移除温度对比功能
 
         # 添加变量监听，自动保存设置
@@ -378,7 +385,13 @@ class SuperBirdIDGUI:
             print(f"保存设置失败: {e}")
 
     def on_country_changed(self, event=None):
-        """当用户选择国家时，更新区域列表"""
+        """当用户选择国家时，更新区域列表，并按新国家重新排序上一张图片的结果"""
+        self.update_region_options()
+        if event is not None:
+            self.on_region_changed(event)
+
+    def update_region_options(self):
+        """按当前国家更新区域菜单（选中"整个国家"）"""
         selected_country_display = self.selected_country.get()
 
         if selected_country_display in ["自动检测", "全球模式"]:
@@ -440,7 +453,9 @@ class SuperBirdIDGUI:
             self.region_menu_quick.set("整个国家")
 
     def on_region_changed(self, event=None):
-        """当用户选择区域时，下载该区域的物种数据"""
+        """当用户选择区域时，重新排序上一张图片的结果，并下载该区域的物种数据"""
+        self.rerank_last_result()
+
         selected_region_display = self.selected_region.get()
         selected_country_display = self.selected_country.get()
 
@@ -481,6 +496,7 @@ class SuperBirdIDGUI:
                     if species_set:
                         self.update_status(f"✓ 已下载 {region_code} 的 {len(species_set)} 个物种")
                         print(f"✓ 物种数据已缓存: {region_code} ({len(species_set)} 个物种)")
+                        self.progress_queue.put(("species_ready", region_code))
                     else:
                         self.update_status(f"⚠️ 下载 {region_code} 物种数据失败")
                 else:
@@ -1352,6 +1368,7 @@ class SuperBirdIDGUI:
         def on_temp_change(event):
             selected_idx = temp_combo.current()
             self.temperature.set(temp_values[selected_idx])
+            self.rerank_last_result()
 
         temp_combo.bind('<<ComboboxSelected>>', on_temp_change)
 
@@ -1907,6 +1924,7 @@ class SuperBirdIDGUI:
 
         # 清空结果
         self.clear_results()
+        self.last_recognition = None
 
         # 在后台线程运行识别
         thread = threading.Thread(target=self.run_recognition, daemon=True)
@@ -1928,6 +1946,7 @@ class SuperBirdIDGUI:
             self.progress_queue.put(("progress", "📚 加载鸟类数据库..."))
             bird_info = lazy_load_bird_info()
             db_manager = lazy_load_database()
+            catalog = lazy_load_species_catalog()
             if db_manager:
                 print(f"DEBUG: 数据库加载完成 - db_manager类型={type(db_manager).__name__}")
             else:
@@ -1941,6 +1960,7 @@ class SuperBirdIDGUI:
             ebird_species_set = None
             gps_location_species = None  # GPS精确位置的物种列表
             ebird_data_source = None  # 记录使用的数据来源
+            gps_info = None  # 拍摄地点说明（重新排序时再次显示）
 
             if self.use_gps.get():
                 print(f"DEBUG: 开始提取GPS信息，文件路径: {self.current_image_path}")
@@ -1976,110 +1996,39 @@ class SuperBirdIDGUI:
                             cache_status = f" | ✅ {len(gps_location_species)} 个物种"
 
                     # 将GPS信息和缓存状态一起显示
-                    full_gps_info = region_info + cache_status
-                    self.progress_queue.put(("gps", full_gps_info))
+                    gps_info = region_info + cache_status
+                    self.progress_queue.put(("gps", gps_info))
 
                     # data_source将在识别结果之前发送，这里不需要重复发送
 
-            # eBird过滤设置
-            print(f"\nDEBUG eBird过滤: 启用={self.use_ebird.get()}, 模块可用={EBIRD_FILTER_AVAILABLE}")
-            if self.use_ebird.get() and EBIRD_FILTER_AVAILABLE:
-                try:
-                    # 初始化 eBird 过滤器（用于回退机制）
-                    EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY', '60nan25sogpo')
-                    cache_dir = os.path.join(get_user_data_dir(), 'ebird_cache')
-                    offline_dir = get_resource_path("offline_ebird_data")
-                    ebird_filter = eBirdCountryFilter(EBIRD_API_KEY, cache_dir=cache_dir, offline_dir=offline_dir)
-
-                    # 优先使用GPS精确位置数据，其次使用国家数据
-                    if gps_location_species:
-                        # 使用GPS位置的25km范围数据（最精确）
-                        ebird_species_set = gps_location_species
-                        print(f"DEBUG eBird过滤: 使用GPS位置数据，物种数={len(ebird_species_set)}")
-                        self.progress_queue.put(("progress", f"✅ 使用GPS位置数据 ({len(ebird_species_set)} 种鸟类)"))
-                        # ebird_data_source 已在前面设置
-                    else:
-                        # 没有GPS数据，使用用户选择的国家/区域
-                        selected = self.selected_country.get()
-                        selected_region_display = self.selected_region.get()
-                        print(f"DEBUG eBird过滤: 用户选择国家='{selected}', 区域='{selected_region_display}'")
-
-                        # 确定要使用的区域代码
-                        region_code = None
-
-                        # 如果是"自动检测"且有GPS，使用GPS国家代码
-                        if selected == "自动检测":
-                            if country_code:
-                                print(f"DEBUG eBird过滤: 自动检测模式，使用GPS国家代码={country_code}")
-                                region_code = country_code
-                            else:
-                                print(f"DEBUG eBird过滤: 自动检测模式，无GPS，不使用过滤")
-                                region_code = None
-                                ebird_data_source = "全球模式（未检测到GPS）"
-                        # 如果是"全球模式"，不使用过滤
-                        elif selected == "全球模式":
-                            print(f"DEBUG eBird过滤: 全球模式，不使用过滤")
-                            region_code = None
-                            ebird_data_source = "全球模式"
-                        # 否则使用用户选择的国家/区域
-                        else:
-                            # 检查是否选择了具体区域
-                            if selected_region_display and selected_region_display != "整个国家":
-                                # 从 "South Australia (AU-SA)" 提取 AU-SA
-                                import re
-                                match = re.search(r'\(([A-Z]{2}-[A-Z]+)\)', selected_region_display)
-                                if match:
-                                    region_code = match.group(1)
-                                    print(f"DEBUG eBird过滤: 用户选择区域，区域代码={region_code}")
-                                else:
-                                    region_code = self.country_list.get(selected)
-                                    print(f"DEBUG eBird过滤: 无法解析区域代码，使用国家代码={region_code}")
-                            else:
-                                # 使用整个国家
-                                region_code = self.country_list.get(selected)
-                                print(f"DEBUG eBird过滤: 用户选择整个国家，国家代码={region_code}")
-
-                        # 如果有区域代码，加载eBird数据
-                        if region_code:
-                            country_code = region_code  # 兼容后续代码
-                            self.progress_queue.put(("progress", f"🌍 加载 {country_code} 国家级鸟类数据库..."))
-                            print(f"DEBUG eBird过滤: 开始加载国家数据，country_code={country_code}")
-
-                            # 使用已创建的 ebird_filter 加载物种数据
-                            ebird_species_set = ebird_filter.get_country_species_list(country_code)
-
-                            if ebird_species_set:
-                                print(f"DEBUG eBird过滤: 成功加载国家数据，物种数={len(ebird_species_set)}")
-                                print(f"DEBUG eBird过滤: 前5个eBird代码: {list(ebird_species_set)[:5]}")
-                                self.progress_queue.put(("progress", f"✅ 数据库加载完成 ({len(ebird_species_set)} 种鸟类)"))
-                                ebird_data_source = f"国家{country_code}数据"
-                            else:
-                                print(f"DEBUG eBird过滤: 加载国家数据失败")
-                                ebird_data_source = "全球模式（国家数据加载失败）"
-                        else:
-                            print(f"DEBUG eBird过滤: country_code为空，不使用过滤")
-                except Exception as e:
-                    print(f"DEBUG eBird过滤: 异常 - {e}")
-                    self.progress_queue.put(("progress", f"⚠️ 地区数据加载失败，使用全球数据库"))
-                    ebird_data_source = "全球模式（加载异常）"
-            else:
-                print(f"DEBUG eBird过滤: 未启用或模块不可用")
-                # 未启用eBird筛选
-                ebird_data_source = "全球模式（未启用地理筛选）"
+            gps = {
+                'lat': lat,
+                'lon': lon,
+                'country_code': country_code,
+                'location_species': gps_location_species,
+                'data_source': ebird_data_source,
+                'info': gps_info,
+                'fallback': None
+            }
+            geo = self.resolve_geo_filter(bird_info, gps, self.progress_queue.put)
 
-            print(f"DEBUG eBird过滤: 最终 ebird_species_set={'有数据' if ebird_species_set else '无'}, 数量={len(ebird_species_set) if ebird_species_set else 0}")
+            # 检测框和 logits 缓存键（同一文件再次识别时跳过YOLO检测和前向推理）
+            use_yolo = self.use_yolo.get() and YOLO_AVAILABLE
+            stage_cache = lazy_load_stage_cache()
+            stage_keys = stage_cache.keys_for(self.current_image_path, 'gui', use_yolo) if stage_cache else None
 
-            # YOLO检测
+            # YOLO检测（模型不可用或检测出错时使用原图，此时的 logits 不缓存）
             processed_image = self.current_image
+            detection_final = True
 
-            if self.use_yolo.get() and YOLO_AVAILABLE:
+            if use_yolo:
                 width, height = self.current_image.size
                 if max(width, height) > 640:
                     self.progress_queue.put(("progress", "🎯 智能定位鸟类位置..."))
 
-                    detector = YOLOBirdDetector()
                     # 传入PIL Image对象而不是文件路径，支持RAW格式
-                    cropped, msg = detector.detect_and_crop_bird(self.current_image)
+                    cropped, msg, detection_final = detect_bird_cached(
+                        self.current_image, stage_keys.detection if stage_keys else None)
 
                     if cropped:
                         processed_image = cropped
@@ -2100,18 +2049,25 @@ class SuperBirdIDGUI:
             import numpy as np
             import cv2
 
-            # 预处理
-            resized = processed_image.resize((256, 256), Image.Resampling.LANCZOS)
-            cropped = resized.crop((16, 16, 240, 240))
+            cached_logits = stage_cache.get_logits(stage_keys.logits) if stage_keys else None
+            if cached_logits is not None:
+                output = torch.from_numpy(cached_logits)
+                print("DEBUG: 使用缓存的 logits，跳过前向推理")
+            else:
+                # 预处理
+                resized = processed_image.resize((256, 256), Image.Resampling.LANCZOS)
+                cropped = resized.crop((16, 16, 240, 240))
 
-            arr = np.array(cropped)
-            bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-            normalized = (bgr / 255.0 - np.array([0.406, 0.456, 0.485])) / np.array([0.225, 0.224, 0.229])
-            tensor = torch.from_numpy(normalized).permute(2, 0, 1).unsqueeze(0).float()
+                arr = np.array(cropped)
+                bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+                normalized = (bgr / 255.0 - np.array([0.406, 0.456, 0.485])) / np.array([0.225, 0.224, 0.229])
+                tensor = torch.from_numpy(normalized).permute(2, 0, 1).unsqueeze(0).float()
 
-            # 推理
-            with torch.no_grad():
-                output = model(tensor)[0]
+                # 推理
+                with torch.no_grad():
+                    output = model(tensor)[0]
+                if stage_keys and detection_final:
+                    stage_cache.put_logits(stage_keys.logits, output)
 
             # 多温度对比功能已移除，保持界面简洁
             # if self.show_temp_comparison.get():
@@ -2120,316 +2076,572 @@ class SuperBirdIDGUI:
 
             # 使用用户选择的温度进行识别
             TEMPERATURE = self.temperature.get()
-            probabilities = torch.nn.functional.softmax(output / TEMPERATURE, dim=0)
+            results, ebird_data_source = self.rank_predictions(output, TEMPERATURE, geo, gps, self.progress_queue.put)
+
+            # 保留本张图片的 logits：之后更换国家、区域或温度时在界面线程直接重新排序
+            self.last_recognition = {
+                'image_path': self.current_image_path,
+                'logits': output,
+                'gps': gps,
+                'top_name': results[0]['cn_name'] if results else None
+            }
+
+            # 在显示结果之前，先显示数据来源信息（始终显示）
+            if ebird_data_source:
+                self.progress_queue.put(("data_source", ebird_data_source))
+
+            # 发送结果
+            self.progress_queue.put(("results", results))
+
+            # 状态消息
+            if len(results) > 0:
+                self.progress_queue.put(("status", f"✓ 识别完成 (温度 T={TEMPERATURE})"))
+            else:
+                self.progress_queue.put(("status", "识别完成，但未找到匹配结果"))
+
+        except Exception as e:
+            self.progress_queue.put(("error", str(e)))
+        finally:
+            self.progress_queue.put(("done", None))
+
+    def resolve_geo_filter(self, bird_info, gps, emit, allow_fetch=True):
+        """
+        根据GPS位置和当前选择的国家/区域确定地理筛选条件
+
+        Args:
+            gps: run_recognition 保存的GPS信息（坐标、国家代码、25km物种列表、数据来源）
+            emit: 进度消息回调
+            allow_fetch: 是否允许联网获取物种列表（界面线程重新排序时只使用缓存和离线数据）
 
+        Returns:
+            筛选条件字典；物种列表尚未下载时 pending_region 为对应的区域代码
+        """
+        country_code = gps['country_code']
+        gps_location_species = gps['location_species']
+        ebird_data_source = gps['data_source']
+        ebird_species_set = None
+        ebird_filter = None
+        pending_region = None
+
+        # eBird过滤设置
+        print(f"\nDEBUG eBird过滤: 启用={self.use_ebird.get()}, 模块可用={EBIRD_FILTER_AVAILABLE}")
+        if self.use_ebird.get() and EBIRD_FILTER_AVAILABLE:
+            try:
+                # 初始化 eBird 过滤器（用于回退机制）
+                EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY', '60nan25sogpo')
+                cache_dir = os.path.join(get_user_data_dir(), 'ebird_cache')
+                offline_dir = get_resource_path("offline_ebird_data")
+                ebird_filter = eBirdCountryFilter(EBIRD_API_KEY, cache_dir=cache_dir, offline_dir=offline_dir)
+
+                # 优先使用GPS精确位置数据，其次使用国家数据
+                if gps_location_species:
+                    # 使用GPS位置的25km范围数据（最精确）
+                    ebird_species_set = gps_location_species
+                    print(f"DEBUG eBird过滤: 使用GPS位置数据，物种数={len(ebird_species_set)}")
+                    emit(("progress", f"✅ 使用GPS位置数据 ({len(ebird_species_set)} 种鸟类)"))
+                    # ebird_data_source 已在前面设置
+                else:
+                    # 没有GPS数据，使用用户选择的国家/区域
+                    selected = self.selected_country.get()
+                    selected_region_display = self.selected_region.get()
+                    print(f"DEBUG eBird过滤: 用户选择国家='{selected}', 区域='{selected_region_display}'")
+
+                    # 确定要使用的区域代码
+                    region_code = None
+
+                    # 如果是"自动检测"且有GPS，使用GPS国家代码
+                    if selected == "自动检测":
+                        if country_code:
+                            print(f"DEBUG eBird过滤: 自动检测模式，使用GPS国家代码={country_code}")
+                            region_code = country_code
+                        else:
+                            print(f"DEBUG eBird过滤: 自动检测模式，无GPS，不使用过滤")
+                            region_code = None
+                            ebird_data_source = "全球模式（未检测到GPS）"
+                    # 如果是"全球模式"，不使用过滤
+                    elif selected == "全球模式":
+                        print(f"DEBUG eBird过滤: 全球模式，不使用过滤")
+                        region_code = None
+                        ebird_data_source = "全球模式"
+                    # 否则使用用户选择的国家/区域
+                    else:
+                        # 检查是否选择了具体区域
+                        if selected_region_display and selected_region_display != "整个国家":
+                            # 从 "South Australia (AU-SA)" 提取 AU-SA
+                            import re
+                            match = re.search(r'\(([A-Z]{2}-[A-Z]+)\)', selected_region_display)
+                            if match:
+                                region_code = match.group(1)
+                                print(f"DEBUG eBird过滤: 用户选择区域，区域代码={region_code}")
+                            else:
+                                region_code = self.country_list.get(selected)
+                                print(f"DEBUG eBird过滤: 无法解析区域代码，使用国家代码={region_code}")
+                        else:
+                            # 使用整个国家
+                            region_code = self.country_list.get(selected)
+                            print(f"DEBUG eBird过滤: 用户选择整个国家，国家代码={region_code}")
+
+                    # 如果有区域代码，加载eBird数据
+                    if region_code:
+                        country_code = region_code  # 兼容后续代码
+                        emit(("progress", f"🌍 加载 {country_code} 国家级鸟类数据库..."))
+                        print(f"DEBUG eBird过滤: 开始加载国家数据，country_code={country_code}")
+
+                        # 使用已创建的 ebird_filter 加载物种数据
+                        if allow_fetch:
+                            ebird_species_set = ebird_filter.get_country_species_list(country_code)
+                        else:
+                            ebird_species_set = (ebird_filter.load_cached_species_list(country_code)
+                                                 or ebird_filter.load_offline_species_list(country_code))
+                            if not ebird_species_set:
+                                pending_region = country_code
+
+                        if ebird_species_set:
+                            print(f"DEBUG eBird过滤: 成功加载国家数据，物种数={len(ebird_species_set)}")
+                            print(f"DEBUG eBird过滤: 前5个eBird代码: {list(ebird_species_set)[:5]}")
+                            emit(("progress", f"✅ 数据库加载完成 ({len(ebird_species_set)} 种鸟类)"))
+                            ebird_data_source = f"国家{country_code}数据"
+                        elif pending_region:
+                            print(f"DEBUG eBird过滤: {country_code} 数据尚未下载")
+                            ebird_data_source = "全球模式（地区数据下载中）"
+                        else:
+                            print(f"DEBUG eBird过滤: 加载国家数据失败")
+                            ebird_data_source = "全球模式（国家数据加载失败）"
+                    else:
+                        print(f"DEBUG eBird过滤: country_code为空，不使用过滤")
+            except Exception as e:
+                print(f"DEBUG eBird过滤: 异常 - {e}")
+                emit(("progress", f"⚠️ 地区数据加载失败，使用全球数据库"))
+                ebird_data_source = "全球模式（加载异常）"
+        else:
+            print(f"DEBUG eBird过滤: 未启用或模块不可用")
+            # 未启用eBird筛选
+            ebird_data_source = "全球模式（未启用地理筛选）"
+
+        print(f"DEBUG eBird过滤: 最终 ebird_species_set={'有数据' if ebird_species_set else '无'}, 数量={len(ebird_species_set) if ebird_species_set else 0}")
+
+        # 离线分布筛选：eBird 数据不可用时，用 birdinfo 中的国家分布位直接得到类别掩码（无需网络和数据库）
+        occurrence_mask = None
+        if (self.use_ebird.get() and not ebird_species_set and country_code
+                and self.selected_country.get() != "全球模式"):
+            occurrence_country = country_code.split('-')[0]
+            occurrence = get_occurrence_filter(bird_info)
+            if occurrence and occurrence_country in occurrence:
+                occurrence_mask = occurrence.class_mask(occurrence_country)
+                ebird_data_source = f"离线分布{occurrence_country}数据"
+                print(f"DEBUG 离线分布筛选: {occurrence_country}，物种数={int(occurrence_mask.sum())}")
+
+        return {
+            'species_set': ebird_species_set,
+            'occurrence_mask': occurrence_mask,
+            'country_code': country_code,
+            'data_source': ebird_data_source,
+            'ebird_filter': ebird_filter,
+            'pending_region': pending_region
+        }
+
+    def rank_predictions(self, output, temperature, geo, gps, emit, allow_fetch=True):
+        """
+        对分类器 logits 做温度 softmax 并按地理筛选条件排序（不涉及图片和模型，可在界面线程执行）
+
+        Args:
+            allow_fetch: 筛选结果为空时是否允许联网获取回退的物种列表（界面线程重新排序时只使用缓存和离线数据）
+
+        Returns:
+            (结果列表, 数据来源说明)
+        """
+        import torch
+
+        bird_info = lazy_load_bird_info()
+        db_manager = lazy_load_database()
+        catalog = lazy_load_species_catalog()
+        ebird_species_set = geo['species_set']
+        occurrence_mask = geo['occurrence_mask']
+        country_code = geo['country_code']
+        ebird_data_source = geo['data_source']
+        ebird_filter = geo['ebird_filter']
+        gps_location_species = gps['location_species']
+        lat, lon = gps['lat'], gps['lon']
+
+        # 温度锐化
+        probabilities = torch.nn.functional.softmax(output / temperature, dim=0)
+
+        # 区域掩码索引（按物种集合缓存），不可用时逐个候选查询数据库
+        mask_index = get_region_mask_index(db_manager, len(probabilities)) if ebird_species_set else None
+        region_flags = None
+
+        if mask_index or occurrence_mask is not None:
+            # 直接取区域内的前10个物种，另取全局前100名中区域外的前5个用于回退检查
+            region_mask = mask_index.mask_for(ebird_species_set) if mask_index else torch.from_numpy(occurrence_mask)
+            top_probs, top_indices, inside_flags = RegionMaskIndex.select_candidates(probabilities, region_mask, 10, 5)
+            region_flags = dict(zip(top_indices.tolist(), inside_flags.tolist()))
+            print(f"DEBUG 过滤: 区域掩码内 {int(region_mask.sum())} 个类别")
+        else:
             # 获取更多候选结果用于eBird过滤
             top_k = 100 if ebird_species_set else 10
             top_probs, top_indices = torch.topk(probabilities, min(top_k, len(probabilities)))
 
-            # 格式化结果并应用eBird过滤
-            results = []
-            filtered_results = []  # 被过滤掉的结果
-            rank = 1
+        # 格式化结果并应用eBird过滤
+        results = []
+        filtered_results = []  # 被过滤掉的结果
+        rank = 1
 
-            for i in range(len(top_indices)):
-                idx = top_indices[i].item()
-                conf = top_probs[i].item() * 100
+        for i in range(len(top_indices)):
+            idx = top_indices[i].item()
+            conf = top_probs[i].item() * 100
 
-                if conf < 5.0:  # 跳过置信度过低的结果
-                    continue
+            if conf < 5.0:  # 跳过置信度过低的结果
+                continue
 
-                # 优先使用数据库查询
-                cn_name = None
-                en_name = None
+            # 优先使用内存物种目录（已包含数据库和 bird_info 回退的名称）
+            cn_name = None
+            en_name = None
 
-                if db_manager:
-                    bird_data = db_manager.get_bird_by_class_id(idx)
-                    if bird_data:
-                        cn_name = bird_data['chinese_simplified']
-                        en_name = bird_data['english_name']
+            if catalog and catalog.contains(idx):
+                cn_name = catalog.chinese_names[idx]
+                en_name = catalog.english_names[idx]
 
-                # 如果数据库查询失败，回退到 bird_info
-                if not cn_name and idx < len(bird_info) and len(bird_info[idx]) >= 2:
-                    cn_name = bird_info[idx][0]
-                    en_name = bird_info[idx][1]
+            # 目录不可用时回退到 bird_info
+            if not cn_name and idx < len(bird_info) and len(bird_info[idx]) >= 2:
+                cn_name = bird_info[idx][0]
+                en_name = bird_info[idx][1]
 
-                if cn_name and en_name:
-                    # eBird过滤
-                    ebird_match = False
-                    filtered_by_ebird = False
+            if cn_name and en_name:
+                # eBird过滤
+                ebird_match = False
+                filtered_by_ebird = False
 
-                    if ebird_species_set:
-                        # 获取eBird代码
-                        ebird_code = None
-                        if db_manager:
-                            ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
-                            print(f"DEBUG 过滤: 英文名='{en_name}' -> eBird代码='{ebird_code}'")
-                        else:
-                            print(f"DEBUG 过滤: 数据库不可用，无法获取eBird代码 (英文名='{en_name}')")
+                if region_flags is not None:
+                    # 区域掩码已判定是否在列表中
+                    if region_flags.get(idx, False):
+                        ebird_match = True
+                    else:
+                        filtered_by_ebird = True
+                elif ebird_species_set:
+                    # 获取eBird代码
+                    ebird_code = None
+                    if catalog and catalog.db_manager is not None:
+                        ebird_code = catalog.ebird_code(idx)
+                        print(f"DEBUG 过滤: 英文名='{en_name}' -> eBird代码='{ebird_code}'")
+                    elif db_manager:
+                        ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
+                        print(f"DEBUG 过滤: 英文名='{en_name}' -> eBird代码='{ebird_code}'")
+                    else:
+                        print(f"DEBUG 过滤: 数据库不可用，无法获取eBird代码 (英文名='{en_name}')")
 
-                        # 检查是否在eBird列表中
-                        if ebird_code and ebird_code in ebird_species_set:
-                            ebird_match = True
-                            print(f"DEBUG 过滤: ✓ '{en_name}' ({ebird_code}) 在过滤列表中，保留")
+                    # 检查是否在eBird列表中
+                    if ebird_code and ebird_code in ebird_species_set:
+                        ebird_match = True
+                        print(f"DEBUG 过滤: ✓ '{en_name}' ({ebird_code}) 在过滤列表中，保留")
+                    else:
+                        filtered_by_ebird = True
+                        if ebird_code:
+                            print(f"DEBUG 过滤: ✗ '{en_name}' ({ebird_code}) 不在过滤列表中，过滤掉")
                         else:
-                            filtered_by_ebird = True
-                            if ebird_code:
-                                print(f"DEBUG 过滤: ✗ '{en_name}' ({ebird_code}) 不在过滤列表中，过滤掉")
-                            else:
-                                print(f"DEBUG 过滤: ✗ '{en_name}' 无eBird代码，过滤掉")
+                            print(f"DEBUG 过滤: ✗ '{en_name}' 无eBird代码，过滤掉")
+
+                # 只有在没有被eBird过滤的情况下才加入结果
+                if not filtered_by_ebird:
+                    results.append({
+                        'rank': rank,
+                        'cn_name': cn_name,
+                        'en_name': en_name,
+                        'confidence': conf,
+                        'ebird_match': ebird_match
+                    })
+                    rank += 1
 
-                    # 只有在没有被eBird过滤的情况下才加入结果
-                    if not filtered_by_ebird:
-                        results.append({
-                            'rank': rank,
+                    # 只保留前10个结果
+                    if rank > 10:
+                        break
+                else:
+                    # 保存被过滤的结果（最多5个）
+                    if len(filtered_results) < 5:
+                        filtered_results.append({
+                            'class_id': idx,
                             'cn_name': cn_name,
                             'en_name': en_name,
-                            'confidence': conf,
-                            'ebird_match': ebird_match
+                            'confidence': conf
                         })
-                        rank += 1
 
-                        # 只保留前10个结果
-                        if rank > 10:
-                            break
-                    else:
-                        # 保存被过滤的结果（最多5个）
-                        if len(filtered_results) < 5:
-                            filtered_results.append({
-                                'cn_name': cn_name,
-                                'en_name': en_name,
-                                'confidence': conf
-                            })
-
-            # 如果eBird过滤导致结果为空，尝试多级回退
-            if ebird_species_set and len(results) == 0 and len(filtered_results) > 0:
-                print(f"DEBUG 过滤: 所有结果都被过滤，被过滤的结果数={len(filtered_results)}")
-                print(f"DEBUG 过滤: 当前过滤列表物种数={len(ebird_species_set)}")
-
-                # 尝试回退策略：GPS 25km → 区域 → 国家
-                fallback_species_set = None
-                fallback_source = None
-
-                # 如果当前使用的是GPS位置数据（25km，物种少）
-                if gps_location_species and len(ebird_species_set) < 200:
-                    print(f"DEBUG 过滤回退: 当前使用GPS位置数据({len(ebird_species_set)}个物种)，尝试回退到区域/国家")
-
-                    # 尝试回退到GPS所在的区域
-                    if country_code:
-                        try:
-                            # 检查是否是区域代码（如 AU-SA）
-                            if '-' in country_code:
-                                # 这是区域代码，已经是区域级别，尝试回退到国家
-                                country_only = country_code.split('-')[0]
-                                print(f"DEBUG 过滤回退: 从区域 {country_code} 回退到国家 {country_only}")
-                                fallback_species_set = ebird_filter.get_country_species_list(country_only)
-                                fallback_source = f"回退到国家级数据 ({country_only})"
-                            else:
-                                # 这是国家代码，尝试获取GPS所在的具体区域
+        # 如果eBird过滤导致结果为空，尝试多级回退
+        if ebird_species_set and len(results) == 0 and len(filtered_results) > 0:
+            print(f"DEBUG 过滤: 所有结果都被过滤，被过滤的结果数={len(filtered_results)}")
+            print(f"DEBUG 过滤: 当前过滤列表物种数={len(ebird_species_set)}")
+
+            # 尝试回退策略：GPS 25km → 区域 → 国家
+            fallback_species_set = None
+            fallback_source = None
+
+            def load_species(code):
+                if allow_fetch:
+                    return ebird_filter.get_country_species_list(code)
+                return ebird_filter.load_cached_species_list(code) or ebird_filter.load_offline_species_list(code)
+
+            # 如果当前使用的是GPS位置数据（25km，物种少）；联网获取的回退数据按图片保存，重新排序时直接使用
+            if gps['fallback'] is not None:
+                fallback_species_set, fallback_source = gps['fallback']
+            elif gps_location_species and ebird_filter and len(ebird_species_set) < 200:
+                print(f"DEBUG 过滤回退: 当前使用GPS位置数据({len(ebird_species_set)}个物种)，尝试回退到区域/国家")
+
+                # 尝试回退到GPS所在的区域
+                if country_code:
+                    try:
+                        # 检查是否是区域代码（如 AU-SA）
+                        if '-' in country_code:
+                            # 这是区域代码，已经是区域级别，尝试回退到国家
+                            country_only = country_code.split('-')[0]
+                            print(f"DEBUG 过滤回退: 从区域 {country_code} 回退到国家 {country_only}")
+                            fallback_species_set = load_species(country_only)
+                            fallback_source = f"回退到国家级数据 ({country_only})"
+                        else:
+                            # 这是国家代码，尝试获取GPS所在的具体区域（离线边界数据不可用时需要联网查询）
+                            region_code = None
+                            if allow_fetch:
                                 region_code, _ = ebird_filter.get_region_code_from_gps(lat, lon)
-                                if region_code and region_code != country_code:
-                                    print(f"DEBUG 过滤回退: 从GPS位置 回退到区域 {region_code}")
-                                    fallback_species_set = ebird_filter.get_country_species_list(region_code)
-                                    fallback_source = f"回退到区域级数据 ({region_code})"
-                                else:
-                                    print(f"DEBUG 过滤回退: 从GPS位置 回退到国家 {country_code}")
-                                    fallback_species_set = ebird_filter.get_country_species_list(country_code)
-                                    fallback_source = f"回退到国家级数据 ({country_code})"
-                        except Exception as e:
-                            print(f"DEBUG 过滤回退失败: {e}")
-
-                # 如果回退成功，重新过滤
-                if fallback_species_set and len(fallback_species_set) > len(ebird_species_set):
-                    print(f"DEBUG 过滤回退: 成功获取回退数据，物种数={len(fallback_species_set)}")
-
-                    # 用回退的物种列表重新检查被过滤的结果
-                    for filtered_result in filtered_results[:10]:
-                        en_name = filtered_result['en_name']
-                        ebird_code = None
+                            if region_code and region_code != country_code:
+                                print(f"DEBUG 过滤回退: 从GPS位置 回退到区域 {region_code}")
+                                fallback_species_set = load_species(region_code)
+                                fallback_source = f"回退到区域级数据 ({region_code})"
+                            else:
+                                print(f"DEBUG 过滤回退: 从GPS位置 回退到国家 {country_code}")
+                                fallback_species_set = load_species(country_code)
+                                fallback_source = f"回退到国家级数据 ({country_code})"
+                    except Exception as e:
+                        print(f"DEBUG 过滤回退失败: {e}")
+                if allow_fetch:
+                    gps['fallback'] = (fallback_species_set, fallback_source)
 
-                        if db_manager:
-                            ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
+            # 如果回退成功，重新过滤
+            if fallback_species_set and len(fallback_species_set) > len(ebird_species_set):
+                print(f"DEBUG 过滤回退: 成功获取回退数据，物种数={len(fallback_species_set)}")
+
+                # 用回退的物种列表重新检查被过滤的结果
+                fallback_mask = mask_index.mask_for(fallback_species_set) if mask_index else None
+                for filtered_result in filtered_results[:10]:
+                    en_name = filtered_result['en_name']
 
-                        if ebird_code and ebird_code in fallback_species_set:
-                            print(f"DEBUG 过滤回退: ✓ '{en_name}' ({ebird_code}) 在回退列表中，添加")
-                            results.append({
-                                'rank': len(results) + 1,
-                                'cn_name': filtered_result['cn_name'],
-                                'en_name': filtered_result['en_name'],
-                                'confidence': filtered_result['confidence'],
-                                'ebird_match': True
-                            })
-
-                            if len(results) >= 10:
-                                break
-
-                    # 更新数据来源信息
-                    if len(results) > 0:
-                        ebird_data_source = fallback_source
-                        self.progress_queue.put(("warning",
-                            f"ℹ️ 地理筛选回退\n"
-                            f"GPS 25km范围内未找到匹配，已回退到更大范围\n"
-                            f"数据来源：{fallback_source} ({len(fallback_species_set)} 个物种)"))
+                    if fallback_mask is not None:
+                        in_fallback = mask_index.contains(fallback_mask, filtered_result['class_id'])
                     else:
-                        # 回退后仍然没有结果
-                        self.progress_queue.put(("warning",
-                            f"❌ 地理筛选：未找到匹配结果\n"
-                            f"AI识别的物种（{filtered_results[0]['cn_name']} {filtered_results[0]['en_name']}）不在当前地区鸟类列表中\n\n"
-                            f"建议：\n"
-                            f"• 关闭\"启用eBird地理筛选\"以查看全球识别结果\n"
-                            f"• 或切换到\"全球模式\""))
+                        ebird_code = None
+                        if catalog and catalog.db_manager is not None:
+                            ebird_code = catalog.ebird_code(filtered_result['class_id'])
+                        elif db_manager:
+                            ebird_code = db_manager.get_ebird_code_by_english_name(en_name)
+                        in_fallback = bool(ebird_code and ebird_code in fallback_species_set)
+
+                    if in_fallback:
+                        print(f"DEBUG 过滤回退: ✓ '{en_name}' 在回退列表中，添加")
+                        results.append({
+                            'rank': len(results) + 1,
+                            'cn_name': filtered_result['cn_name'],
+                            'en_name': filtered_result['en_name'],
+                            'confidence': filtered_result['confidence'],
+                            'ebird_match': True
+                        })
+
+                        if len(results) >= 10:
+                            break
+
+                # 更新数据来源信息
+                if len(results) > 0:
+                    ebird_data_source = fallback_source
+                    emit(("warning",
+                        f"ℹ️ 地理筛选回退\n"
+                        f"GPS 25km范围内未找到匹配，已回退到更大范围\n"
+                        f"数据来源：{fallback_source} ({len(fallback_species_set)} 个物种)"))
                 else:
-                    # 没有回退或回退失败
-                    self.progress_queue.put(("warning",
+                    # 回退后仍然没有结果
+                    emit(("warning",
                         f"❌ 地理筛选：未找到匹配结果\n"
                         f"AI识别的物种（{filtered_results[0]['cn_name']} {filtered_results[0]['en_name']}）不在当前地区鸟类列表中\n\n"
                         f"建议：\n"
                         f"• 关闭\"启用eBird地理筛选\"以查看全球识别结果\n"
                         f"• 或切换到\"全球模式\""))
-
-            # 如果完全没有结果（所有置信度都低于5%）
-            if len(results) == 0:
-                self.progress_queue.put(("warning",
-                    "❌ 未能识别出鸟类\n"
-                    "可能原因：\n"
-                    "• 图片中没有清晰的鸟类\n"
-                    "• 图片质量较低或模糊\n"
-                    "• 鸟类种类不在识别范围内\n"
-                    "建议：尝试使用更清晰的图片"))
-
-            # 在显示结果之前，先显示数据来源信息（始终显示）
-            if ebird_data_source:
-                self.progress_queue.put(("data_source", ebird_data_source))
-
-            # 发送结果
-            self.progress_queue.put(("results", results))
-
-            # 状态消息
-            if len(results) > 0:
-                self.progress_queue.put(("status", f"✓ 识别完成 (温度 T={TEMPERATURE})"))
             else:
-                self.progress_queue.put(("status", "识别完成，但未找到匹配结果"))
-
-        except Exception as e:
-            self.progress_queue.put(("error", str(e)))
-        finally:
-            self.progress_queue.put(("done", None))
+                # 没有回退或回退失败
+                emit(("warning",
+                    f"❌ 地理筛选：未找到匹配结果\n"
+                    f"AI识别的物种（{filtered_results[0]['cn_name']} {filtered_results[0]['en_name']}）不在当前地区鸟类列表中\n\n"
+                    f"建议：\n"
+                    f"• 关闭\"启用eBird地理筛选\"以查看全球识别结果\n"
+                    f"• 或切换到\"全球模式\""))
+
+        # 如果完全没有结果（所有置信度都低于5%）
+        if len(results) == 0:
+            emit(("warning",
+                "❌ 未能识别出鸟类\n"
+                "可能原因：\n"
+                "• 图片中没有清晰的鸟类\n"
+                "• 图片质量较低或模糊\n"
+                "• 鸟类种类不在识别范围内\n"
+                "建议：尝试使用更清晰的图片"))
+
+        return results, ebird_data_source
 
     def check_progress(self):
         """检查进度队列"""
         try:
             while True:
-                msg_type, data, *extra = self.progress_queue.get_nowait()
-
-                if msg_type == "status":
-                    self.update_status(data)
-
-                elif msg_type == "progress":
-                    self.progress_label.config(text=data)
-
-                elif msg_type == "gps":
-                    self.gps_info_label.config(text=f"📍 拍摄地点: {data}")
-                    self.gps_info_label.pack(padx=10, pady=(5, 0))
-                    self.gps_info_frame.pack(pady=(10, 5))
-
-                elif msg_type == "data_source":
-                    # 显示数据来源（不同策略用不同的图标和文字）
-                    # 优先检查"全球模式"，避免被"国家数据"误匹配
-                    if "全球模式" in data:
-                        icon = "🌐"
-                        text = f"{icon} 全球模式（无地理筛选）"
-                    elif "GPS位置30天数据" in data:
-                        icon = "🎯"
-                        text = f"{icon} 使用最精确的GPS位置数据 (30天内观测)"
-                    elif "区域" in data and "年度数据" in data:
-                        icon = "📍"
-                        region_name = data.split("区域")[1].split("年度")[0]
-                        text = f"{icon} 使用区域年度数据 ({region_name})"
-                    elif "国家" in data and "离线数据" in data:
-                        icon = "🌏"
-                        country_name = data.split("国家")[1].split("离线")[0]
-                        text = f"{icon} 使用国家离线数据 ({country_name})"
-                    elif "国家" in data and "数据" in data:
-                        # 国家级API数据（非离线）
-                        icon = "🌍"
-                        country_code = data.split("国家")[1].split("数据")[0]
-                        text = f"{icon} 使用国家数据 ({country_code})"
-                    else:
-                        icon = "ℹ️"
-                        text = f"{icon} {data}"
-
-                    # 只设置文本，不立即pack，等display_results时统一布局
-                    self.data_source_label.config(text=text)
-
-                elif msg_type == "cropped_image":
-                    # 显示YOLO裁剪后的图片
-                    cropped_img = data
-                    msg = extra[0] if extra else "YOLO裁剪"
-                    self.display_image(cropped_img)
-                    # 更新图片信息，显示裁剪提示（使用更醒目的颜色）
-                    current_text = self.info_label.cget("text")
-                    # 如果已经有YOLO信息，先移除
-                    if "🔍 YOLO" in current_text:
-                        current_text = current_text.split('\n🔍')[0]
-                    self.info_label.config(
-                        text=f"{current_text}\n🔍 {msg}",
-                        fg=self.colors['accent']  # 使用蓝色高亮显示YOLO信息
-                    )
-
-                # elif msg_type == "temp_comparison":  # 已移除温度对比功能
-                #     self.display_temp_comparison(data)
-
-                elif msg_type == "results":
-                    self.display_results(data)
-
-                elif msg_type == "warning":
-                    # 不再使用弹窗，而是在结果区域显示警告信息
-                    # 解析警告信息
-                    if "地理筛选过于严格" in data:
-                        # 提取鸟类名称
-                        lines = data.split('\n')
-                        bird_name = ""
-                        for line in lines:
-                            if "最可能的识别结果" in line:
-                                # 提取括号中的鸟类名称
-                                start = line.find("（")
-                                end = line.find("）")
-                                if start != -1 and end != -1:
-                                    bird_name = line[start+1:end]
-                                break
-
-                        # 显示在数据来源标签处
-                        warning_text = f"⚠️ 地理筛选过于严格，{bird_name} 不在当前地区。已显示全球识别结果"
-                        self.data_source_label.config(
-                            text=warning_text,
-                            fg=self.colors['warning']
-                        )
-                        self.data_source_label.pack(padx=10, pady=(2, 5))
-                    else:
-                        # 其他警告也显示在数据来源标签
-                        self.data_source_label.config(
-                            text=f"⚠️ {data.split(chr(10))[0]}",  # 只显示第一行
-                            fg=self.colors['warning']
-                        )
-                        self.data_source_label.pack(padx=10, pady=(2, 5))
-
-                elif msg_type == "error":
-                    messagebox.showerror("识别错误", data)
-
-                elif msg_type == "done":
-                    self.is_processing = False
-                    self.loading_animation_running = False  # 停止动画
-                    self.recognize_btn.config(state='normal', text="🔍 开始识别")
-                    self.open_btn.config(state='normal')
-                    self.progress_label.config(text="")
-
+                self.handle_progress_message(*self.progress_queue.get_nowait())
         except queue.Empty:
             pass
 
         # 继续检查
         self.root.after(100, self.check_progress)
 
-    def display_results(self, results):
+    def handle_progress_message(self, msg_type, data, *extra):
+        """处理后台线程发来的一条消息（界面线程）"""
+        if msg_type == "status":
+            self.update_status(data)
+
+        elif msg_type == "progress":
+            self.progress_label.config(text=data)
+
+        elif msg_type == "gps":
+            self.gps_info_label.config(text=f"📍 拍摄地点: {data}")
+            self.gps_info_label.pack(padx=10, pady=(5, 0))
+            self.gps_info_frame.pack(pady=(10, 5))
+
+        elif msg_type == "data_source":
+            # 显示数据来源（不同策略用不同的图标和文字）
+            # 优先检查"全球模式"，避免被"国家数据"误匹配
+            if "全球模式" in data:
+                icon = "🌐"
+                text = f"{icon} 全球模式（无地理筛选）"
+            elif "GPS位置30天数据" in data:
+                icon = "🎯"
+                text = f"{icon} 使用最精确的GPS位置数据 (30天内观测)"
+            elif "区域" in data and "年度数据" in data:
+                icon = "📍"
+                region_name = data.split("区域")[1].split("年度")[0]
+                text = f"{icon} 使用区域年度数据 ({region_name})"
+            elif "国家" in data and "离线数据" in data:
+                icon = "🌏"
+                country_name = data.split("国家")[1].split("离线")[0]
+                text = f"{icon} 使用国家离线数据 ({country_name})"
+            elif "国家" in data and "数据" in data:
+                # 国家级API数据（非离线）
+                icon = "🌍"
+                country_code = data.split("国家")[1].split("数据")[0]
+                text = f"{icon} 使用国家数据 ({country_code})"
+            else:
+                icon = "ℹ️"
+                text = f"{icon} {data}"
+
+            # 只设置文本，不立即pack，等display_results时统一布局
+            self.data_source_label.config(text=text)
+
+        elif msg_type == "cropped_image":
+            # 显示YOLO裁剪后的图片
+            cropped_img = data
+            msg = extra[0] if extra else "YOLO裁剪"
+            self.display_image(cropped_img)
+            # 更新图片信息，显示裁剪提示（使用更醒目的颜色）
+            current_text = self.info_label.cget("text")
+            # 如果已经有YOLO信息，先移除
+            if "🔍 YOLO" in current_text:
+                current_text = current_text.split('\n🔍')[0]
+            self.info_label.config(
+                text=f"{current_text}\n🔍 {msg}",
+                fg=self.colors['accent']  # 使用蓝色高亮显示YOLO信息
+            )
+
+        # elif msg_type == "temp_comparison":  # 已移除温度对比功能
+        #     self.display_temp_comparison(data)
+
+        elif msg_type == "results":
+            self.display_results(data)
+
+        elif msg_type == "warning":
+            # 不再使用弹窗，而是在结果区域显示警告信息
+            # 解析警告信息
+            if "地理筛选过于严格" in data:
+                # 提取鸟类名称
+                lines = data.split('\n')
+                bird_name = ""
+                for line in lines:
+                    if "最可能的识别结果" in line:
+                        # 提取括号中的鸟类名称
+                        start = line.find("（")
+                        end = line.find("）")
+                        if start != -1 and end != -1:
+                            bird_name = line[start+1:end]
+                        break
+
+                # 显示在数据来源标签处
+                warning_text = f"⚠️ 地理筛选过于严格，{bird_name} 不在当前地区。已显示全球识别结果"
+                self.data_source_label.config(
+                    text=warning_text,
+                    fg=self.colors['warning']
+                )
+                self.data_source_label.pack(padx=10, pady=(2, 5))
+            else:
+                # 其他警告也显示在数据来源标签
+                self.data_source_label.config(
+                    text=f"⚠️ {data.split(chr(10))[0]}",  # 只显示第一行
+                    fg=self.colors['warning']
+                )
+                self.data_source_label.pack(padx=10, pady=(2, 5))
+
+        elif msg_type == "error":
+            messagebox.showerror("识别错误", data)
+
+        elif msg_type == "species_ready":
+            # 重新排序时缺少的地区物种数据已下载完成
+            if data == self.pending_species_region:
+                self.rerank_last_result()
+
+        elif msg_type == "done":
+            self.is_processing = False
+            self.loading_animation_running = False  # 停止动画
+            self.recognize_btn.config(state='normal', text="🔍 开始识别")
+            self.open_btn.config(state='normal')
+            self.progress_label.config(text="")
+
+    def rerank_last_result(self):
+        """
+        按当前的国家、区域和温度重新排序上一张图片的结果（界面线程）
+        只重新做 softmax 和地理筛选，不重新解码图片、检测和推理；缺少的地区物种数据下载完成后再次排序
+        """
+        last = self.last_recognition
+        if self.is_processing or not last or last['image_path'] != self.current_image_path:
+            return
+
+        messages = []
+
+        def emit(message):
+            if message[0] != "progress":
+                messages.append(message)
+
+        try:
+            start = time.perf_counter()
+            geo = self.resolve_geo_filter(lazy_load_bird_info(), last['gps'], emit, allow_fetch=False)
+            temperature = self.temperature.get()
+            results, data_source = self.rank_predictions(last['logits'], temperature, geo, last['gps'], emit,
+                                                         allow_fetch=False)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"重新排序失败: {e}")
+            return
+        self.pending_species_region = geo['pending_region']
+
+        self.clear_results()
+        if last['gps']['info']:
+            self.handle_progress_message("gps", last['gps']['info'])
+        for message in messages:
+            self.handle_progress_message(*message)
+        if data_source:
+            self.handle_progress_message("data_source", data_source)
+
+        # 第一名变化时才重新写入EXIF
+        top_name = results[0]['cn_name'] if results else None
+        self.display_results(results, write_exif=top_name != last['top_name'])
+        last['top_name'] = top_name
+        self.update_status(f"✓ 已按当前设置重新排序 (温度 T={temperature}，{elapsed_ms:.1f} ms)")
+
+    def display_results(self, results, write_exif=True):
         """显示识别结果 - 响应式卡片布局"""
         # 显示标题
         self.results_title.pack(pady=(20, 10))
@@ -2466,7 +2678,7 @@ class SuperBirdIDGUI:
         self.root.bind('<Configure>', lambda e: self.adjust_card_layout())
 
         # 自动将第一名识别结果写入EXIF（仅支持JPEG和RAW格式）
-        if results and self.current_image_path:
+        if write_exif and results and self.current_image_path:
             top_result = results[0]
             bird_name = top_result['cn_name']  # 使用中文名
             success, message = write_bird_name_to_exif(self.current_image_path, bird_name)
@@ -82,6 +82,11 @@ except ImportError:
     # SQLite数据库是可选功能，没有也不影响核心功能
     # print("ℹ️  使用JSON文件模式（SQLite数据库未启用）")
 
+# 区域物种掩码（依赖数据库中的类别eBird代码）
+from region_mask import get_region_mask_index
+from species_catalog import SpeciesCatalog
+from stage_cache import STAGE_DETECTION, STAGE_LOGITS, StageCache, file_fingerprint
+
 # --- 获取脚本所在目录 ---
 # 支持 PyInstaller 打包环境
 if getattr(sys, 'frozen', False):
@@ -114,7 +119,7 @@ class YOLOBirdDetector:
             return
 
         if model_path is None:
-            model_path = os.path.join(script_dir, 'yolo_models/yolo11l.pt')
+            model_path = YOLO_MODEL_PATH
 
         try:
             self.model = YOLO(model_path)
@@ -139,69 +144,109 @@ class YOLOBirdDetector:
         if self.model is None:
             return None, "YOLO模型未可用"
 
-        try:
-            # 判断输入类型
-            if isinstance(image_input, str):
-                # 文件路径：需要先加载图像
+        # 判断输入类型
+        if isinstance(image_input, str):
+            # 文件路径：需要先加载图像
+            try:
                 from SuperBirdId import load_image
                 image = load_image(image_input)
-            elif isinstance(image_input, Image.Image):
-                # 已经是PIL Image对象
-                image = image_input
-            else:
-                return None, "不支持的图像输入类型"
+            except Exception as e:
+                return None, f"YOLO检测失败: {e}"
+        elif isinstance(image_input, Image.Image):
+            # 已经是PIL Image对象
+            image = image_input
+        else:
+            return None, "不支持的图像输入类型"
 
-            # 将PIL Image转换为numpy数组用于YOLO检测
-            import numpy as np
-            img_array = np.array(image)
+        return self.crop_detection(image, self.detect_birds([image], confidence_threshold, padding)[0])
+
+    def detect_and_crop_birds(self, images, confidence_threshold=0.25, padding=20):
+        """
+        批量检测并裁剪鸟类区域（一次推理处理多张图片）
+
+        Args:
+            images: PIL Image 列表
+
+        Returns:
+            与输入顺序一致的 [(cropped_image, detection_info) 或 (None, error_message)]
+        """
+        detections = self.detect_birds(images, confidence_threshold, padding)
+        return [self.crop_detection(image, detection) for image, detection in zip(images, detections)]
+
+    def detect_birds(self, images, confidence_threshold=0.25, padding=20):
+        """
+        批量检测鸟类（一次推理），只返回裁剪区域，便于缓存后直接裁剪而不必重新检测
+
+        Returns:
+            与输入顺序一致的检测结果列表:
+            {'bbox': [x1, y1, x2, y2]（已加边距）, 'confidence': float}，
+            未检测到鸟类时 bbox 为 None；模型不可用或推理出错时另有 'failed': True（不应缓存）
+        """
+        if self.model is None:
+            return [{'bbox': None, 'message': "YOLO模型未可用", 'failed': True}] * len(images)
+        if not images:
+            return []
 
-            # 使用numpy数组进行YOLO检测
+        try:
+            import numpy as np
             # Ultralytics YOLO会自动检测并使用最佳设备（MPS/CUDA/CPU）
-            results = self.model(img_array, conf=confidence_threshold)
-
-            # 解析检测结果
-            detections = []
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = box.conf[0].cpu().numpy()
-                        class_id = int(box.cls[0].cpu().numpy())
-
-                        # 只保留鸟类检测结果 (COCO数据集中鸟类的class_id是14)
-                        if class_id == 14:
-                            detections.append({
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                                'confidence': float(confidence)
-                            })
-
-            if not detections:
-                return None, "未检测到鸟类"
-
-            # 选择置信度最高的检测结果
-            best_detection = max(detections, key=lambda x: x['confidence'])
-
-            # 使用已加载的图像进行裁剪
-            img_width, img_height = image.size
-            
-            x1, y1, x2, y2 = best_detection['bbox']
-            
-            # 添加边距并确保不超出图像边界
-            x1_padded = max(0, x1 - padding)
-            y1_padded = max(0, y1 - padding)
-            x2_padded = min(img_width, x2 + padding)
-            y2_padded = min(img_height, y2 + padding)
-            
-            # 裁剪图像
-            cropped_image = image.crop((x1_padded, y1_padded, x2_padded, y2_padded))
-            
-            detection_info = f"YOLO检测: 置信度{best_detection['confidence']:.3f}, 裁剪尺寸{cropped_image.size}"
-            
-            return cropped_image, detection_info
-            
+            results = self.model([np.array(image) for image in images], conf=confidence_threshold)
+            return [self._best_bird_box(image.size, [result], padding) for image, result in zip(images, results)]
         except Exception as e:
-            return None, f"YOLO检测失败: {e}"
+            return [{'bbox': None, 'message': f"YOLO检测失败: {e}", 'failed': True}] * len(images)
+
+    @staticmethod
+    def _best_bird_box(image_size, results, padding):
+        """从检测结果中选出置信度最高的鸟类，返回加边距后的裁剪区域"""
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            if boxes is not None:
+                for box in boxes:
+                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                    confidence = box.conf[0].cpu().numpy()
+                    class_id = int(box.cls[0].cpu().numpy())
+
+                    # 只保留鸟类检测结果 (COCO数据集中鸟类的class_id是14)
+                    if class_id == 14:
+                        detections.append({
+                            'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                            'confidence': float(confidence)
+                        })
+
+        if not detections:
+            return {'bbox': None, 'message': "未检测到鸟类"}
+
+        # 选择置信度最高的检测结果
+        best_detection = max(detections, key=lambda x: x['confidence'])
+
+        img_width, img_height = image_size
+        x1, y1, x2, y2 = best_detection['bbox']
+
+        # 添加边距并确保不超出图像边界
+        return {
+            'bbox': [max(0, x1 - padding), max(0, y1 - padding), min(img_width, x2 + padding), min(img_height, y2 + padding)],
+            'confidence': best_detection['confidence']
+        }
+
+    @staticmethod
+    def crop_detection(image, detection):
+        """
+        按检测结果裁剪图像
+
+        Returns:
+            (cropped_image, detection_info) 或 (None, error_message)
+        """
+        if not detection.get('bbox'):
+            return None, detection.get('message', "未检测到鸟类")
+
+        return image.crop(tuple(detection['bbox'])), YOLOBirdDetector.detection_info(detection)
+
+    @staticmethod
+    def detection_info(detection):
+        """检测结果的说明文字（有缓存的 logits 时无需裁剪也能给出）"""
+        x1, y1, x2, y2 = detection['bbox']
+        return f"YOLO检测: 置信度{detection['confidence']:.3f}, 裁剪尺寸{(x2 - x1, y2 - y1)}"
 
 # --- 地理区域识别配置 ---
 GEOGRAPHIC_REGIONS = {
@@ -217,12 +262,15 @@ GEOGRAPHIC_REGIONS = {
 
 # --- 加载模型和数据 ---
 PYTORCH_CLASSIFICATION_MODEL_PATH = os.path.join(script_dir, 'birdid2024.pt')
+YOLO_MODEL_PATH = os.path.join(script_dir, 'yolo_models/yolo11l.pt')
 BIRD_INFO_PATH = os.path.join(script_dir, 'birdinfo.json')
 
 # 全局变量 - 使用懒加载
 classifier = None
 db_manager = None
 bird_info = None
+species_catalog = None
+stage_cache = None
 
 def decrypt_model(encrypted_path: str, password: str) -> bytes:
     """解密模型文件并返回解密后的数据"""
@@ -370,6 +418,75 @@ def lazy_load_database():
     return db_manager if db_manager is not False else None
 
 
+def lazy_load_species_catalog():
+    """懒加载内存物种目录（有数据库时从数据库一次性加载，否则只使用 birdinfo.json 中的名称）"""
+    global species_catalog
+    if species_catalog is None:
+        try:
+            database = lazy_load_database()
+            if database:
+                species_catalog = SpeciesCatalog.from_database(database, region_of=get_bird_region,
+                                                               bird_info=lazy_load_bird_info())
+            else:
+                species_catalog = SpeciesCatalog.from_bird_info(lazy_load_bird_info(), region_of=get_bird_region)
+            print(f"✓ 物种目录加载完成: {species_catalog.get_stats()['known']} 个类别")
+        except Exception as e:
+            print(f"✗ 物种目录加载失败: {e}")
+            species_catalog = False  # 标记为已尝试但失败
+    return species_catalog if species_catalog is not False else None
+
+
+def get_classifier_model_file():
+    """实际加载的分类模型文件（打包版本只包含加密的 .enc 文件），用于缓存的模型版本标识"""
+    encrypted_path = PYTORCH_CLASSIFICATION_MODEL_PATH + '.enc'
+    if os.path.exists(encrypted_path):
+        return encrypted_path
+    return PYTORCH_CLASSIFICATION_MODEL_PATH
+
+
+def lazy_load_stage_cache():
+    """
+    懒加载检测框和 logits 缓存（API、GUI、命令行共用用户数据目录下的 stage_cache.sqlite）
+    设置环境变量 STAGE_CACHE=0 可禁用；STAGE_CACHE_MB 设置容量上限
+    """
+    global stage_cache
+    if stage_cache is None:
+        if os.environ.get('STAGE_CACHE', '1') == '0':
+            stage_cache = False
+            return None
+        try:
+            stage_cache = StageCache(
+                os.path.join(get_user_data_dir(), 'stage_cache.sqlite'),
+                max_bytes=int(os.environ.get('STAGE_CACHE_MB', 256)) * 1024 * 1024,
+                model_versions={STAGE_DETECTION: file_fingerprint(YOLO_MODEL_PATH),
+                                STAGE_LOGITS: file_fingerprint(get_classifier_model_file())})
+        except Exception as e:
+            print(f"✗ 识别中间结果缓存加载失败: {e}")
+            stage_cache = False  # 标记为已尝试但失败
+    return stage_cache if stage_cache is not False else None
+
+
+def detect_bird_cached(image, detection_key=None, get_detector=YOLOBirdDetector):
+    """
+    YOLO检测并裁剪；有缓存键且缓存中有检测框时直接裁剪（不加载YOLO模型、不重新检测）
+
+    Args:
+        detection_key: StageKeys.detection，为None时不使用缓存
+        get_detector: 返回 YOLOBirdDetector 的函数（只在需要检测时调用）
+
+    Returns:
+        (cropped_image, detection_info, final) 或 (None, error_message, final)；
+        final 为 False 表示模型不可用或检测出错，下次识别结果可能不同，依赖它的 logits 不应缓存
+    """
+    cache = lazy_load_stage_cache() if detection_key else None
+    detection = cache.get_detection(detection_key) if cache else None
+    if detection is None:
+        detection = get_detector().detect_birds([image])[0]
+        if cache and not detection.get('failed'):
+            cache.put_detection(detection_key, detection)
+    return (*YOLOBirdDetector.crop_detection(image, detection), not detection.get('failed'))
+
+
 # 验证关键文件是否存在
 def verify_files():
     """快速验证关键文件"""
@@ -628,50 +745,24 @@ def get_bird_description_from_db(bird_cn_name):
             'ebird_code': str
         } 或 None（如果未找到）
     """
-    import sqlite3
-
-    try:
-        # 连接数据库
-        db_path = os.path.join(script_dir, 'bird_reference.sqlite')
-        if not os.path.exists(db_path):
-            return None
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # 查询鸟种信息
-        cursor.execute("""
-            SELECT
-                chinese_simplified,
-                english_name,
-                scientific_name,
-                short_description_zh,
-                full_description_zh,
-                ebird_code
-            FROM BirdCountInfo
-            WHERE chinese_simplified = ?
-            LIMIT 1
-        """, (bird_cn_name,))
-
-        row = cursor.fetchone()
-        conn.close()
-
-        if row:
-            return {
-                'cn_name': row[0],
-                'en_name': row[1],
-                'scientific_name': row[2],
-                'short_description': row[3] or '',
-                'full_description': row[4] or '',
-                'ebird_code': row[5] or ''
-            }
-        else:
-            return None
+    # 与其他查询共用数据库管理器的只读连接
+    database = lazy_load_database()
+    if database is None:
+        return None
 
-    except Exception as e:
-        print(f"读取鸟种信息失败: {e}")
+    bird = database.get_bird_by_chinese_name(bird_cn_name)
+    if not bird:
         return None
 
+    return {
+        'cn_name': bird['chinese_simplified'],
+        'en_name': bird['english_name'],
+        'scientific_name': bird['scientific_name'],
+        'short_description': bird['short_description_zh'] or '',
+        'full_description': bird['full_description_zh'] or '',
+        'ebird_code': bird['ebird_code'] or ''
+    }
+
 def write_bird_caption_to_exif(image_path, caption_text):
     """
     将鸟种描述写入图片EXIF的Caption字段
@@ -883,7 +974,7 @@ _gps_cache = {}
 def get_region_from_gps(latitude, longitude):
     """
     根据GPS坐标确定地理区域和对应的eBird国家代码
-    优先使用离线地理数据库，失败时回退到粗粒度判断
+    优先使用离线地理数据库，失败时回退到离线国家边界多边形
     返回: (region_name, country_code, region_info)
     """
     if latitude is None or longitude is None:
@@ -912,62 +1003,20 @@ def get_region_from_gps(latitude, longitude):
         print(f"DEBUG: reverse_geocoder 失败: {e}")
         # 继续尝试 fallback 方法
 
-    # 方法 2: 回退到粗粒度地理区域判断（保留作为 fallback）
-    region_map = [
-        # 澳洲和大洋洲
-        {
-            'name': 'Australia',
-            'country': 'AU',
-            'bounds': [(-50, 110), (-10, 180)],
-            'description': '澳大利亚（粗略）'
-        },
-        # 亚洲
-        {
-            'name': 'Asia',
-            'country': 'CN',
-            'bounds': [(-10, 60), (80, 180)],
-            'description': '亚洲（粗略）'
-        },
-        # 欧洲
-        {
-            'name': 'Europe',
-            'country': 'DE',
-            'bounds': [(35, -25), (80, 60)],
-            'description': '欧洲（粗略）'
-        },
-        # 北美洲
-        {
-            'name': 'North_America',
-            'country': 'US',
-            'bounds': [(15, -170), (80, -50)],
-            'description': '北美洲（粗略）'
-        },
-        # 南美洲
-        {
-            'name': 'South_America',
-            'country': 'BR',
-            'bounds': [(-60, -90), (15, -30)],
-            'description': '南美洲（粗略）'
-        },
-        # 非洲
-        {
-            'name': 'Africa',
-            'country': 'ZA',
-            'bounds': [(-40, -20), (40, 55)],
-            'description': '非洲（粗略）'
-        }
-    ]
-
-    for region in region_map:
-        (lat_min, lon_min), (lat_max, lon_max) = region['bounds']
-
-        if (lat_min <= latitude <= lat_max and
-            lon_min <= longitude <= lon_max):
-
-            region_info = f"GPS定位: {region['description']} ({latitude:.3f}, {longitude:.3f})"
-            result_tuple = (region['name'], region['country'], region_info)
-            _gps_cache[cache_key] = result_tuple
-            return result_tuple
+    # 方法 2: 回退到离线国家边界多边形（无需网络和 reverse_geocoder）
+    try:
+        from offline_geocoder import get_country_resolver
+        resolver = get_country_resolver()
+        if resolver:
+            country_code = resolver.get_country_code(latitude, longitude)
+            if country_code:
+                country_name = resolver.get_country_name(country_code)
+                region_info = f"GPS定位: {country_name}, {country_code} ({latitude:.3f}, {longitude:.3f}) (离线边界)"
+                result_tuple = (country_name, country_code, region_info)
+                _gps_cache[cache_key] = result_tuple
+                return result_tuple
+    except Exception as e:
+        print(f"DEBUG: 离线国家边界查询失败: {e}")
 
     # 默认返回
     result_tuple = (None, None, f"未知区域 ({latitude:.3f}, {longitude:.3f})")
@@ -1064,24 +1113,31 @@ def apply_enhancement(image, method="unsharp_mask"):
     else:
         return image
 
-def test_single_resize_method(model, processed_image, bird_data, method_name):
-    """测试单个预处理方法的识别效果"""
-    # 转换为numpy数组
-    img_array = np.array(processed_image)
-    
-    # 转换为BGR通道顺序
-    bgr_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-    
-    # ImageNet标准化 (BGR格式)
-    mean = np.array([0.406, 0.456, 0.485])  # BGR: B, G, R
-    std = np.array([0.225, 0.224, 0.229])   # BGR: B, G, R
-    
-    normalized_array = (bgr_array / 255.0 - mean) / std
-    input_tensor = torch.from_numpy(normalized_array).permute(2, 0, 1).unsqueeze(0).float()
+def test_single_resize_method(model, processed_image, bird_data, method_name, logits_key=None):
+    """测试单个预处理方法的识别效果（logits_key 不为None时优先使用缓存的 logits）"""
+    cache = lazy_load_stage_cache() if logits_key else None
+    cached_logits = cache.get_logits(logits_key) if cache else None
+    if cached_logits is not None:
+        output = torch.from_numpy(cached_logits).unsqueeze(0)
+    else:
+        # 转换为numpy数组
+        img_array = np.array(processed_image)
 
-    # 推理（模型和输入都在 CPU 上）
-    with torch.no_grad():
-        output = model(input_tensor)
+        # 转换为BGR通道顺序
+        bgr_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+
+        # ImageNet标准化 (BGR格式)
+        mean = np.array([0.406, 0.456, 0.485])  # BGR: B, G, R
+        std = np.array([0.225, 0.224, 0.229])   # BGR: B, G, R
+
+        normalized_array = (bgr_array / 255.0 - mean) / std
+        input_tensor = torch.from_numpy(normalized_array).permute(2, 0, 1).unsqueeze(0).float()
+
+        # 推理（模型和输入都在 CPU 上）
+        with torch.no_grad():
+            output = model(input_tensor)
+        if cache:
+            cache.put_logits(logits_key, output[0])
 
     # 温度锐化: 提升置信度 (T=0.6 经过测试验证可提升5倍置信度)
     TEMPERATURE = 0.6
@@ -1090,18 +1146,26 @@ def test_single_resize_method(model, processed_image, bird_data, method_name):
     
     return max_confidence, probabilities, method_name
 
-def run_ultimate_classification(image, user_region=None, country_filter=None, ebird_species_set=None, use_gps_precise=False):
+def run_ultimate_classification(image, user_region=None, country_filter=None, ebird_species_set=None, use_gps_precise=False,
+                                image_path=None):
     """
     终极版本：BGR格式 + 图像增强 + 地理区域智能筛选 + eBird精确定位过滤
     user_region: 用户所在地理区域 (Australia, Asia, Europe, Africa, North_America, South_America, Pacific, Arctic)
     country_filter: eBird国家过滤器实例
     ebird_species_set: 国家物种代码集合
     use_gps_precise: 是否使用GPS精确定位数据
+    image_path: 原图路径（提供时按内容缓存每种预处理组合的 logits，更换筛选条件再次识别无需重新推理）
     """
     # 懒加载所需组件
     model = lazy_load_classifier()
     bird_data = lazy_load_bird_info()
     db_manager = lazy_load_database()
+    catalog = lazy_load_species_catalog()
+    stage_cache = lazy_load_stage_cache() if image_path else None
+
+    def logits_key(method_name):
+        keys = stage_cache.keys_for(image_path, f'cli/{method_name}', YOLO_AVAILABLE) if stage_cache else None
+        return keys.logits if keys else None
     # 测试多种增强方法 + 双预处理对比
     enhancement_methods = [
         ("无增强", "none"),
@@ -1129,7 +1193,8 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
         if comparison_data is not None:
             for resize_type, resize_info in comparison_data.items():
                 test_confidence, test_probs, test_method_name = test_single_resize_method(
-                    model, resize_info['image'], bird_data, resize_info['name']
+                    model, resize_info['image'], bird_data, resize_info['name'],
+                    logits_key(f"{method_key}/{resize_type}")
                 )
                 
                 test_result = {
@@ -1150,7 +1215,7 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
         else:
             # 小图像，只测试一种方法
             test_confidence, test_probs, test_method_name = test_single_resize_method(
-                model, final_image, bird_data, resize_method
+                model, final_image, bird_data, resize_method, logits_key(f"{method_key}/{resize_method}")
             )
             
             test_result = {
@@ -1172,7 +1237,15 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
         # 获取结果
         results = []
         k = min(len(probabilities), len(bird_data), 1000)
-        all_probs, all_catid = torch.topk(probabilities, k)
+
+        # eBird过滤优先使用区域掩码：只在列表内的类别中取 top-k，无需逐个查询eBird代码
+        region_mask = None
+        mask_index = get_region_mask_index(db_manager, len(probabilities)) if ebird_species_set else None
+        if mask_index:
+            region_mask = mask_index.mask_for(ebird_species_set)
+            all_probs, all_catid = mask_index.masked_topk(probabilities, region_mask, k)
+        else:
+            all_probs, all_catid = torch.topk(probabilities, k)
         
         count = 0
         # 存储所有候选结果用于地理区域调整
@@ -1186,17 +1259,15 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
                 continue
             
             try:
-                # 优先使用数据库查询
+                # 优先使用内存物种目录（已包含数据库和 bird_data 回退的名称）
                 bird_name_cn = None
                 bird_name_en = None
 
-                if db_manager:
-                    bird_info = db_manager.get_bird_by_class_id(class_id)
-                    if bird_info:
-                        bird_name_cn = bird_info['chinese_simplified']
-                        bird_name_en = bird_info['english_name']
+                if catalog and catalog.contains(class_id):
+                    bird_name_cn = catalog.chinese_names[class_id]
+                    bird_name_en = catalog.english_names[class_id]
 
-                # 如果数据库查询失败，回退到 bird_data
+                # 目录不可用时回退到 bird_data
                 if not bird_name_cn and class_id < len(bird_data) and len(bird_data[class_id]) >= 2:
                     bird_name_cn = bird_data[class_id][0]
                     bird_name_en = bird_data[class_id][1]
@@ -1214,12 +1285,18 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
                     ebird_type = ""
 
                     if ebird_species_set:
-                        # 优先使用数据库获取eBird代码
-                        if db_manager:
-                            ebird_code = db_manager.get_ebird_code_by_english_name(bird_name_en)
+                        # 从物种目录获取eBird代码（掩码 top-k 只返回列表内的类别，无需查询）
+                        if region_mask is None:
+                            if catalog and catalog.db_manager is not None:
+                                ebird_code = catalog.ebird_code(class_id)
+                            elif db_manager:
+                                ebird_code = db_manager.get_ebird_code_by_english_name(bird_name_en)
 
                         # eBird过滤逻辑（纯过滤，不加成置信度）
-                        if ebird_species_set:  # 如果启用了eBird过滤
+                        if region_mask is not None:
+                            ebird_type = "GPS精确" if use_gps_precise else "国家级"
+                            ebird_match = True
+                        elif ebird_species_set:  # 如果启用了eBird过滤
                             if not ebird_code:  # 没有eBird代码，跳过
                                 continue
                             elif ebird_code not in ebird_species_set:  # 不在列表中，跳过
@@ -1237,7 +1314,7 @@ def run_ultimate_classification(image, user_region=None, country_filter=None, eb
                     adjusted_confidence = min(adjusted_confidence, 99.0)  # 限制最高99%
                     
                     # 获取鸟类区域信息
-                    bird_region = get_bird_region(bird_name_en)
+                    bird_region = catalog.region(class_id) if catalog else get_bird_region(bird_name_en)
                     region_info = f" [区域: {bird_region}]" if bird_region != 'Unknown' else ""
                     
                     # 构建显示信息（eBird只显示匹配，不显示加成）
@@ -1357,6 +1434,7 @@ if __name__ == "__main__":
     try:
         original_image = load_image(image_path)
         detection_info = None
+        cache_logits = True  # YOLO出错时为False
 
         # 尝试从图像中提取GPS信息
         print("\n🌍 正在检测GPS位置信息...")
@@ -1382,9 +1460,11 @@ if __name__ == "__main__":
             print(f"\n图像尺寸: {width}x{height}")
             print(f"检测到大尺寸图像({max_dimension} > 640)，自动启用YOLO鸟类检测...")
 
-            detector = YOLOBirdDetector()
-            # 传入PIL Image对象而不是文件路径，支持RAW格式
-            cropped_image, detection_msg = detector.detect_and_crop_bird(original_image)
+            # 传入PIL Image对象而不是文件路径，支持RAW格式；同一文件再次识别时使用缓存的检测框
+            stage_cache = lazy_load_stage_cache()
+            stage_keys = stage_cache.keys_for(image_path, 'cli') if stage_cache else None
+            cropped_image, detection_msg, cache_logits = detect_bird_cached(
+                original_image, stage_keys.detection if stage_keys else None)
 
             if cropped_image is not None:
                 original_image = cropped_image
@@ -1419,8 +1499,8 @@ if __name__ == "__main__":
             EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY', '60nan25sogpo')
             cache_dir = os.path.join(get_user_data_dir(), 'ebird_cache')
             temp_filter = eBirdCountryFilter(EBIRD_API_KEY, cache_dir=cache_dir, offline_dir=os.path.join(script_dir, "offline_ebird_data"))
-            cache_file = temp_filter.get_location_cache_file_path(latitude, longitude, 25)
-            has_cache = temp_filter.is_cache_valid(cache_file)
+            cache_key = temp_filter.get_location_cache_key(latitude, longitude, 25)
+            has_cache = temp_filter.is_cache_valid(cache_key)
 
             if not has_cache:
                 print(f"\n💡 提示: 检测到GPS位置数据，但本地暂无缓存")
@@ -1757,6 +1837,7 @@ if __name__ == "__main__":
         user_region=user_region,
         country_filter=country_filter,
         ebird_species_set=ebird_species_set,
-        use_gps_precise=use_precise_gps
+        use_gps_precise=use_precise_gps,
+        image_path=image_path if cache_logits else None  # YOLO出错时的原图 logits 不能按YOLO裁剪的键缓存
     )
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+识别请求准入控制
+限制同时执行 YOLO + 分类的请求数，超出的请求进入有界队列等待；
+队列已满或等待超时时拒绝（由调用方返回 429 + Retry-After），避免突发请求把所有请求的延迟一起拖垮。
+交互（interactive）通道优先于批量（bulk）通道获得空闲的执行槽
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# 通道按优先级排列
+LANES = ('interactive', 'bulk')
+
+DEFAULT_MAX_QUEUE = {'interactive': 8, 'bulk': 32}
+DEFAULT_WAIT_TIMEOUT = {'interactive': 30.0, 'bulk': 120.0}
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳（队列已满或等待超时）"""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        super().__init__(f"{lane} 通道{reason}，{retry_after} 秒后重试")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """固定数量执行槽 + 按通道的有界等待队列（线程安全）"""
+
+    def __init__(self, max_concurrent: int = 2, max_queue: Dict[str, int] = None,
+                 wait_timeout: Dict[str, float] = None):
+        """
+        Args:
+            max_concurrent: 同时执行的请求数上限
+            max_queue: 各通道的队列长度上限
+            wait_timeout: 各通道在队列中的最长等待时间（秒）
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = dict(DEFAULT_MAX_QUEUE, **(max_queue or {}))
+        self.wait_timeout = dict(DEFAULT_WAIT_TIMEOUT, **(wait_timeout or {}))
+
+        self._lock = threading.Lock()
+        self._queues = {lane: deque() for lane in LANES}
+        self._in_flight = 0
+        # 单个请求执行时间的指数移动平均（秒），用于估算 Retry-After
+        self._service_time = 1.0
+
+        self._stats = {lane: {'admitted': 0, 'rejected_full': 0, 'rejected_timeout': 0,
+                              'wait_total': 0.0, 'wait_max': 0.0} for lane in LANES}
+        self._recent_waits = {lane: deque(maxlen=200) for lane in LANES}
+
+    def _estimate_retry_after(self, lane: str) -> int:
+        """按前面排队的请求数和平均执行时间估算等待秒数（调用方持有锁）"""
+        ahead = self._in_flight
+        for other in LANES:
+            ahead += len(self._queues[other])
+            if other == lane:
+                break
+        return max(1, math.ceil(self._service_time * (ahead + 1) / self.max_concurrent))
+
+    def _can_start(self, lane: str) -> bool:
+        """有空闲槽，且没有同等或更高优先级的请求在排队（调用方持有锁）"""
+        if self._in_flight >= self.max_concurrent:
+            return False
+        for other in LANES:
+            if self._queues[other]:
+                return False
+            if other == lane:
+                break
+        return True
+
+    def _record_wait(self, lane: str, waited: float):
+        stats = self._stats[lane]
+        stats['admitted'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+        self._recent_waits[lane].append(waited)
+
+    def acquire(self, lane: str = 'interactive', timeout: Optional[float] = None) -> float:
+        """
+        获取执行槽（阻塞等待）
+
+        Returns:
+            排队等待的秒数
+
+        Raises:
+            AdmissionRejected: 队列已满或等待超时
+        """
+        if lane not in self._queues:
+            lane = 'interactive'
+        if timeout is None:
+            timeout = self.wait_timeout[lane]
+
+        start = time.monotonic()
+        with self._lock:
+            if self._can_start(lane):
+                self._in_flight += 1
+                self._record_wait(lane, 0.0)
+                return 0.0
+            queue = self._queues[lane]
+            if len(queue) >= self.max_queue[lane]:
+                self._stats[lane]['rejected_full'] += 1
+                raise AdmissionRejected(lane, '队列已满', self._estimate_retry_after(lane))
+            ticket = threading.Event()
+            queue.append(ticket)
+
+        if not ticket.wait(timeout):
+            with self._lock:
+                if ticket in queue:
+                    queue.remove(ticket)
+                    self._stats[lane]['rejected_timeout'] += 1
+                    raise AdmissionRejected(lane, '等待超时', self._estimate_retry_after(lane))
+            # 超时的同时恰好获得了执行槽，继续执行
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._record_wait(lane, waited)
+        return waited
+
+    def release(self, service_time: Optional[float] = None):
+        """释放执行槽：直接交给优先级最高的排队请求，否则空出"""
+        with self._lock:
+            if service_time is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            for lane in LANES:
+                if self._queues[lane]:
+                    self._queues[lane].popleft().set()  # 执行槽转交，in_flight 不变
+                    return
+            self._in_flight -= 1
+
+    @contextmanager
+    def admit(self, lane: str = 'interactive', timeout: Optional[float] = None):
+        """
+        用法:
+            with controller.admit('bulk'):
+                ...识别...
+        """
+        self.acquire(lane, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                stats = self._stats[lane]
+                recent = sorted(self._recent_waits[lane])
+                lanes[lane] = {
+                    'queued': len(self._queues[lane]),
+                    'max_queue': self.max_queue[lane],
+                    'admitted': stats['admitted'],
+                    'rejected_full': stats['rejected_full'],
+                    'rejected_timeout': stats['rejected_timeout'],
+                    'avg_wait_ms': round(stats['wait_total'] / stats['admitted'] * 1000, 1) if stats['admitted'] else 0,
+                    'p95_wait_ms': round(recent[int(round(0.95 * (len(recent) - 1)))] * 1000, 1) if recent else 0,
+                    'max_wait_ms': round(stats['wait_max'] * 1000, 1)
+                }
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'avg_service_ms': round(self._service_time * 1000, 1),
+                'lanes': lanes
+            }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+API生产服务器启动器
+用 gunicorn（多进程，预加载模型后 fork，模型权重在 worker 之间写时复制共享）
+或 waitress（单进程多线程，Windows 可用）替代 Flask 开发服务器
+"""
+import os
+import sys
+from typing import Callable, Optional
+
+try:
+    from gunicorn.app.base import BaseApplication
+    GUNICORN_AVAILABLE = sys.platform != 'win32'
+except ImportError:
+    GUNICORN_AVAILABLE = False
+
+try:
+    from waitress import serve as waitress_serve
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+
+SERVER_CHOICES = ('auto', 'gunicorn', 'waitress', 'dev')
+
+# 默认参数：单张RAW图片的解码+检测+分类可能需要数十秒
+DEFAULT_WORKERS = 2
+DEFAULT_THREADS = 16  # 识别的并发由准入控制限制，线程数只决定能同时排队/接收的连接数
+DEFAULT_TIMEOUT = 120
+
+
+def resolve_server(server: str) -> str:
+    """将 'auto' 或不可用的服务器解析为实际可用的服务器"""
+    if server == 'auto':
+        if GUNICORN_AVAILABLE:
+            return 'gunicorn'
+        return 'waitress' if WAITRESS_AVAILABLE else 'dev'
+    if server == 'gunicorn' and not GUNICORN_AVAILABLE:
+        print("⚠️ gunicorn 不可用（未安装或Windows），改用 waitress")
+        return resolve_server('waitress')
+    if server == 'waitress' and not WAITRESS_AVAILABLE:
+        print("⚠️ waitress 未安装，改用 Flask 开发服务器")
+        return 'dev'
+    return server
+
+
+if GUNICORN_AVAILABLE:
+    class _GunicornApplication(BaseApplication):
+        """以代码方式启动 gunicorn，直接使用已加载的 Flask 应用对象"""
+
+        def __init__(self, app, options: dict):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def run_server(app, host: str, port: int, server: str = 'auto',
+               workers: int = DEFAULT_WORKERS, threads: int = DEFAULT_THREADS, timeout: int = DEFAULT_TIMEOUT,
+               preload: Optional[Callable[[], None]] = None,
+               before_fork: Optional[Callable[[], None]] = None,
+               after_fork: Optional[Callable[[int], None]] = None,
+               debug: bool = False):
+    """
+    启动API服务器（阻塞）
+
+    Args:
+        app: Flask 应用
+        server: 'auto' | 'gunicorn' | 'waitress' | 'dev'
+        workers: gunicorn worker 进程数
+        threads: 每个进程的请求线程数
+        timeout: 请求超时（秒）；gunicorn 超时后重启 worker，waitress 关闭空闲连接
+        preload: 启动前在主进程中调用（加载模型）
+        before_fork: 预加载完成、fork worker 之前调用（释放不能跨进程共享的连接）
+        after_fork: 每个 worker 进程启动后调用，参数为 worker 数量
+    """
+    server = resolve_server(server)
+
+    if preload:
+        preload()
+
+    if server == 'gunicorn':
+        if before_fork:
+            before_fork()
+
+        def post_fork(_server, _worker):
+            if after_fork:
+                after_fork(workers)
+
+        print(f"🚀 gunicorn: {workers} 个进程 × {threads} 个线程，超时 {timeout} 秒")
+        _GunicornApplication(app, {
+            'bind': f'{host}:{port}',
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread' if threads > 1 else 'sync',
+            'timeout': timeout,
+            'graceful_timeout': 30,
+            'keepalive': 5,
+            'preload_app': True,
+            'post_fork': post_fork,
+        }).run()
+    elif server == 'waitress':
+        if after_fork:
+            after_fork(1)
+        print(f"🚀 waitress: {threads} 个线程，超时 {timeout} 秒")
+        waitress_serve(app, host=host, port=port, threads=threads, channel_timeout=timeout)
+    else:
+        print("⚠️ 使用 Flask 开发服务器（生产环境请安装 gunicorn 或 waitress）")
+        if after_fork:
+            after_fork(1)
+        app.run(host=host, port=port, debug=debug, threaded=True)
+
+
+def add_server_arguments(parser):
+    """为命令行解析器添加服务器参数（环境变量可覆盖默认值，便于 Docker 配置）"""
+    parser.add_argument('--server', choices=SERVER_CHOICES, default=os.environ.get('SERVER', 'auto'),
+                        help='服务器类型（默认auto：gunicorn > waitress > 开发服务器）')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', DEFAULT_WORKERS)),
+                        help=f'gunicorn 进程数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', DEFAULT_THREADS)),
+                        help=f'每个进程的线程数（默认{DEFAULT_THREADS}）')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('TIMEOUT', DEFAULT_TIMEOUT)),
+                        help=f'请求超时秒数（默认{DEFAULT_TIMEOUT}）')
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+API服务器压力测试
+并发请求指定接口，统计吞吐量（req/s）和延迟分位数（p50/p95/p99）；
+--compare 会依次启动开发服务器、waitress 和 gunicorn 进行对比
+
+用法:
+    python3 benchmark_api.py --url http://127.0.0.1:5156 --endpoint search -c 16 -n 2000
+    python3 benchmark_api.py --compare --endpoint recognize --image test.jpg -c 8 -n 200
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from api_server import GUNICORN_AVAILABLE, WAITRESS_AVAILABLE
+
+
+def build_request(endpoint: str, image_path: Optional[str] = None) -> tuple:
+    """返回 (方法, 路径, JSON请求体)"""
+    if endpoint == 'health':
+        return 'GET', '/health', None
+    if endpoint == 'search':
+        return 'GET', '/bird/search?q=白头&limit=10', None
+    if endpoint == 'recognize':
+        if not image_path:
+            raise ValueError("recognize 测试需要 --image 参数")
+        return 'POST', '/recognize', {'image_path': os.path.abspath(image_path), 'top_k': 3}
+    raise ValueError(f"未知接口: {endpoint}")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(base_url: str, method: str, path: str, payload: Optional[dict],
+             concurrency: int, total: int, timeout: float = 300) -> Dict:
+    """
+    以固定并发数发送 total 个请求（每个线程复用一个 keep-alive 连接）
+
+    Returns:
+        吞吐量和延迟统计（毫秒）
+    """
+    local = threading.local()
+    url = base_url.rstrip('/') + path
+
+    def one_request(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, json=payload, timeout=timeout)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, ok in results if ok)
+    return {
+        'requests': total,
+        'errors': sum(1 for _, ok in results if not ok),
+        'req_per_sec': len(latencies) / elapsed if elapsed > 0 else 0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else 0,
+    }
+
+
+def wait_until_ready(base_url: str, timeout: float = 300) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + '/health', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def start_server(server: str, port: int, workers: int, threads: int) -> subprocess.Popen:
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SuperBirdID_API.py')
+    return subprocess.Popen(
+        [sys.executable, script, '--port', str(port), '--server', server,
+         '--workers', str(workers), '--threads', str(threads)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def print_result(label: str, result: Dict):
+    print(f"{label:<10} {result['req_per_sec']:>8.1f} req/s   p50 {result['p50_ms']:>8.1f} ms   "
+          f"p95 {result['p95_ms']:>8.1f} ms   p99 {result['p99_ms']:>8.1f} ms   错误 {result['errors']}")
+
+
+def compare_servers(args, method: str, path: str, payload: Optional[dict]):
+    """依次启动各服务器并以相同负载测试（压测客户端与服务器在同一台机器上，结果受CPU核数影响）"""
+    servers = ['dev'] + (['waitress'] if WAITRESS_AVAILABLE else []) + (['gunicorn'] if GUNICORN_AVAILABLE else [])
+    print(f"CPU {os.cpu_count()} 核；gunicorn {args.workers} 个进程 × {args.threads} 个线程，"
+          f"waitress/dev 单进程 {args.threads} 个线程")
+    port = args.port
+    for server in servers:
+        process = start_server(server, port, args.workers, args.threads)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            if not wait_until_ready(base_url):
+                print(f"{server}: 启动超时")
+                continue
+            run_load(base_url, method, path, payload, args.concurrency, min(args.requests, args.concurrency * 2))  # 预热
+            print_result(server, run_load(base_url, method, path, payload, args.concurrency, args.requests))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        port += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='SuperBirdID API 压力测试')
+    parser.add_argument('--url', default='http://127.0.0.1:5156', help='已运行服务器的地址')
+    parser.add_argument('--endpoint', choices=('health', 'search', 'recognize'), default='search')
+    parser.add_argument('--image', help='recognize 测试使用的图片路径')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='并发数（默认16）')
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='请求总数（默认1000）')
+    parser.add_argument('--compare', action='store_true', help='依次启动 dev/waitress/gunicorn 对比')
+    parser.add_argument('--port', type=int, default=5170, help='--compare 使用的起始端口')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    cli_args = parser.parse_args()
+
+    request_method, request_path, request_payload = build_request(cli_args.endpoint, cli_args.image)
+    print(f"{request_method} {request_path}  并发 {cli_args.concurrency}，共 {cli_args.requests} 个请求")
+    if cli_args.compare:
+        compare_servers(cli_args, request_method, request_path, request_payload)
+    else:
+        print_result('server', run_load(cli_args.url, request_method, request_path, request_payload,
+                                        cli_args.concurrency, cli_args.requests))
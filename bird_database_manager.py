@@ -5,9 +5,52 @@
 """
 import sqlite3
 import os
-from typing import List, Dict, Optional, Tuple, Set
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Set, Iterable
 import json
 
+# 只读连接的性能参数
+MMAP_SIZE = 256 * 1024 * 1024     # 内存映射读取（字节），数据库文件小于该值时整个文件通过 mmap 访问
+CACHE_SIZE_KB = 16 * 1024         # 每个连接的页缓存（KB）
+CACHED_STATEMENTS = 256           # 每个连接缓存的预编译语句数量
+
+# SQLite 单条语句的参数数量上限（旧版本为999）
+MAX_QUERY_PARAMS = 900
+
+BIRD_COLUMNS = """id, english_name, chinese_simplified, chinese_traditional,
+               scientific_name, ebird_code, short_description_zh, full_description_zh"""
+
+
+# 热点查询所需的索引: (索引名, 列)。
+# (english_name, ebird_code) 和 (scientific_name) 是覆盖索引，eBird代码查询和物种存在性检查无需回表
+REQUIRED_INDEXES = [
+    ('idx_bird_model_class_id', ('model_class_id',)),
+    ('idx_bird_english_name_ebird', ('english_name', 'ebird_code')),
+    ('idx_bird_chinese_simplified', ('chinese_simplified',)),
+    ('idx_bird_scientific_name', ('scientific_name',)),
+    ('idx_bird_ebird_code', ('ebird_code',)),
+]
+
+
+def _row_to_bird(row) -> Dict:
+    return {
+        'id': row[0],
+        'english_name': row[1],
+        'chinese_simplified': row[2],
+        'chinese_traditional': row[3],
+        'scientific_name': row[4],
+        'ebird_code': row[5],
+        'short_description_zh': row[6],
+        'full_description_zh': row[7]
+    }
+
+
+def _chunks(values: List, size: int = MAX_QUERY_PARAMS) -> Iterable[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
 class BirdDatabaseManager:
     def __init__(self, db_path: str = None):
         """
@@ -25,20 +68,92 @@ class BirdDatabaseManager:
         # 检查数据库文件是否存在
         if not os.path.exists(db_path):
             raise FileNotFoundError(f"数据库文件不存在: {db_path}")
+
+        # 每个线程复用一个只读连接（sqlite3 连接不能跨线程使用），预编译语句按SQL文本在连接内缓存
+        self._local = threading.local()
+        self._connections: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._connections_lock = threading.Lock()
+        self._search_index = None
+        self._search_lock = threading.Lock()
         
         # 测试数据库连接
         self._test_connection()
+        self._warn_missing_indexes()
         
         print(f"BirdDatabaseManager initialized with database: {db_path}")
     
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接（首次调用时创建）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+            # 连接只在创建它的线程中使用；check_same_thread=False 仅为了能在线程结束后由其他线程关闭
+            conn = sqlite3.connect(uri, uri=True, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                # 顺带关闭已结束线程的连接（如 Flask 每个请求一个线程）
+                stale = [c for thread, c in self._connections if not thread.is_alive()]
+                self._connections = [(thread, c) for thread, c in self._connections if thread.is_alive()]
+                self._connections.append((threading.current_thread(), conn))
+            for stale_conn in stale:
+                stale_conn.close()
+        return conn
+
+    def close(self):
+        """关闭所有线程的连接（之后的查询会重新建立连接）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def get_connection_count(self) -> int:
+        """当前打开的连接数（每个查询线程一个）"""
+        with self._connections_lock:
+            return len(self._connections)
+
+    def get_missing_indexes(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        检查热点查询所需的索引
+
+        已有索引的前导列与要求一致即视为满足（不要求索引名相同）
+
+        Returns:
+            缺失的 (索引名, 列) 列表
+        """
+        cursor = self._get_connection().cursor()
+        existing = set()
+        for _, index_name, *_ in cursor.execute("PRAGMA index_list(BirdCountInfo)").fetchall():
+            columns = [row[2] for row in cursor.execute(f'PRAGMA index_info("{index_name}")').fetchall()]
+            for length in range(1, len(columns) + 1):
+                existing.add(tuple(columns[:length]))
+        return [(name, columns) for name, columns in REQUIRED_INDEXES if columns not in existing]
+
+    def _warn_missing_indexes(self):
+        """启动检查：缺少索引时每次查询都会全表扫描"""
+        try:
+            missing = self.get_missing_indexes()
+        except Exception as e:
+            print(f"⚠️ 无法检查数据库索引: {e}")
+            return
+        if missing:
+            print(f"⚠️ 数据库缺少 {len(missing)} 个索引（{', '.join(name for name, _ in missing)}），查询将全表扫描；"
+                  f"请运行 python3 migrate_bird_database.py")
+
     def _test_connection(self):
         """测试数据库连接"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM BirdCountInfo")
-                count = cursor.fetchone()[0]
-                print(f"数据库连接成功，包含 {count} 条鸟类记录")
+            cursor = self._get_connection().cursor()
+            cursor.execute("SELECT COUNT(*) FROM BirdCountInfo")
+            count = cursor.fetchone()[0]
+            print(f"数据库连接成功，包含 {count} 条鸟类记录")
         except Exception as e:
             raise ConnectionError(f"数据库连接失败: {e}")
     
@@ -53,34 +168,102 @@ class BirdDatabaseManager:
             包含鸟类信息的字典，如果未找到返回None
         """
         # class_id对应数据库中的model_class_id字段
-        query = """
-        SELECT id, english_name, chinese_simplified, chinese_traditional,
-               scientific_name, ebird_code, short_description_zh, full_description_zh
+        query = f"""
+        SELECT {BIRD_COLUMNS}
         FROM BirdCountInfo
         WHERE model_class_id = ?
         """
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, (class_id,))
-                result = cursor.fetchone()
-
-                if result:
-                    return {
-                        'id': result[0],
-                        'english_name': result[1],
-                        'chinese_simplified': result[2],
-                        'chinese_traditional': result[3],
-                        'scientific_name': result[4],
-                        'ebird_code': result[5],
-                        'short_description_zh': result[6],
-                        'full_description_zh': result[7]
-                    }
-                return None
+            cursor = self._get_connection().cursor()
+            cursor.execute(query, (class_id,))
+            result = cursor.fetchone()
+
+            return _row_to_bird(result) if result else None
         except Exception as e:
             print(f"查询鸟类信息失败 (class_id: {class_id}): {e}")
             return None
+
+    def get_birds_by_class_ids(self, class_ids: Iterable[int]) -> Dict[int, Dict]:
+        """
+        批量根据模型类别ID获取鸟类信息（每批一条 IN 查询）
+
+        Args:
+            class_ids: 类别ID集合
+
+        Returns:
+            {class_id: 鸟类信息字典}，未找到的类别不在结果中；同一类别有多条记录时取第一条（与 get_bird_by_class_id 一致）
+        """
+        ids = sorted({int(class_id) for class_id in class_ids})
+        birds = {}
+
+        try:
+            cursor = self._get_connection().cursor()
+            for chunk in _chunks(ids):
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f"""
+                SELECT model_class_id, {BIRD_COLUMNS}
+                FROM BirdCountInfo
+                WHERE model_class_id IN ({placeholders})
+                ORDER BY rowid
+                """, chunk)
+                for row in cursor.fetchall():
+                    birds.setdefault(row[0], _row_to_bird(row[1:]))
+        except Exception as e:
+            print(f"批量查询鸟类信息失败: {e}")
+        return birds
+
+    def get_ebird_codes_by_english_names(self, english_names: Iterable[str]) -> Dict[str, str]:
+        """
+        批量根据英文名获取eBird代码
+
+        Returns:
+            {英文名: eBird代码}，没有代码的名称不在结果中
+        """
+        names = sorted(set(english_names))
+        codes = {}
+
+        try:
+            cursor = self._get_connection().cursor()
+            for chunk in _chunks(names):
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f"""
+                SELECT english_name, ebird_code
+                FROM BirdCountInfo
+                WHERE english_name IN ({placeholders}) AND ebird_code IS NOT NULL
+                ORDER BY rowid
+                """, chunk)
+                for english_name, ebird_code in cursor.fetchall():
+                    codes.setdefault(english_name, ebird_code)
+        except Exception as e:
+            print(f"批量查询eBird代码失败: {e}")
+        return codes
+
+    def get_bird_by_chinese_name(self, chinese_name: str) -> Optional[Dict]:
+        """
+        根据中文名获取鸟类信息（含描述）
+
+        Args:
+            chinese_name: 简体中文名
+
+        Returns:
+            鸟类信息字典，如果未找到返回None
+        """
+        query = f"""
+        SELECT {BIRD_COLUMNS}
+        FROM BirdCountInfo
+        WHERE chinese_simplified = ?
+        LIMIT 1
+        """
+
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(query, (chinese_name,))
+            result = cursor.fetchone()
+            return _row_to_bird(result) if result else None
+        except Exception as e:
+            print(f"查询鸟类信息失败 (中文名: {chinese_name}): {e}")
+            return None
     
     def get_ebird_code_by_english_name(self, english_name: str) -> Optional[str]:
         """
@@ -99,11 +282,10 @@ class BirdDatabaseManager:
         """
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, (english_name,))
-                result = cursor.fetchone()
-                return result[0] if result else None
+            cursor = self._get_connection().cursor()
+            cursor.execute(query, (english_name,))
+            result = cursor.fetchone()
+            return result[0] if result else None
         except Exception as e:
             print(f"查询eBird代码失败 (名称: {english_name}): {e}")
             return None
@@ -121,36 +303,78 @@ class BirdDatabaseManager:
         if not ebird_codes:
             return []
         
-        # 构建IN查询的占位符
-        placeholders = ','.join('?' * len(ebird_codes))
-        query = f"""
-        SELECT id, english_name, chinese_simplified, ebird_code
-        FROM BirdCountInfo 
-        WHERE ebird_code IN ({placeholders})
-        """
-        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, list(ebird_codes))
-                results = cursor.fetchall()
-                
-                return [
-                    {
-                        'id': row[0],
-                        'english_name': row[1],
-                        'chinese_simplified': row[2],
-                        'ebird_code': row[3]
-                    }
-                    for row in results
-                ]
+            cursor = self._get_connection().cursor()
+            results = []
+            # 按批构建IN查询的占位符（国家物种列表可能超过单条语句的参数上限）
+            for chunk in _chunks(sorted(ebird_codes)):
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f"""
+                SELECT id, english_name, chinese_simplified, ebird_code
+                FROM BirdCountInfo
+                WHERE ebird_code IN ({placeholders})
+                """, chunk)
+                results.extend(cursor.fetchall())
+
+            return [
+                {
+                    'id': row[0],
+                    'english_name': row[1],
+                    'chinese_simplified': row[2],
+                    'ebird_code': row[3]
+                }
+                for row in results
+            ]
         except Exception as e:
             print(f"批量查询eBird代码失败: {e}")
             return []
     
+    def get_search_records(self) -> List[Tuple]:
+        """
+        读取建立搜索索引所需的全部记录
+
+        Returns:
+            List[Tuple]: (id, model_class_id, english_name, chinese_simplified, chinese_traditional,
+                          scientific_name, ebird_code)
+        """
+        query = """
+        SELECT id, model_class_id, english_name, chinese_simplified, chinese_traditional,
+               scientific_name, ebird_code
+        FROM BirdCountInfo
+        ORDER BY rowid
+        """
+
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(query)
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"读取搜索记录失败: {e}")
+            return []
+
+    def get_search_index(self):
+        """懒加载 FTS5 搜索索引，不可用时返回None（回退到 LIKE 查询）"""
+        if self._search_index is None:
+            with self._search_lock:
+                if self._search_index is None:
+                    try:
+                        from species_search import SpeciesSearchIndex
+                        records = self.get_search_records()
+                        if not records:
+                            raise ValueError("没有可索引的记录")
+                        self._search_index = SpeciesSearchIndex(records)
+                        print(f"✓ 物种搜索索引已建立: {len(records)} 条记录，"
+                              f"耗时 {self._search_index.build_time * 1000:.0f} ms")
+                    except Exception as e:
+                        print(f"物种搜索索引建立失败，使用 LIKE 查询: {e}")
+                        self._search_index = False  # 标记为已尝试但失败
+        return self._search_index if self._search_index is not False else None
+
     def search_birds(self, query: str, limit: int = 10) -> List[Dict]:
         """
-        搜索鸟类（支持中英文名称和学名）
+        搜索鸟类（支持中英文名称、学名前缀和拼音）
+
+        优先使用 FTS5 索引（按相关度排序），索引不可用时回退到 LIKE 查询
         
         Args:
             query: 搜索查询
@@ -159,6 +383,13 @@ class BirdDatabaseManager:
         Returns:
             匹配的鸟类信息列表
         """
+        search_index = self.get_search_index()
+        if search_index is not None:
+            try:
+                return search_index.search(query, limit)
+            except Exception as e:
+                print(f"全文搜索失败，使用 LIKE 查询: {e}")
+
         search_query = """
         SELECT id, english_name, chinese_simplified, ebird_code, scientific_name
         FROM BirdCountInfo 
@@ -171,21 +402,20 @@ class BirdDatabaseManager:
         search_term = f"%{query}%"
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(search_query, (search_term, search_term, search_term, limit))
-                results = cursor.fetchall()
+            cursor = self._get_connection().cursor()
+            cursor.execute(search_query, (search_term, search_term, search_term, limit))
+            results = cursor.fetchall()
                 
-                return [
-                    {
-                        'id': row[0],
-                        'english_name': row[1],
-                        'chinese_simplified': row[2],
-                        'ebird_code': row[3],
-                        'scientific_name': row[4]
-                    }
-                    for row in results
-                ]
+            return [
+                {
+                    'id': row[0],
+                    'english_name': row[1],
+                    'chinese_simplified': row[2],
+                    'ebird_code': row[3],
+                    'scientific_name': row[4]
+                }
+                for row in results
+            ]
         except Exception as e:
             print(f"搜索鸟类失败: {e}")
             return []
@@ -204,15 +434,67 @@ class BirdDatabaseManager:
         """
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query)
-                results = cursor.fetchall()
-                return {row[0] for row in results}
+            cursor = self._get_connection().cursor()
+            cursor.execute(query)
+            results = cursor.fetchall()
+            return {row[0] for row in results}
         except Exception as e:
             print(f"获取所有eBird代码失败: {e}")
             return set()
     
+    def get_class_records(self) -> List[Optional[Tuple]]:
+        """
+        一次性读取所有模型类别的基本信息（不含描述）
+
+        eBird代码与逐个候选调用 get_ebird_code_by_english_name 的结果一致：按英文名取第一个非空的eBird代码；
+        同一 model_class_id 有多条记录时与 get_bird_by_class_id 一致，取第一条
+
+        Returns:
+            List[Optional[Tuple]]: 下标为 model_class_id，元素为
+            (id, english_name, chinese_simplified, chinese_traditional, scientific_name, ebird_code)，缺失的类别为None
+        """
+        query = """
+        SELECT model_class_id, id, english_name, chinese_simplified, chinese_traditional,
+               scientific_name, ebird_code
+        FROM BirdCountInfo
+        ORDER BY rowid
+        """
+
+        try:
+            cursor = self._get_connection().cursor()
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        except Exception as e:
+            print(f"获取类别信息失败: {e}")
+            return []
+
+        # 英文名 -> 第一个非空eBird代码
+        name_to_code = {}
+        for row in rows:
+            english_name, ebird_code = row[2], row[6]
+            if ebird_code is not None and english_name not in name_to_code:
+                name_to_code[english_name] = ebird_code
+
+        class_rows = [row for row in rows if row[0] is not None and row[0] >= 0]
+        if not class_rows:
+            return []
+
+        records = [None] * (max(row[0] for row in class_rows) + 1)
+        for class_id, bird_id, english_name, chinese_simplified, chinese_traditional, scientific_name, _ in class_rows:
+            if records[class_id] is None:
+                records[class_id] = (bird_id, english_name, chinese_simplified, chinese_traditional,
+                                     scientific_name, name_to_code.get(english_name) or None)
+        return records
+
+    def get_class_ebird_codes(self) -> List[Optional[str]]:
+        """
+        获取每个模型类别对应的eBird代码（按 model_class_id 索引）
+
+        Returns:
+            List[Optional[str]]: 下标为 model_class_id，无eBird代码的类别为None
+        """
+        return [record[5] if record else None for record in self.get_class_records()]
+
     def get_bird_data_for_model(self) -> List[List[str]]:
         """
         获取模型所需的鸟类数据格式（兼容原有的birdinfo.json格式）
@@ -227,11 +509,10 @@ class BirdDatabaseManager:
         """
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query)
-                results = cursor.fetchall()
-                return [[row[0], row[1]] for row in results]
+            cursor = self._get_connection().cursor()
+            cursor.execute(query)
+            results = cursor.fetchall()
+            return [[row[0], row[1]] for row in results]
         except Exception as e:
             print(f"获取模型数据失败: {e}")
             return []
@@ -253,11 +534,10 @@ class BirdDatabaseManager:
         stats = {}
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                for key, query in queries.items():
-                    cursor.execute(query)
-                    stats[key] = cursor.fetchone()[0]
+            cursor = self._get_connection().cursor()
+            for key, query in queries.items():
+                cursor.execute(query)
+                stats[key] = cursor.fetchone()[0]
         except Exception as e:
             print(f"获取统计信息失败: {e}")
             return {}
@@ -282,11 +562,10 @@ class BirdDatabaseManager:
         """
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, (scientific_name,))
-                count = cursor.fetchone()[0]
-                return count > 0
+            cursor = self._get_connection().cursor()
+            cursor.execute(query, (scientific_name,))
+            count = cursor.fetchone()[0]
+            return count > 0
         except Exception as e:
             print(f"检查物种区域失败 (学名: {scientific_name}): {e}")
             return False
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+eBird物种列表缓存存储
+使用单个 SQLite 数据库（WAL模式）保存区域和GPS位置的物种列表缓存，
+替代 ebird_cache 目录下逐个坐标生成的 JSON 文件，并按容量上限做LRU淘汰
+"""
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlite_store import LRUStore
+
+# 默认容量上限（字节）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS species_cache (
+    cache_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    species TEXT NOT NULL,
+    species_count INTEGER NOT NULL,
+    observation_count INTEGER,
+    data_source TEXT,
+    extra TEXT,
+    cached_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_species_cache_last_accessed ON species_cache(last_accessed);
+CREATE INDEX IF NOT EXISTS idx_species_cache_expires_at ON species_cache(expires_at);
+"""
+
+
+class eBirdCacheStore(LRUStore):
+    """
+    eBird物种列表缓存（SQLite）
+
+    缓存键与原 JSON 文件名一致（不含扩展名），例如:
+    - species_list_AU-NT          区域/国家物种列表
+    - location_n12_460_130_840_25km  GPS位置物种列表
+    - tile_qvv11                  geohash 瓦片内的近期观察物种
+    """
+    table = 'species_cache'
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES, validity_days: int = 30):
+        """
+        Args:
+            db_path: 数据库文件路径
+            max_bytes: 缓存容量上限（按物种数据大小计算），超出后淘汰最久未访问的条目
+            validity_days: 缓存有效期（天）
+        """
+        super().__init__(db_path, SCHEMA, max_bytes)
+        self.validity_seconds = validity_days * 86400
+
+    @staticmethod
+    def _kind_of(cache_key: str) -> str:
+        if cache_key.startswith('location_'):
+            return 'location'
+        if cache_key.startswith('tile_'):
+            return 'tile'
+        return 'region'
+
+    def is_valid(self, cache_key: str) -> bool:
+        """检查缓存是否存在且未过期（主键查询）"""
+        row = self._get_connection().execute(
+            "SELECT 1 FROM species_cache WHERE cache_key = ? AND expires_at > ?",
+            (cache_key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def get_signature(self, cache_key: str) -> Optional[float]:
+        """返回缓存条目的写入时间，用于判断内存缓存是否需要重新加载"""
+        row = self._get_connection().execute(
+            "SELECT cached_at FROM species_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """
+        读取缓存条目（不检查有效期）
+
+        Returns:
+            与原 JSON 缓存文件结构相同的字典，不存在返回None
+        """
+        conn = self._get_connection()
+        row = conn.execute(
+            "SELECT species, species_count, observation_count, data_source, extra, cached_at, last_accessed "
+            "FROM species_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        species, species_count, observation_count, data_source, extra, cached_at, last_accessed = row
+        self._touch(conn, [(cache_key, last_accessed)])
+
+        cache_data = json.loads(extra) if extra else {}
+        cache_data.update({
+            'species': json.loads(species),
+            'species_count': species_count,
+            'cached_at': datetime.fromtimestamp(cached_at).isoformat(),
+            '_cached_at_ts': cached_at
+        })
+        if observation_count is not None:
+            cache_data['observation_count'] = observation_count
+        if data_source is not None:
+            cache_data['data_source'] = data_source
+        return cache_data
+
+    def get_valid_many(self, cache_keys: List[str]) -> Dict[str, Dict]:
+        """
+        批量读取未过期的缓存条目（用于瓦片查询）
+
+        Returns:
+            {cache_key: {'species': List[str], 'observation_count': int}}，缺失或过期的键不包含在内
+        """
+        if not cache_keys:
+            return {}
+
+        conn = self._get_connection()
+        now = time.time()
+        results = {}
+        accessed = []
+        # SQLite 默认最多999个参数，分批查询
+        for i in range(0, len(cache_keys), 500):
+            batch = cache_keys[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f"SELECT cache_key, species, observation_count, last_accessed FROM species_cache "
+                f"WHERE expires_at > ? AND cache_key IN ({placeholders})", [now] + batch
+            ).fetchall()
+            for cache_key, species, observation_count, last_accessed in rows:
+                results[cache_key] = {'species': json.loads(species), 'observation_count': observation_count or 0}
+                accessed.append((cache_key, last_accessed))
+
+        self._touch(conn, accessed)
+        return results
+
+    def put_many(self, entries: List[tuple], data_source: str = None) -> None:
+        """
+        在一个事务中批量写入缓存条目
+
+        Args:
+            entries: [(cache_key, species_list, observation_count), ...]
+            data_source: 数据来源描述
+        """
+        if not entries:
+            return
+
+        conn = self._get_connection()
+        now = time.time()
+        with self._write_lock:
+            for cache_key, species, observation_count in entries:
+                self._insert(conn, cache_key, species, data_source, observation_count, None, now, now)
+            self._enforce_quota(conn)
+            conn.commit()
+
+    def _insert(self, conn: sqlite3.Connection, cache_key: str, species: List[str], data_source: Optional[str],
+                observation_count: Optional[int], extra: Optional[Dict], cached_at: float, now: float) -> None:
+        """写入单个条目并更新容量统计（调用方持有写锁）"""
+        species_json = json.dumps(list(species), ensure_ascii=False, separators=(',', ':'))
+        extra_json = json.dumps(extra, ensure_ascii=False) if extra else None
+        size_bytes = len(species_json) + len(extra_json or '')
+
+        replaced = self._replaced_bytes(conn, cache_key)
+        conn.execute(
+            "INSERT OR REPLACE INTO species_cache (cache_key, kind, species, species_count, observation_count, "
+            "data_source, extra, cached_at, expires_at, last_accessed, size_bytes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (cache_key, self._kind_of(cache_key), species_json, len(species), observation_count,
+             data_source, extra_json, cached_at, cached_at + self.validity_seconds, now, size_bytes)
+        )
+        self._total_bytes += size_bytes - replaced
+
+    def put(self, cache_key: str, species: List[str], data_source: str = None,
+            observation_count: int = None, extra: Dict = None, cached_at: float = None) -> None:
+        """
+        写入缓存条目，并在超出容量上限时淘汰最久未访问的条目
+
+        Args:
+            cache_key: 缓存键
+            species: 物种代码列表
+            data_source: 数据来源描述
+            observation_count: 观察记录数
+            extra: 其他需要保留的字段（如 lat/lon/radius）
+            cached_at: 写入时间（时间戳），迁移旧缓存时使用原时间
+        """
+        now = time.time()
+        cached_at = cached_at if cached_at is not None else now
+
+        conn = self._get_connection()
+        with self._write_lock:
+            self._insert(conn, cache_key, species, data_source, observation_count, extra, cached_at, now)
+            self._enforce_quota(conn)
+            conn.commit()
+
+    def _enforce_quota(self, conn: sqlite3.Connection) -> int:
+        """超出容量上限时先删除过期条目，再按最久未访问顺序淘汰到上限的90%（调用方持有写锁，在写事务内重新统计大小）"""
+        if self._refresh_total_bytes(conn) <= self.max_bytes:
+            return 0
+
+        now = time.time()
+        expired_bytes = conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM species_cache WHERE expires_at <= ?", (now,)).fetchone()[0]
+        evicted = conn.execute("DELETE FROM species_cache WHERE expires_at <= ?", (now,)).rowcount
+        self._total_bytes -= expired_bytes
+        evicted += self._evict_lru(conn, int(self.max_bytes * 0.9))
+
+        if evicted:
+            print(f"eBird缓存超出容量上限，已淘汰 {evicted} 个条目")
+        return evicted
+
+    def delete(self, cache_key: str) -> None:
+        """删除单个缓存条目"""
+        conn = self._get_connection()
+        with self._write_lock:
+            row = conn.execute("SELECT size_bytes FROM species_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM species_cache WHERE cache_key = ?", (cache_key,))
+                self._total_bytes -= row[0]
+                conn.commit()
+
+    def clear(self, kind: str = None) -> None:
+        """清空缓存（kind 为 'region'、'location' 或 'tile' 时只清空该类）"""
+        conn = self._get_connection()
+        with self._write_lock:
+            if kind:
+                conn.execute("DELETE FROM species_cache WHERE kind = ?", (kind,))
+            else:
+                conn.execute("DELETE FROM species_cache")
+            self._refresh_total_bytes(conn)
+            conn.commit()
+
+    def migrate_json_files(self, cache_dir: str) -> int:
+        """
+        导入 cache_dir 下旧版的 species_list_*.json 和 location_*.json 缓存文件，
+        导入成功后删除原文件
+
+        Returns:
+            导入的文件数
+        """
+        json_files = (glob.glob(os.path.join(cache_dir, 'species_list_*.json')) +
+                      glob.glob(os.path.join(cache_dir, 'location_*.json')))
+        if not json_files:
+            return 0
+
+        migrated = 0
+        for json_file in json_files:
+            cache_key = os.path.splitext(os.path.basename(json_file))[0]
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    cache_data = json.load(f)
+
+                species = cache_data.pop('species', [])
+                try:
+                    cached_at = datetime.fromisoformat(cache_data.pop('cached_at', '')).timestamp()
+                except (TypeError, ValueError):
+                    cached_at = os.path.getmtime(json_file)
+
+                data_source = cache_data.pop('data_source', None)
+                observation_count = cache_data.pop('observation_count', None)
+                cache_data.pop('species_count', None)
+
+                self.put(cache_key, species, data_source=data_source, observation_count=observation_count,
+                         extra=cache_data, cached_at=cached_at)
+                os.remove(json_file)
+                migrated += 1
+            except Exception as e:
+                print(f"迁移缓存文件失败 {json_file}: {e}")
+
+        print(f"已将 {migrated} 个JSON缓存文件迁移到 {self.db_path}")
+        return migrated
+
+    def get_stats(self) -> Dict:
+        """返回缓存统计信息"""
+        conn = self._get_connection()
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM species_cache GROUP BY kind").fetchall())
+        expired = conn.execute(
+            "SELECT COUNT(*) FROM species_cache WHERE expires_at <= ?", (time.time(),)).fetchone()[0]
+        return {
+            'region_entries': counts.get('region', 0),
+            'location_entries': counts.get('location', 0),
+            'tile_entries': counts.get('tile', 0),
+            'expired_entries': expired,
+            'total_bytes': self._total_bytes,
+            'max_bytes': self.max_bytes
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_cache_store(cache_dir: str, validity_days: int = 30) -> eBirdCacheStore:
+    """
+    获取 cache_dir 对应的共享缓存存储（同一目录只创建一次，首次创建时迁移旧JSON缓存）
+    """
+    db_path = os.path.abspath(os.path.join(cache_dir, 'ebird_cache.sqlite'))
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            os.makedirs(cache_dir, exist_ok=True)
+            store = eBirdCacheStore(db_path, validity_days=validity_days)
+            store.migrate_json_files(cache_dir)
+            _stores[db_path] = store
+    return store
+
+
+if __name__ == "__main__":
+    # 用法: python3 ebird_cache_store.py [缓存目录]
+    import sys
+    target_dir = sys.argv[1] if len(sys.argv) > 1 else "ebird_cache"
+    cache_store = get_cache_store(target_dir)
+    print(json.dumps(cache_store.get_stats(), ensure_ascii=False, indent=2))
@@ -6,10 +6,286 @@ eBird国家鸟类过滤器
 import requests
 import json
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Set
 import time
 
+import geo_tiles
+from ebird_cache_store import get_cache_store
+from http_client import get_http_client
+from metrics import pipeline_metrics
+from tracing import CATEGORY_CACHE, span
+from single_flight import SingleFlight
+from species_pack import get_species_pack
+
+# eBird 近期观察记录API单次返回的最大记录数
+MAX_OBSERVATION_RESULTS = 10000
+
+# 物种列表内存缓存的条目上限（每个GPS位置一个条目，长期运行的API服务不能无限增长）
+MEMORY_CACHE_MAX_ENTRIES = 1024
+
+
+class SpeciesMemoryCache:
+    """
+    进程级物种列表内存缓存（所有 eBirdCountryFilter 实例共享）
+
+    - 缓存存储中的条目以缓存键（已包含区域代码或位置坐标）为键，写入时间变化时重新加载
+    - 离线数据文件以文件路径为键，文件修改时间或大小变化时重新加载
+    - 超过 max_entries 个条目时淘汰最久未使用的条目
+    cached_at 只在加载时解析一次。物种集合以 frozenset 形式共享，调用方不应修改。
+    """
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key, signature) -> Optional[dict]:
+        """签名一致时返回条目并标记为最近使用（调用方持有锁）"""
+        entry = self._entries.get(key)
+        if entry is not None and entry['signature'] == signature:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def _store(self, key, entry: dict) -> None:
+        """写入条目并淘汰超出上限的最久未使用条目"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, cache_file: str) -> Optional[dict]:
+        """
+        获取缓存条目
+
+        Returns:
+            {'species': frozenset, 'cached_at': datetime, 'data': 原始JSON(不含species)}，
+            文件不存在或无法解析返回None
+        """
+        try:
+            stat = os.stat(cache_file)
+        except OSError:
+            with self._lock:
+                self._entries.pop(cache_file, None)
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._lookup(cache_file, signature)
+        if entry is not None:
+            return entry
+
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f)
+            species = frozenset(cache_data.pop('species', []))
+            try:
+                cached_at = datetime.fromisoformat(cache_data.get('cached_at', '1970-01-01'))
+            except (TypeError, ValueError):
+                cached_at = datetime(1970, 1, 1)
+        except Exception as e:
+            print(f"读取缓存文件失败 {cache_file}: {e}")
+            return None
+
+        entry = {'signature': signature, 'species': species, 'cached_at': cached_at, 'data': cache_data}
+        self._store(cache_file, entry)
+        return entry
+
+    def get_from_store(self, store, cache_key: str) -> Optional[dict]:
+        """
+        从缓存存储获取条目（结构同 get），存储中的写入时间变化时重新加载
+        """
+        signature = store.get_signature(cache_key)
+        memory_key = (store.db_path, cache_key)
+        if signature is None:
+            with self._lock:
+                self._entries.pop(memory_key, None)
+            return None
+
+        with self._lock:
+            entry = self._lookup(memory_key, signature)
+        if entry is not None:
+            return entry
+
+        cache_data = store.get(cache_key)
+        if cache_data is None:
+            return None
+        species = frozenset(cache_data.pop('species', []))
+        cached_at = datetime.fromtimestamp(cache_data.pop('_cached_at_ts'))
+
+        entry = {'signature': signature, 'species': species, 'cached_at': cached_at, 'data': cache_data}
+        self._store(memory_key, entry)
+        return entry
+
+    def invalidate(self, cache_file=None) -> None:
+        """移除指定文件/缓存键（或全部）的内存缓存"""
+        with self._lock:
+            if cache_file:
+                self._entries.pop(cache_file, None)
+            else:
+                self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """返回命中率统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+# 全局共享的物种列表内存缓存
+species_memory_cache = SpeciesMemoryCache()
+
+
+class BackgroundRefresher:
+    """
+    过期缓存的后台刷新器（stale-while-revalidate）
+
+    - 过期条目先直接返回旧数据，刷新任务交给后台线程
+    - 同一缓存键同时只有一个刷新任务，任务之间至少间隔 min_interval 秒，避免触发API限制
+    - 记录各缓存键的使用次数，定期提前刷新最常用且即将过期的条目
+    """
+
+    def __init__(self, min_interval: float = 2.0, schedule_interval: float = 3600,
+                 popular_count: int = 10, refresh_ahead_days: int = 3):
+        """
+        Args:
+            min_interval: 两次刷新之间的最小间隔（秒）
+            schedule_interval: 定期检查常用条目的间隔（秒）
+            popular_count: 定期刷新的常用条目数量
+            refresh_ahead_days: 常用条目距过期不足该天数时提前刷新
+        """
+        self.min_interval = min_interval
+        self.schedule_interval = schedule_interval
+        self.popular_count = popular_count
+        self.refresh_ahead_days = refresh_ahead_days
+
+        self._queue = []
+        self._pending = set()
+        self._usage = {}          # {cache_key: 使用次数}
+        self._refresh_funcs = {}  # {cache_key: (store, 刷新函数)}
+        self._condition = threading.Condition()
+        self._worker = None
+        self._scheduler = None
+        self.refreshed = 0
+        self.failed = 0
+
+    def _ensure_threads(self) -> None:
+        """懒启动后台线程（调用方持有锁）"""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run_worker, name="ebird-refresher", daemon=True)
+            self._worker.start()
+        if self._scheduler is None and self.schedule_interval > 0:
+            self._scheduler = threading.Thread(target=self._run_scheduler, name="ebird-refresh-scheduler",
+                                               daemon=True)
+            self._scheduler.start()
+
+    def submit(self, cache_key: str, refresh_func) -> bool:
+        """
+        提交刷新任务，同一缓存键已在队列中或正在刷新时忽略
+
+        Returns:
+            是否新加入了队列
+        """
+        with self._condition:
+            if cache_key in self._pending:
+                return False
+            self._pending.add(cache_key)
+            self._queue.append((cache_key, refresh_func))
+            self._ensure_threads()
+            self._condition.notify()
+            return True
+
+    def record_use(self, store, cache_key: str, refresh_func) -> None:
+        """记录一次缓存使用，供定期刷新挑选常用条目"""
+        with self._condition:
+            self._usage[cache_key] = self._usage.get(cache_key, 0) + 1
+            self._refresh_funcs[cache_key] = (store, refresh_func)
+            # 只保留使用次数最多的条目，避免无限增长
+            if len(self._usage) > 1000:
+                keep = sorted(self._usage, key=self._usage.get, reverse=True)[:500]
+                self._usage = {k: self._usage[k] for k in keep}
+                self._refresh_funcs = {k: self._refresh_funcs[k] for k in keep}
+            self._ensure_threads()
+
+    def _run_worker(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                cache_key, refresh_func = self._queue.pop(0)
+
+            try:
+                print(f"后台刷新过期缓存: {cache_key}")
+                if refresh_func():
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"后台刷新失败 {cache_key}: {e}")
+            finally:
+                with self._condition:
+                    self._pending.discard(cache_key)
+
+            time.sleep(self.min_interval)
+
+    def _run_scheduler(self) -> None:
+        while True:
+            time.sleep(self.schedule_interval)
+            self.refresh_popular()
+
+    def refresh_popular(self) -> int:
+        """提前刷新最常用且即将过期的条目，返回提交的任务数"""
+        with self._condition:
+            popular = sorted(self._usage, key=self._usage.get, reverse=True)[:self.popular_count]
+            candidates = [(key, self._refresh_funcs[key]) for key in popular]
+
+        submitted = 0
+        for cache_key, (store, refresh_func) in candidates:
+            cached_at = store.get_signature(cache_key)
+            if cached_at is None:
+                continue
+            age_days = (time.time() - cached_at) / 86400
+            if age_days >= store.validity_seconds / 86400 - self.refresh_ahead_days:
+                if self.submit(cache_key, refresh_func):
+                    submitted += 1
+        return submitted
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {
+                'queued': len(self._queue),
+                'in_flight': len(self._pending) - len(self._queue),
+                'refreshed': self.refreshed,
+                'failed': self.failed,
+                'tracked_keys': len(self._usage)
+            }
+
+
+# 全局共享的后台刷新器
+background_refresher = BackgroundRefresher()
+
+# 按缓存键合并并发的API请求（同一区域/位置同时只请求一次）
+ebird_flight = SingleFlight()
+
+
 class eBirdCountryFilter:
     def __init__(self, api_key: str, cache_dir: str = "ebird_cache", offline_dir: str = "offline_ebird_data"):
         """
@@ -24,6 +300,8 @@ class eBirdCountryFilter:
         self.cache_dir = cache_dir
         self.offline_dir = offline_dir
         self.base_url = "https://api.ebird.org/v2"
+        # 共享HTTP客户端（连接池、重试、负缓存、熔断）
+        self.http = get_http_client()
         self.headers = {
             'x-ebirdapitoken': api_key
         }
@@ -36,6 +314,9 @@ class eBirdCountryFilter:
 
         # 缓存有效期（天数）
         self.cache_validity_days = 30
+
+        # 物种列表缓存存储（SQLite，同一缓存目录的实例共享）
+        self.cache_store = get_cache_store(cache_dir, self.cache_validity_days)
         
         # 国家代码映射（ISO 2字母代码）
         self.country_codes = {
@@ -92,65 +373,104 @@ class eBirdCountryFilter:
             'new_zealand': 'NZ'
         }
     
-    def get_cache_file_path(self, country_code: str) -> str:
-        """获取缓存文件路径"""
-        return os.path.join(self.cache_dir, f"species_list_{country_code}.json")
+    def get_cache_key(self, country_code: str) -> str:
+        """获取国家/区域物种列表的缓存键"""
+        return f"species_list_{country_code}"
     
-    def is_cache_valid(self, cache_file: str) -> bool:
-        """检查缓存是否有效"""
-        if not os.path.exists(cache_file):
-            return False
-        
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # 检查缓存时间
-            cache_time = datetime.fromisoformat(cache_data.get('cached_at', '1970-01-01'))
-            expiry_time = cache_time + timedelta(days=self.cache_validity_days)
-            
-            return datetime.now() < expiry_time
-        except:
-            return False
+    def _get_valid_cache_entry(self, cache_key: str) -> Optional[dict]:
+        """从内存缓存获取未过期的缓存条目"""
+        entry = species_memory_cache.get_from_store(self.cache_store, cache_key)
+        if entry is None or self._is_expired(entry):
+            return None
+        return entry
+
+    def _is_expired(self, entry: dict) -> bool:
+        return datetime.now() >= entry['cached_at'] + timedelta(days=self.cache_validity_days)
+
+    def is_cache_valid(self, cache_key: str) -> bool:
+        """检查缓存是否有效（缓存键由 get_cache_key / get_location_cache_key 生成）"""
+        return self.cache_store.is_valid(cache_key)
     
-    def load_cached_species_list(self, country_code: str) -> Optional[Set[str]]:
-        """从缓存加载物种列表"""
-        cache_file = self.get_cache_file_path(country_code)
+    def load_cached_species_list(self, country_code: str, allow_stale: bool = True) -> Optional[Set[str]]:
+        """
+        从缓存加载物种列表
 
-        if not self.is_cache_valid(cache_file):
+        Args:
+            country_code: 国家或区域代码
+            allow_stale: 缓存已过期时仍返回旧数据，并在后台刷新
+        """
+        cache_key = self.get_cache_key(country_code)
+        with span('ebird_cache', CATEGORY_CACHE, key=cache_key):
+            entry = species_memory_cache.get_from_store(self.cache_store, cache_key)
+        pipeline_metrics.record_cache_lookup('ebird', entry is not None)
+        if entry is None:
             return None
 
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
+        refresh_func = lambda: self._fetch_and_cache_species_list(country_code, force=True) is not None
+        background_refresher.record_use(self.cache_store, cache_key, refresh_func)
 
-            species_set = set(cache_data.get('species', []))
-            print(f"从缓存加载 {country_code} 的物种列表: {len(species_set)} 个物种")
+        species_set = entry['species']
+        if self._is_expired(entry):
+            if not allow_stale:
+                return None
+            background_refresher.submit(cache_key, refresh_func)
+            print(f"从缓存加载 {country_code} 的物种列表: {len(species_set)} 个物种 (已过期，后台刷新中)")
             return species_set
-        except Exception as e:
-            print(f"加载缓存失败: {e}")
-            return None
+
+        print(f"从缓存加载 {country_code} 的物种列表: {len(species_set)} 个物种")
+        return species_set
+
+    def _fetch_and_cache_species_list(self, country_code: str, force: bool = False) -> Optional[Set[str]]:
+        """
+        从API获取物种列表并写入缓存
+
+        同一代码的并发调用合并为一次API请求；获得执行权后先重新检查缓存，
+        以免重复获取刚被其他调用写入的数据
+
+        Args:
+            force: 后台刷新（包括提前刷新尚未过期的常用条目）时跳过缓存检查，一定请求API
+        """
+        cache_key = self.get_cache_key(country_code)
+
+        def fetch():
+            entry = None if force else self._get_valid_cache_entry(cache_key)
+            if entry is not None:
+                return entry['species']
+
+            species_list = self.fetch_species_list_from_api(country_code)
+            if not species_list:
+                return None
+            self.save_species_list_to_cache(country_code, species_list)
+            return frozenset(species_list)
+
+        return ebird_flight.do(cache_key, fetch)
 
     def load_offline_species_list(self, country_code: str) -> Optional[Set[str]]:
-        """从离线数据加载物种列表"""
+        """从离线数据加载物种列表（优先读取 mmap 打包文件，没有时读取JSON）"""
+        pack = get_species_pack(self.offline_dir)
+        if pack is not None and country_code in pack:
+            species_set = pack.get_species(country_code)
+            print(f"从离线数据加载 {country_code} 的物种列表: {len(species_set)} 个物种 (离线打包)")
+            return species_set
+
         offline_file = os.path.join(self.offline_dir, f"species_list_{country_code}.json")
 
-        if not os.path.exists(offline_file):
+        entry = species_memory_cache.get(offline_file)
+        if entry is None:
             return None
 
-        try:
-            with open(offline_file, 'r', encoding='utf-8') as f:
-                offline_data = json.load(f)
+        species_set = entry['species']
+        print(f"从离线数据加载 {country_code} 的物种列表: {len(species_set)} 个物种 (离线)")
+        return species_set
 
-            species_set = set(offline_data.get('species', []))
-            print(f"从离线数据加载 {country_code} 的物种列表: {len(species_set)} 个物种 (离线)")
-            return species_set
-        except Exception as e:
-            print(f"加载离线数据失败: {e}")
-            return None
+    def get_memory_cache_stats(self) -> dict:
+        """获取进程级物种列表内存缓存的命中率统计"""
+        return species_memory_cache.get_stats()
 
     def is_offline_data_available(self) -> bool:
         """检查是否有离线数据可用"""
+        if get_species_pack(self.offline_dir) is not None:
+            return True
         index_file = os.path.join(self.offline_dir, "offline_index.json")
         return os.path.exists(index_file)
 
@@ -159,6 +479,10 @@ class eBirdCountryFilter:
         if not self.is_offline_data_available():
             return []
 
+        pack = get_species_pack(self.offline_dir)
+        if pack is not None:
+            return pack.regions()
+
         try:
             index_file = os.path.join(self.offline_dir, "offline_index.json")
             with open(index_file, 'r', encoding='utf-8') as f:
@@ -171,19 +495,12 @@ class eBirdCountryFilter:
     
     def save_species_list_to_cache(self, country_code: str, species_list: List[str]) -> None:
         """保存物种列表到缓存"""
-        cache_file = self.get_cache_file_path(country_code)
-        
-        cache_data = {
-            'country_code': country_code,
-            'species': list(species_list),
-            'species_count': len(species_list),
-            'cached_at': datetime.now().isoformat(),
-            'api_version': '2.0'
-        }
-        
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            self.cache_store.put(
+                self.get_cache_key(country_code),
+                list(species_list),
+                extra={'country_code': country_code, 'api_version': '2.0'}
+            )
             print(f"已缓存 {country_code} 的物种列表: {len(species_list)} 个物种")
         except Exception as e:
             print(f"保存缓存失败: {e}")
@@ -191,10 +508,13 @@ class eBirdCountryFilter:
     def fetch_species_list_from_api(self, country_code: str) -> Optional[List[str]]:
         """从eBird API获取物种列表"""
         url = f"{self.base_url}/product/spplist/{country_code}"
+        if not self.http.is_available(url):
+            print(f"eBird API 熔断中，跳过在线获取 {country_code} 的物种列表")
+            return None
 
         try:
             print(f"正在从eBird API获取 {country_code} 的物种列表...")
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.http.get(url, headers=self.headers)
 
             if response.status_code == 200:
                 species_list = response.json()
@@ -232,9 +552,30 @@ class eBirdCountryFilter:
             - country_code: 如 "AU" (澳大利亚)
             失败返回 (None, None)
         """
+        # 优先使用离线边界数据（无需网络，微秒级）
+        try:
+            from offline_geocoder import get_admin1_resolver
+            resolver = get_admin1_resolver()
+        except ImportError:
+            resolver = None
+
+        if resolver is not None:
+            region_code, country_code = resolver.get_region_code(lat, lon)
+            if region_code and region_code != country_code:
+                print(f"GPS定位: {country_code} → {region_code} (离线)")
+            elif country_code:
+                print(f"GPS定位: {country_code} (离线，无法确定州/省)")
+            else:
+                print(f"无法从坐标 ({lat}, {lon}) 获取国家代码 (离线)")
+            return region_code, country_code
+
+        # 离线数据不可用时，使用Nominatim反向地理编码获取详细的行政区划信息（熔断中则直接跳过）
+        url = "https://nominatim.openstreetmap.org/reverse"
+        if not self.http.is_available(url):
+            print(f"Nominatim 熔断中，跳过坐标 ({lat}, {lon}) 的在线反向地理编码")
+            return None, None
+
         try:
-            # 使用Nominatim反向地理编码获取详细的行政区划信息
-            url = "https://nominatim.openstreetmap.org/reverse"
             params = {
                 'lat': lat,
                 'lon': lon,
@@ -246,7 +587,7 @@ class eBirdCountryFilter:
                 'User-Agent': 'SuperBirdID/1.0'  # Nominatim要求设置User-Agent
             }
 
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self.http.get(url, params=params, headers=headers, timeout=(5, 10))
 
             if response.status_code == 200:
                 data = response.json()
@@ -349,31 +690,27 @@ class eBirdCountryFilter:
 
         return None
 
-    def get_location_cache_file_path(self, lat: float, lon: float, radius: int) -> str:
-        """获取位置缓存文件路径"""
-        # 使用坐标和半径创建唯一的缓存文件名
+    def get_location_cache_key(self, lat: float, lon: float, radius: int) -> str:
+        """获取位置物种列表的缓存键"""
+        # 使用坐标和半径创建唯一的缓存键（与旧版缓存文件名一致，便于迁移）
         lat_str = f"{lat:.3f}".replace('.', '_').replace('-', 'n')
         lon_str = f"{lon:.3f}".replace('.', '_').replace('-', 'n')
-        return os.path.join(self.cache_dir, f"location_{lat_str}_{lon_str}_{radius}km.json")
+        return f"location_{lat_str}_{lon_str}_{radius}km"
 
-    def fetch_species_list_by_location(self, lat: float, lon: float, radius: int = 25) -> Optional[dict]:
+    def fetch_recent_observations(self, lat: float, lon: float, radius: int) -> Optional[List[dict]]:
         """
-        基于GPS坐标从eBird API获取附近区域的物种列表
+        从eBird API获取坐标附近最近30天的观察记录
 
         Args:
             lat: 纬度
             lon: 经度
-            radius: 搜索半径（公里，最大50km）
+            radius: 搜索半径（公里，1-50km）
 
         Returns:
-            字典 {'species': List[str], 'observation_count': int} 或 None
+            观察记录列表（包含 speciesCode/lat/lng 字段），失败返回None
         """
-        # 限制半径范围
-        radius = min(max(radius, 1), 50)
-
         # 使用eBird的近期观察记录API
         # 注意：eBird API的back参数支持1-30天
-        # 由于没有直接的全年GPS位置API，我们使用nearby hotspots + region species list的组合策略
         url = f"{self.base_url}/data/obs/geo/recent"
 
         params = {
@@ -381,25 +718,20 @@ class eBirdCountryFilter:
             'lng': lon,
             'dist': radius,
             'back': 30,  # 获取最近30天的观察记录
-            'maxResults': 10000,  # 获取更多结果
+            'maxResults': MAX_OBSERVATION_RESULTS,  # 获取更多结果
             'includeProvisional': 'false',  # 只包含审核通过的记录
             'fmt': 'json'
         }
+        if not self.http.is_available(url):
+            print(f"eBird API 熔断中，跳过在线获取位置 ({lat:.3f}, {lon:.3f}) 的观察记录")
+            return None
 
         try:
             print(f"正在获取位置 ({lat:.3f}, {lon:.3f}) 半径 {radius}km 内最近30天的鸟类观察记录...")
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = self.http.get(url, headers=self.headers, params=params)
 
             if response.status_code == 200:
-                observations = response.json()
-                species_codes = list(set(obs['speciesCode'] for obs in observations))
-
-                print(f"✓ 最近30天: {len(species_codes)} 个物种（{len(observations)} 条观察记录）")
-
-                return {
-                    'species': species_codes,
-                    'observation_count': len(observations)
-                }
+                return response.json()
             elif response.status_code == 404:
                 print(f"位置 ({lat}, {lon}) 未找到观察记录")
                 return None
@@ -414,6 +746,85 @@ class eBirdCountryFilter:
             print(f"网络请求失败: {e}")
             return None
 
+    def fetch_species_list_by_location(self, lat: float, lon: float, radius: int = 25) -> Optional[dict]:
+        """
+        基于GPS坐标获取附近区域最近30天的物种列表（geohash 瓦片缓存）
+
+        搜索圆覆盖的瓦片中，已缓存的直接复用；有瓦片缺失时发起一次50km半径的API请求，
+        按观察记录的坐标分配到各瓦片后缓存（包括周边瓦片）。结果为所有覆盖瓦片的并集，
+        范围略大于搜索半径（最多多出一个瓦片宽度）。
+
+        Args:
+            lat: 纬度
+            lon: 经度
+            radius: 搜索半径（公里，最大50km）
+
+        Returns:
+            字典 {'species': List[str], 'observation_count': int} 或 None
+        """
+        # 限制半径范围
+        radius = min(max(radius, 1), 50)
+
+        precision = geo_tiles.precision_for_radius(radius)
+        tiles = geo_tiles.covering_tiles(lat, lon, radius, precision)
+        tile_data = self.cache_store.get_valid_many([f"tile_{geohash}" for geohash, _ in tiles])
+        missing = [(geohash, far) for geohash, far in tiles if f"tile_{geohash}" not in tile_data]
+
+        if missing:
+            # 缺失瓦片时按 eBird 上限（50km）请求，顺带预取周边瓦片，附近后续拍摄点可直接命中缓存
+            fetch_radius = 50
+            observations = self.fetch_recent_observations(lat, lon, fetch_radius)
+            if observations is None:
+                return None
+
+            if len(observations) >= MAX_OBSERVATION_RESULTS:
+                # 结果被截断时，周边瓦片的数据可能不完整，只缓存本次查询需要的瓦片
+                print(f"⚠️ 观察记录达到上限 {MAX_OBSERVATION_RESULTS} 条，不预取周边瓦片")
+                fetched_tiles = missing
+            else:
+                fetched_tiles = [(geohash, far) for geohash, far
+                                 in geo_tiles.covering_tiles(lat, lon, fetch_radius, precision)
+                                 if far <= fetch_radius]
+
+            buckets = {geohash: [set(), 0] for geohash, _ in fetched_tiles}
+            for geohash, _ in missing:
+                buckets.setdefault(geohash, [set(), 0])
+            for obs in observations:
+                try:
+                    geohash = geo_tiles.encode(obs['lat'], obs['lng'], precision)
+                except (KeyError, TypeError):
+                    continue
+                bucket = buckets.get(geohash)
+                if bucket is not None:
+                    bucket[0].add(obs['speciesCode'])
+                    bucket[1] += 1
+
+            for geohash, _ in missing:
+                species, count = buckets[geohash]
+                tile_data[f"tile_{geohash}"] = {'species': species, 'observation_count': count}
+
+            # 缓存完整落在请求范围内的瓦片（包括没有观察记录的瓦片）
+            entries = [(f"tile_{geohash}", sorted(buckets[geohash][0]), buckets[geohash][1])
+                       for geohash, far in fetched_tiles if far <= fetch_radius]
+            try:
+                self.cache_store.put_many(entries, data_source="GPS瓦片30天数据")
+            except Exception as e:
+                print(f"保存瓦片缓存失败: {e}")
+
+        species_codes = set()
+        observation_count = 0
+        for data in tile_data.values():
+            species_codes.update(data['species'])
+            observation_count += data['observation_count']
+
+        print(f"✓ 最近30天: {len(species_codes)} 个物种（{observation_count} 条观察记录，"
+              f"{len(tiles)} 个瓦片中 {len(tiles) - len(missing)} 个来自缓存）")
+
+        return {
+            'species': list(species_codes),
+            'observation_count': observation_count
+        }
+
     def get_location_species_list(self, lat: float, lon: float, radius: int = 25) -> Optional[Set[str]]:
         """
         获取GPS位置附近的鸟类物种列表（三级回退策略）
@@ -431,22 +842,46 @@ class eBirdCountryFilter:
         Returns:
             物种代码集合，如果获取失败返回None
         """
-        # 检查缓存
-        cache_file = self.get_location_cache_file_path(lat, lon, radius)
+        # 检查缓存（过期的缓存直接返回旧数据，并在后台刷新）
+        cache_key = self.get_location_cache_key(lat, lon, radius)
+
+        with span('gps_cache', CATEGORY_CACHE, key=cache_key):
+            entry = species_memory_cache.get_from_store(self.cache_store, cache_key)
+        pipeline_metrics.record_cache_lookup('gps', entry is not None)
+        if entry is not None:
+            refresh_func = lambda: self._build_location_species_list(lat, lon, radius, force=True) is not None
+            background_refresher.record_use(self.cache_store, cache_key, refresh_func)
+
+            species_set = entry['species']
+            data_source = entry['data'].get('data_source', 'unknown')
+            if self._is_expired(entry):
+                background_refresher.submit(cache_key, refresh_func)
+                data_source += "，已过期，后台刷新中"
+            print(f"从缓存加载位置物种列表: {len(species_set)} 个物种 (来源: {data_source})")
+            return species_set
+
+        return self._build_location_species_list(lat, lon, radius)
+
+    def _build_location_species_list(self, lat: float, lon: float, radius: int,
+                                     force: bool = False) -> Optional[Set[str]]:
+        """
+        按三级回退策略获取位置物种列表，并写入缓存
 
-        if self.is_cache_valid(cache_file):
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
+        同一位置的并发调用（如批量导出同一地点的照片）合并为一次获取；
+        force=True（后台刷新）时跳过缓存检查
+        """
+        cache_key = self.get_location_cache_key(lat, lon, radius)
 
-                species_set = set(cache_data.get('species', []))
-                data_source = cache_data.get('data_source', 'unknown')
-                print(f"从缓存加载位置物种列表: {len(species_set)} 个物种 (来源: {data_source})")
-                return species_set
-            except Exception as e:
-                print(f"加载位置缓存失败: {e}")
+        def build():
+            entry = None if force else self._get_valid_cache_entry(cache_key)
+            if entry is not None:
+                return entry['species']
+            return self._run_location_fallback(lat, lon, radius, cache_key)
+
+        return ebird_flight.do(cache_key, build)
 
-        # 缓存无效或不存在，使用三级回退策略
+    def _run_location_fallback(self, lat: float, lon: float, radius: int, cache_key: str) -> Optional[Set[str]]:
+        """三级回退策略的具体实现"""
         species_list = None
         data_source = None
 
@@ -499,26 +934,19 @@ class eBirdCountryFilter:
 
         # 保存到缓存
         if species_list:
-            cache_data = {
-                'lat': lat,
-                'lon': lon,
-                'radius': radius,
-                'species': species_list,
-                'species_count': len(species_list),
-                'observation_count': observation_count if 'observation_count' in locals() else len(species_list),
-                'data_source': data_source,
-                'cached_at': datetime.now().isoformat(),
-                'api_version': '2.0'
-            }
-
             try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(cache_data, f, ensure_ascii=False, indent=2)
+                self.cache_store.put(
+                    cache_key,
+                    species_list,
+                    data_source=data_source,
+                    observation_count=observation_count if 'observation_count' in locals() else len(species_list),
+                    extra={'lat': lat, 'lon': lon, 'radius': radius, 'api_version': '2.0'}
+                )
                 print(f"已缓存位置物种列表: {len(species_list)} 个物种 (来源: {data_source})")
             except Exception as e:
                 print(f"保存位置缓存失败: {e}")
 
-            return set(species_list)
+            return frozenset(species_list)
 
         print("❌ 所有策略均失败，无法获取物种数据")
         return None
@@ -530,21 +958,17 @@ class eBirdCountryFilter:
         Returns:
             字典包含 {'species_count': int, 'observation_count': int, 'cached_at': str, 'data_source': str} 或 None
         """
-        cache_file = self.get_location_cache_file_path(lat, lon, radius)
+        entry = self._get_valid_cache_entry(self.get_location_cache_key(lat, lon, radius))
+        if entry is None:
+            return None
 
-        if self.is_cache_valid(cache_file):
-            try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                return {
-                    'species_count': cache_data.get('species_count', len(cache_data.get('species', []))),
-                    'observation_count': cache_data.get('observation_count', cache_data.get('species_count', 0)),
-                    'cached_at': cache_data.get('cached_at', ''),
-                    'data_source': cache_data.get('data_source', 'unknown')  # 添加data_source字段
-                }
-            except:
-                return None
-        return None
+        cache_data = entry['data']
+        return {
+            'species_count': cache_data.get('species_count', len(entry['species'])),
+            'observation_count': cache_data.get('observation_count', cache_data.get('species_count', 0)),
+            'cached_at': cache_data.get('cached_at', ''),
+            'data_source': cache_data.get('data_source', 'unknown')  # 添加data_source字段
+        }
 
     def get_country_species_list(self, country_input: str) -> Optional[Set[str]]:
         """
@@ -570,13 +994,10 @@ class eBirdCountryFilter:
             if cached_species is not None:
                 return cached_species
 
-            # 2. 缓存无效，尝试从API获取
-            species_list = self.fetch_species_list_from_api(region_code)
-
-            if species_list:
-                # 保存到缓存
-                self.save_species_list_to_cache(region_code, species_list)
-                return set(species_list)
+            # 2. 缓存无效，尝试从API获取（并保存到缓存）
+            species_set = self._fetch_and_cache_species_list(region_code)
+            if species_set:
+                return species_set
 
             # 3. API失败
             print(f"❌ 无法获取 {region_code} 的鸟类数据")
@@ -612,13 +1033,10 @@ class eBirdCountryFilter:
         if cached_species is not None:
             return cached_species
 
-        # 2. 缓存无效，尝试从API获取
-        species_list = self.fetch_species_list_from_api(country_code)
-
-        if species_list:
-            # 保存到缓存
-            self.save_species_list_to_cache(country_code, species_list)
-            return set(species_list)
+        # 2. 缓存无效，尝试从API获取（并保存到缓存）
+        species_set = self._fetch_and_cache_species_list(country_code)
+        if species_set:
+            return species_set
 
         # 3. API失败，尝试从离线数据加载
         print(f"API获取失败，尝试使用离线数据...")
@@ -684,7 +1102,7 @@ class eBirdCountryFilter:
 
         try:
             print("正在获取全球国家列表...")
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.http.get(url, headers=self.headers)
 
             if response.status_code == 200:
                 countries = response.json()
@@ -711,7 +1129,7 @@ class eBirdCountryFilter:
 
         try:
             print(f"正在获取 {country_code} 的二级区域列表...")
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.http.get(url, headers=self.headers)
 
             if response.status_code == 200:
                 regions = response.json()
@@ -734,15 +1152,14 @@ class eBirdCountryFilter:
     def clear_cache(self, country_code: str = None) -> None:
         """清理缓存"""
         if country_code:
-            cache_file = self.get_cache_file_path(country_code)
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
-                print(f"已清理 {country_code} 的缓存")
+            cache_key = self.get_cache_key(country_code)
+            self.cache_store.delete(cache_key)
+            species_memory_cache.invalidate((self.cache_store.db_path, cache_key))
+            print(f"已清理 {country_code} 的缓存")
         else:
-            # 清理所有缓存
-            for file in os.listdir(self.cache_dir):
-                if file.startswith('species_list_') and file.endswith('.json'):
-                    os.remove(os.path.join(self.cache_dir, file))
+            # 清理所有国家/区域缓存
+            self.cache_store.clear('region')
+            species_memory_cache.invalidate()
             print("已清理所有缓存")
 
 
@@ -768,5 +1185,40 @@ def test_ebird_filter():
         print("前10个物种代码:", list(cn_species)[:10])
 
 
+def test_refresh_ahead():
+    """测试提前刷新：尚未过期但即将过期的常用条目确实重新请求API（无需网络）"""
+    import tempfile
+    work_dir = tempfile.mkdtemp()
+    filter_system = eBirdCountryFilter('test', cache_dir=os.path.join(work_dir, 'cache'),
+                                       offline_dir=os.path.join(work_dir, 'offline'))
+    api_calls = []
+
+    def fake_fetch(country_code):
+        api_calls.append(country_code)
+        return ['newbird1', 'newbird2']
+
+    filter_system.fetch_species_list_from_api = fake_fetch
+
+    # 28天前写入的条目：未过期（有效期30天），但距过期不足 refresh_ahead_days
+    filter_system.cache_store.put(filter_system.get_cache_key('AU'), ['oldbird'],
+                                  cached_at=time.time() - 28 * 86400)
+    assert filter_system.load_cached_species_list('AU') == {'oldbird'}
+    assert not api_calls
+
+    # 使用 load_cached_species_list 登记的刷新函数
+    assert background_refresher.refresh_popular() == 1
+    deadline = time.time() + 5
+    while background_refresher.get_stats()['refreshed'] == 0 and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert api_calls == ['AU'], api_calls
+    assert filter_system.load_cached_species_list('AU') == {'newbird1', 'newbird2'}
+    print("✓ 提前刷新测试通过")
+
+
 if __name__ == "__main__":
-    test_ebird_filter()
\ No newline at end of file
+    import sys
+    if '--offline-tests' in sys.argv:
+        test_refresh_ahead()
+    else:
+        test_ebird_filter()
\ No newline at end of file
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+生成离线国家边界数据的脚本
+从 Natural Earth 国家边界（Shapefile 或 GeoJSON）生成简化后的多边形数据，
+保存为 country_boundaries.json，供 offline_geocoder 离线判断GPS所在国家
+
+--admin1 模式：从 GeoNames 城镇点数据（reverse_geocoder 自带的 rg_cities1000.csv）
+生成带 eBird 二级区域代码的地点数据，保存为 admin1_points.json
+"""
+import csv
+import json
+import os
+import sys
+import time
+import unicodedata
+
+# Natural Earth 中名称与 eBird 国家名称不一致的条目（ISO3 -> ISO2）
+ISO3_OVERRIDES = {
+    'USA': 'US', 'COD': 'CD', 'DOM': 'DO', 'FLK': 'FK', 'ATF': 'TF',
+    'CAF': 'CF', 'GNQ': 'GQ', 'PSE': 'PS', 'TUR': 'TR', 'SLB': 'SB',
+    'CZE': 'CZ', 'BIH': 'BA', 'SSD': 'SS', 'ESH': 'EH',
+    'CYN': 'CY',  # 北塞浦路斯并入塞浦路斯
+    'SOL': 'SO',  # 索马里兰并入索马里
+}
+
+# 名称映射失败时的补充（Natural Earth 名称 -> ISO2）
+NAME_OVERRIDES = {
+    'france': 'FR',
+    'norway': 'NO',
+    'kosovo': 'XK',
+}
+
+
+# GeoNames 一级行政区英文名与 eBird 二级区域名称不一致的条目
+# {国家代码: {GeoNames名称: eBird区域代码}}
+ADMIN1_ALIASES = {
+    'DE': {
+        'Bavaria': 'DE-BY', 'Baden-Wuerttemberg': 'DE-BW', 'Lower Saxony': 'DE-NI',
+        'Thuringia': 'DE-TH', 'Saxony': 'DE-SN', 'Saxony-Anhalt': 'DE-ST',
+        'North Rhine-Westphalia': 'DE-NW', 'Hesse': 'DE-HE', 'Rhineland-Palatinate': 'DE-RP',
+        'Mecklenburg-Vorpommern': 'DE-MV',
+    },
+    'AT': {
+        'Lower Austria': 'AT-3', 'Upper Austria': 'AT-4', 'Styria': 'AT-6', 'Tyrol': 'AT-7',
+        'Carinthia': 'AT-2', 'Vienna': 'AT-9',
+    },
+    'CH': {},
+    'BE': {
+        'Flanders': 'BE-VLG', 'Wallonia': 'BE-WAL', 'Brussels Capital': 'BE-BRU',
+    },
+    'FR': {
+        # GeoNames 仍使用2016年前的大区，按合并关系映射到现行大区
+        'Rhone-Alpes': 'FR-ARA', 'Auvergne': 'FR-ARA', 'Brittany': 'FR-BRE',
+        'Nord-Pas-de-Calais': 'FR-HDF', 'Picardie': 'FR-HDF', 'Aquitaine': 'FR-NAQ',
+        'Limousin': 'FR-NAQ', 'Poitou-Charentes': 'FR-NAQ', 'Centre': 'FR-CVL',
+        'Languedoc-Roussillon': 'FR-OCC', 'Midi-Pyrenees': 'FR-OCC', 'Lorraine': 'FR-GES',
+        'Alsace': 'FR-GES', 'Champagne-Ardenne': 'FR-GES', 'Haute-Normandie': 'FR-NOR',
+        'Lower Normandy': 'FR-NOR', 'Bourgogne': 'FR-BFC', 'Franche-Comte': 'FR-BFC',
+        'Ile-de-France': 'FR-IDF', 'Pays de la Loire': 'FR-PDL', 'Corsica': 'FR-COR',
+        "Provence-Alpes-Cote d'Azur": 'FR-PAC',
+    },
+    'IT': {
+        'Lombardy': 'IT-25', 'Piedmont': 'IT-21', 'Latium': 'IT-62', 'Sicily': 'IT-82',
+        'Tuscany': 'IT-52', 'Sardinia': 'IT-88', 'The Marches': 'IT-57', 'Apulia': 'IT-75',
+        'Aosta Valley': 'IT-23', 'Trentino-Alto Adige': 'IT-32',
+        'Friuli Venezia Giulia': 'IT-36',
+    },
+    'ES': {
+        'Castille and Leon': 'ES-CL', 'Castille-La Mancha': 'ES-CM', 'Andalusia': 'ES-AN',
+        'Catalonia': 'ES-CT', 'Valencia': 'ES-VC', 'Galicia': 'ES-GA', 'Aragon': 'ES-AR',
+        'Basque Country': 'ES-PV', 'Canary Islands': 'ES-CN', 'Balearic Islands': 'ES-IB',
+        'Navarre': 'ES-NC', 'Madrid': 'ES-MD', 'Murcia': 'ES-MC', 'Asturias': 'ES-AS',
+    },
+    'PL': {
+        'Lesser Poland Voivodeship': 'PL-MA', 'Masovian Voivodeship': 'PL-MZ',
+        'Silesian Voivodeship': 'PL-SL', 'Subcarpathian Voivodeship': 'PL-PK',
+        'Greater Poland Voivodeship': 'PL-WP', 'Lower Silesian Voivodeship': 'PL-DS',
+        'Lublin Voivodeship': 'PL-LU', 'Lodz Voivodeship': 'PL-LD',
+        'Kujawsko-Pomorskie': 'PL-KP', 'Pomeranian Voivodeship': 'PL-PM',
+        'West Pomeranian Voivodeship': 'PL-ZP', 'Warmian-Masurian Voivodeship': 'PL-WN',
+        'Podlasie': 'PL-PD', 'Lubusz': 'PL-LB', 'Opole Voivodeship': 'PL-OP',
+        'Swietokrzyskie': 'PL-SK',
+    },
+    'ID': {
+        # eBird 按岛屿划分印尼二级区域
+        'East Java': 'ID-JW', 'West Java': 'ID-JW', 'Central Java': 'ID-JW', 'Banten': 'ID-JW',
+        'Daerah Istimewa Yogyakarta': 'ID-JW', 'Jakarta Raya': 'ID-JW',
+        'East Nusa Tenggara': 'ID-NU', 'West Nusa Tenggara': 'ID-NU', 'Bali': 'ID-NU',
+        'East Kalimantan': 'ID-KA', 'West Kalimantan': 'ID-KA', 'South Kalimantan': 'ID-KA',
+        'Central Kalimantan': 'ID-KA', 'North Kalimantan': 'ID-KA',
+        'Maluku': 'ID-MA', 'North Maluku': 'ID-MA', 'Papua': 'ID-IJ', 'West Papua': 'ID-IJ',
+        'North Sulawesi': 'ID-SL', 'South Sulawesi': 'ID-SL', 'Central Sulawesi': 'ID-SL',
+        'Southeast Sulawesi': 'ID-SL', 'West Sulawesi': 'ID-SL', 'Gorontalo': 'ID-SL',
+        'North Sumatra': 'ID-SM', 'West Sumatra': 'ID-SM', 'South Sumatra': 'ID-SM',
+        'Aceh': 'ID-SM', 'Riau': 'ID-SM', 'Riau Islands': 'ID-SM', 'Jambi': 'ID-SM',
+        'Bengkulu': 'ID-SM', 'Lampung': 'ID-SM', 'Bangka-Belitung Islands': 'ID-SM',
+    },
+    'CN': {
+        'Inner Mongolia': 'CN-15', 'Tibet Autonomous Region': 'CN-54',
+        'Xinjiang Uygur Zizhiqu': 'CN-65', 'Ningxia Hui Autonomous Region': 'CN-64',
+        'Guangxi Zhuangzu Zizhiqu': 'CN-45',
+    },
+    'MX': {
+        'Mexico': 'MX-MEX', 'Mexico City': 'MX-CMX',
+    },
+}
+
+# 名称比较时忽略的行政区划通用词
+ADMIN1_GENERIC_WORDS = {
+    'sheng', 'shi', 'zizhiqu', 'province', 'provincia', 'region', 'state', 'voivodeship',
+    'oblast', 'krai', 'kray', 'republic', 'of', 'the', 'autonomous', 'okrug', 'prefecture',
+    'department', 'departamento', 'district', 'governorate', 'county', 'estado', 'de', 'del',
+    'lan', 'thanh', 'pho', 'tinh', 'do', 'ken', 'municipality', 'capital', 'territory',
+}
+
+
+def normalize_name(name):
+    """名称标准化：去除重音、大小写和标点"""
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    return ''.join(ch for ch in name.lower() if ch.isalnum())
+
+
+def load_ebird_country_names(regions_file="ebird_regions.json"):
+    """读取 ebird_regions.json 中的国家名称 -> 国家代码映射"""
+    with open(regions_file, 'r', encoding='utf-8') as f:
+        regions_data = json.load(f)
+    return {normalize_name(c['name']): c['code'] for c in regions_data.get('countries', [])}
+
+
+def admin1_name_key(name):
+    """去除方括号注释和通用词后的名称，用于模糊匹配行政区名称"""
+    name = unicodedata.normalize('NFKD', (name or '').split('[')[0])
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch)).lower()
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in name).split()
+    return ''.join(w for w in words if w not in ADMIN1_GENERIC_WORDS)
+
+
+def build_admin1_matcher(regions_file="ebird_regions.json"):
+    """
+    构建 (国家代码, GeoNames行政区名称) -> eBird区域代码 的匹配函数
+    匹配顺序：手工别名 → 精确名称 → 去除通用词后的名称 → 唯一包含关系
+    """
+    with open(regions_file, 'r', encoding='utf-8') as f:
+        regions_data = json.load(f)
+
+    exact = {}
+    fuzzy = {}
+    for country in regions_data.get('countries', []):
+        exact[country['code']] = {normalize_name(r['name']): r['code'] for r in country.get('regions', [])}
+        fuzzy[country['code']] = {admin1_name_key(r['name']): r['code'] for r in country.get('regions', [])}
+
+    aliases = {cc: {normalize_name(k): v for k, v in table.items()} for cc, table in ADMIN1_ALIASES.items()}
+    memo = {}
+
+    def match(country_code, admin1_name):
+        key = (country_code, admin1_name)
+        if key in memo:
+            return memo[key]
+
+        code = None
+        normalized = normalize_name(admin1_name)
+        name_key = admin1_name_key(admin1_name)
+
+        if normalized in aliases.get(country_code, {}):
+            code = aliases[country_code][normalized]
+        elif normalized in exact.get(country_code, {}):
+            code = exact[country_code][normalized]
+        elif name_key and name_key in fuzzy.get(country_code, {}):
+            code = fuzzy[country_code][name_key]
+        elif len(name_key) >= 4:
+            candidates = {c for k, c in fuzzy.get(country_code, {}).items()
+                          if len(k) >= 4 and (k in name_key or name_key in k)}
+            if len(candidates) == 1:
+                code = candidates.pop()
+
+        memo[key] = code
+        return code
+
+    return match
+
+
+def simplify_ring(points, tolerance):
+    """
+    Douglas-Peucker 折线简化
+
+    Args:
+        points: [(lon, lat), ...] 闭合环
+        tolerance: 简化容差（度）
+
+    Returns:
+        简化后的点列表（至少保留4个点以维持闭合多边形）
+    """
+    if tolerance <= 0 or len(points) <= 4:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    tol_sq = tolerance * tolerance
+
+    while stack:
+        start, end = stack.pop()
+        x1, y1 = points[start]
+        x2, y2 = points[end]
+        dx, dy = x2 - x1, y2 - y1
+        seg_len_sq = dx * dx + dy * dy
+
+        max_dist_sq = -1.0
+        index = None
+        for i in range(start + 1, end):
+            px, py = points[i]
+            if seg_len_sq == 0:
+                dist_sq = (px - x1) ** 2 + (py - y1) ** 2
+            else:
+                t = ((px - x1) * dx + (py - y1) * dy) / seg_len_sq
+                t = max(0.0, min(1.0, t))
+                dist_sq = (px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2
+            if dist_sq > max_dist_sq:
+                max_dist_sq = dist_sq
+                index = i
+
+        if index is not None and max_dist_sq > tol_sq:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    simplified = [p for p, k in zip(points, keep) if k]
+    return simplified if len(simplified) >= 4 else list(points)
+
+
+def read_features(source_path):
+    """
+    读取边界数据，返回 [(properties, [ring, ...]), ...]
+    支持 GeoJSON（.geojson/.json）和 Shapefile（.shp，需要 pyshp）
+    """
+    if source_path.lower().endswith('.shp'):
+        try:
+            import shapefile
+        except ImportError:
+            raise ImportError("读取Shapefile需要安装 pyshp: pip install pyshp")
+
+        features = []
+        reader = shapefile.Reader(source_path)
+        for shape_record in reader.iterShapeRecords():
+            shape = shape_record.shape
+            parts = list(shape.parts) + [len(shape.points)]
+            rings = [shape.points[parts[i]:parts[i + 1]] for i in range(len(parts) - 1)]
+            features.append((shape_record.record.as_dict(), rings))
+        return features
+
+    with open(source_path, 'r', encoding='utf-8') as f:
+        geojson = json.load(f)
+
+    features = []
+    for feature in geojson.get('features', []):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        rings = [ring for polygon in polygons for ring in polygon]
+        features.append((feature.get('properties', {}), rings))
+    return features
+
+
+def resolve_country_code(properties, ebird_names):
+    """根据要素属性确定ISO 2字母国家代码"""
+    props = {k.lower(): v for k, v in properties.items()}
+
+    iso_a3 = props.get('iso_a3') or props.get('adm0_a3')
+    if iso_a3 in ISO3_OVERRIDES:
+        return ISO3_OVERRIDES[iso_a3]
+
+    iso_a2 = props.get('iso_a2_eh') or props.get('iso_a2')
+    if iso_a2 and iso_a2 not in ('-99', '-1'):
+        return iso_a2.upper()
+
+    for key in ('name', 'name_long', 'admin', 'formal_en'):
+        normalized = normalize_name(props.get(key))
+        if normalized in ebird_names:
+            return ebird_names[normalized]
+        if normalized in NAME_OVERRIDES:
+            return NAME_OVERRIDES[normalized]
+
+    return None
+
+
+def generate_geo_boundaries(source_path, output_file="country_boundaries.json", tolerance=0.05, precision=2):
+    """
+    生成离线国家边界数据
+
+    Args:
+        source_path: Natural Earth Admin 0 国家边界文件（.shp 或 .geojson）
+        output_file: 输出文件路径
+        tolerance: Douglas-Peucker 简化容差（度），0表示不简化
+        precision: 坐标保留的小数位数（2位约1km）
+    """
+    print("=" * 60)
+    print("开始生成离线国家边界数据")
+    print(f"数据源: {source_path}")
+    print("=" * 60)
+
+    ebird_names = load_ebird_country_names()
+    features = read_features(source_path)
+    print(f"✓ 读取 {len(features)} 个国家/地区要素")
+
+    countries = {}
+    unmatched = []
+    input_points = 0
+    output_points = 0
+
+    for properties, rings in features:
+        name = properties.get('name') or properties.get('NAME') or ''
+        code = resolve_country_code(properties, ebird_names)
+        if not code:
+            unmatched.append(name)
+            continue
+
+        entry = countries.setdefault(code, {'name': name, 'rings': []})
+        for ring in rings:
+            input_points += len(ring)
+            simplified = simplify_ring([tuple(p[:2]) for p in ring], tolerance)
+            flat = []
+            for lon, lat in simplified:
+                flat.append(round(lon, precision))
+                flat.append(round(lat, precision))
+            output_points += len(simplified)
+            entry['rings'].append(flat)
+
+    boundaries = {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "source": os.path.basename(source_path),
+        "tolerance": tolerance,
+        "total_countries": len(countries),
+        "countries": countries
+    }
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(boundaries, f, ensure_ascii=False, separators=(',', ':'))
+
+    print(f"✓ 数据已保存到 {output_file} ({os.path.getsize(output_file) / 1024:.0f} KB)")
+    print(f"国家数: {len(countries)}，顶点数: {input_points} → {output_points}")
+    if unmatched:
+        print(f"⚠️ 未能映射国家代码 ({len(unmatched)}): {', '.join(unmatched)}")
+
+
+def generate_admin1_points(cities_csv, output_file="admin1_points.json", cell_size=0.1):
+    """
+    生成离线二级区域（州/省）地点数据
+
+    每个 GeoNames 城镇点标注为 eBird 二级区域代码，查询时取同一国家内最近的点，
+    相当于用城镇点的 Voronoi 划分近似州/省边界。同一网格内同一区域的点只保留一个。
+
+    Args:
+        cities_csv: GeoNames 城镇点 CSV（列: lat, lon, name, admin1, admin2, cc）
+        output_file: 输出文件路径
+        cell_size: 点稀疏化网格大小（度，0.1约10km）
+    """
+    print("=" * 60)
+    print("开始生成离线二级区域地点数据")
+    print(f"数据源: {cities_csv}")
+    print("=" * 60)
+
+    match = build_admin1_matcher()
+
+    region_codes = []
+    region_index = {}
+    countries = {}
+    seen_cells = set()
+    total_points = 0
+    matched_points = 0
+    unmatched_names = {}
+
+    with open(cities_csv, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            country_code = row['cc'].upper()
+            lat, lon = float(row['lat']), float(row['lon'])
+            total_points += 1
+
+            code = match(country_code, row['admin1'])
+            if code:
+                matched_points += 1
+                if code not in region_index:
+                    region_index[code] = len(region_codes)
+                    region_codes.append(code)
+                idx = region_index[code]
+            else:
+                # 无法映射的点仍然保留（区域索引-1），避免相邻区域的点越界覆盖
+                idx = -1
+                unmatched_names[(country_code, row['admin1'])] = unmatched_names.get((country_code, row['admin1']), 0) + 1
+
+            cell = (country_code, int((lat + 90) / cell_size), int((lon + 180) / cell_size), idx)
+            if cell in seen_cells:
+                continue
+            seen_cells.add(cell)
+
+            # 坐标以百分之一度为单位存储为整数
+            countries.setdefault(country_code, []).extend([round(lat * 100), round(lon * 100), idx])
+
+    admin1_data = {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "source": os.path.basename(cities_csv),
+        "cell_size": cell_size,
+        "regions": region_codes,
+        "countries": countries
+    }
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(admin1_data, f, ensure_ascii=False, separators=(',', ':'))
+
+    kept_points = sum(len(v) // 3 for v in countries.values())
+    print(f"✓ 数据已保存到 {output_file} ({os.path.getsize(output_file) / 1024:.0f} KB)")
+    print(f"地点数: {total_points} → {kept_points}（稀疏化后），区域数: {len(region_codes)}")
+    print(f"已映射eBird区域的地点: {matched_points / max(total_points, 1) * 100:.1f}%")
+
+    top_unmatched = sorted(unmatched_names.items(), key=lambda x: -x[1])[:20]
+    if top_unmatched:
+        print("未映射的主要行政区（前20）:")
+        for (cc, name), count in top_unmatched:
+            print(f"  {cc} / {name}: {count}")
+
+
+if __name__ == "__main__":
+    # 用法: python3 generate_geo_boundaries.py ne_110m_admin_0_countries.shp [--tolerance 0.05]
+    #       python3 generate_geo_boundaries.py --admin1 rg_cities1000.csv
+    if len(sys.argv) < 2:
+        print("用法: python3 generate_geo_boundaries.py <Natural Earth 国家边界 .shp/.geojson> [--tolerance 0.05]")
+        print("      python3 generate_geo_boundaries.py --admin1 <GeoNames rg_cities1000.csv>")
+        sys.exit(1)
+
+    if sys.argv[1] == '--admin1':
+        generate_admin1_points(sys.argv[2])
+        sys.exit(0)
+
+    tolerance = 0.05
+    if '--tolerance' in sys.argv:
+        tolerance = float(sys.argv[sys.argv.index('--tolerance') + 1])
+
+    generate_geo_boundaries(sys.argv[1], tolerance=tolerance)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Geohash 瓦片工具
+将GPS位置缓存从"按坐标四舍五入"改为"按固定的 geohash 瓦片"，
+相邻拍摄地点的查询可以复用同一批瓦片数据
+"""
+import math
+from typing import List, Tuple
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 地球平均半径（公里）
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+
+def tile_size(precision: int) -> Tuple[float, float]:
+    """返回指定精度瓦片的 (纬度跨度, 经度跨度)，单位为度"""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def precision_for_radius(radius_km: float) -> int:
+    """
+    根据搜索半径选择瓦片精度：瓦片边长约为半径的 1/5～1/4，
+    覆盖一次查询约需几十个瓦片，扩大后的请求半径不超过 eBird 的50km上限
+    """
+    if radius_km <= 5:
+        return 6   # 约 1.2km x 0.6km
+    return 5       # 约 4.9km x 4.9km
+
+
+def _encode_indices(lat_idx: int, lon_idx: int, precision: int) -> str:
+    """将瓦片的纬度/经度序号按 geohash 规则交错编码"""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+
+    value = 0
+    lon_pos, lat_pos = lon_bits - 1, lat_bits - 1
+    for i in range(bits):
+        value <<= 1
+        if i % 2 == 0:
+            value |= (lon_idx >> lon_pos) & 1
+            lon_pos -= 1
+        else:
+            value |= (lat_idx >> lat_pos) & 1
+            lat_pos -= 1
+
+    chars = []
+    for i in range(precision):
+        chars.append(_BASE32[(value >> (5 * (precision - 1 - i))) & 31])
+    return ''.join(chars)
+
+
+def _indices(lat: float, lon: float, precision: int) -> Tuple[int, int]:
+    lat_span, lon_span = tile_size(precision)
+    lat_count = int(round(180.0 / lat_span))
+    lon_count = int(round(360.0 / lon_span))
+    lat_idx = min(max(int((lat + 90.0) / lat_span), 0), lat_count - 1)
+    lon_idx = int((lon + 180.0) / lon_span) % lon_count
+    return lat_idx, lon_idx
+
+
+def encode(lat: float, lon: float, precision: int) -> str:
+    """计算坐标所在瓦片的 geohash"""
+    lat_idx, lon_idx = _indices(lat, lon, precision)
+    return _encode_indices(lat_idx, lon_idx, precision)
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """两点间的近似距离（等距圆柱投影，适用于几十公里范围）"""
+    dlat = lat2 - lat1
+    dlon = (lon2 - lon1 + 180.0) % 360.0 - 180.0
+    dlon *= math.cos(math.radians((lat1 + lat2) / 2.0))
+    return math.hypot(dlat, dlon) * KM_PER_DEGREE
+
+
+def covering_tiles(lat: float, lon: float, radius_km: float, precision: int) -> List[Tuple[str, float]]:
+    """
+    返回与搜索圆相交的所有瓦片
+
+    Returns:
+        [(geohash, 圆心到瓦片最远角的距离km), ...]，按 geohash 排序
+    """
+    lat_span, lon_span = tile_size(precision)
+    lon_count = int(round(360.0 / lon_span))
+
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+    lat_start, _ = _indices(lat - dlat, lon, precision)
+    lat_end, _ = _indices(lat + dlat, lon, precision)
+    lon_start = int(math.floor((lon - dlon + 180.0) / lon_span))
+    lon_end = int(math.floor((lon + dlon + 180.0) / lon_span))
+
+    tiles = []
+    for lat_idx in range(lat_start, lat_end + 1):
+        south = -90.0 + lat_idx * lat_span
+        north = south + lat_span
+        for lon_idx in range(lon_start, lon_end + 1):
+            west = -180.0 + lon_idx * lon_span
+            east = west + lon_span
+
+            # 瓦片内离圆心最近的点
+            near_lat = min(max(lat, south), north)
+            near_lon = min(max(lon, west), east)
+            if distance_km(lat, lon, near_lat, near_lon) > radius_km:
+                continue
+
+            far = max(distance_km(lat, lon, corner_lat, corner_lon)
+                      for corner_lat in (south, north) for corner_lon in (west, east))
+            tiles.append((_encode_indices(lat_idx, lon_idx % lon_count, precision), far))
+
+    tiles.sort()
+    return tiles
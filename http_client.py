@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+共享HTTP客户端
+为 eBird API 和 Nominatim 提供：连接池复用、429/5xx 有限次重试（指数退避）、
+失败请求的负缓存，以及按主机的熔断器（离线时直接跳过网络请求，不再等待超时）
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tracing import CATEGORY_NETWORK, span
+
+# 默认超时：(连接, 读取) 秒
+DEFAULT_TIMEOUT = (5, 30)
+
+# 负缓存有效期（秒）
+NOT_FOUND_TTL = 24 * 3600    # 404：区域/位置不存在，短期内不会变化
+FAILURE_TTL = 300            # 重试后仍为 429/5xx
+CONNECTION_ERROR_TTL = 60    # 连接失败/超时
+
+# 熔断器参数
+BREAKER_FAILURE_THRESHOLD = 3    # 连续失败次数达到该值后熔断
+BREAKER_COOLDOWN = 30            # 首次熔断时长（秒），之后每次翻倍
+BREAKER_MAX_COOLDOWN = 600
+
+# 重试前遵循 Retry-After 的最长等待（秒）：更长的等待交给负缓存和熔断器，不阻塞调用线程
+MAX_RETRY_AFTER = 10
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """主机处于熔断状态，请求未发出"""
+
+
+class NegativeCacheError(requests.exceptions.ConnectionError):
+    """相同请求最近失败过，在负缓存有效期内直接返回失败"""
+
+
+class CappedRetry(Retry):
+    """遵循 Retry-After，但等待时间不超过 MAX_RETRY_AFTER"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+
+    - closed: 正常请求
+    - open: 连续失败达到阈值，冷却期内所有请求直接失败
+    - half-open: 冷却期结束后只放行一个探测请求，成功则恢复，失败则延长冷却期
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.open_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.time() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def allow_request(self) -> bool:
+        """是否允许发出请求"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing:
+                # 探测失败，延长冷却期
+                self.probing = False
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.opened_at = time.time()
+                self.open_count += 1
+            elif self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self.open_count += 1
+
+    def remaining_cooldown(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.time() - self.opened_at))
+
+
+class HttpClient:
+    """带连接池、重试、负缓存和熔断器的HTTP客户端（线程安全，进程内共享）"""
+
+    def __init__(self, max_retries: int = 2, backoff_factor: float = 0.5, pool_size: int = 10):
+        """
+        Args:
+            max_retries: 429/5xx 和连接错误的最大重试次数
+            backoff_factor: 指数退避系数（等待 backoff_factor * 2^n 秒，遵循 Retry-After，最长 MAX_RETRY_AFTER 秒）
+            pool_size: 每个主机的连接池大小
+        """
+        retry = CappedRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._negative_cache: Dict[Tuple, Tuple[float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'successes': 0,
+            'not_found': 0,
+            'http_errors': 0,
+            'connection_errors': 0,
+            'retries': 0,
+            'negative_cache_hits': 0,
+            'circuit_open_skips': 0,
+        }
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._metrics[name] += amount
+
+    def _get_breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker()
+            return breaker
+
+    @staticmethod
+    def _cache_key(url: str, params: Optional[dict]) -> Tuple:
+        return url, tuple(sorted((params or {}).items()))
+
+    def _remember_failure(self, key: Tuple, ttl: float, status_code: Optional[int]) -> None:
+        with self._lock:
+            self._negative_cache[key] = (time.time() + ttl, status_code)
+            # 顺带清理过期条目，避免无限增长
+            if len(self._negative_cache) > 1000:
+                now = time.time()
+                self._negative_cache = {k: v for k, v in self._negative_cache.items() if v[0] > now}
+
+    def _check_negative_cache(self, key: Tuple) -> Tuple[bool, Optional[int]]:
+        with self._lock:
+            entry = self._negative_cache.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.time():
+                del self._negative_cache[key]
+                return False, None
+            return True, entry[1]
+
+    @staticmethod
+    def _cached_response(url: str, status_code: int) -> requests.Response:
+        """构造负缓存命中时返回的响应（与原始失败响应的状态码一致）"""
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = url
+        response._content = b''
+        return response
+
+    def get(self, url: str, params: dict = None, headers: dict = None, timeout=DEFAULT_TIMEOUT,
+            not_found_ttl: float = NOT_FOUND_TTL) -> requests.Response:
+        """
+        发出GET请求
+
+        - 负缓存命中：HTTP错误返回相同状态码的空响应，连接错误抛出 NegativeCacheError
+        - 主机熔断中：抛出 CircuitOpenError
+        两种异常都是 requests.exceptions.RequestException 的子类，调用方按原有方式处理即可
+
+        Args:
+            not_found_ttl: 404 响应的负缓存时长（秒），0 表示不缓存
+        """
+        key = self._cache_key(url, params)
+        cached, status_code = self._check_negative_cache(key)
+        if cached:
+            self._count('negative_cache_hits')
+            if status_code is None:
+                raise NegativeCacheError(f"请求最近失败过，暂不重试: {url}")
+            return self._cached_response(url, status_code)
+
+        host = urlparse(url).netloc
+        breaker = self._get_breaker(host)
+        if not breaker.allow_request():
+            self._count('circuit_open_skips')
+            raise CircuitOpenError(f"{host} 暂时不可用，{breaker.remaining_cooldown():.0f} 秒后重试")
+
+        self._count('requests')
+        try:
+            with span(f'GET {host}', CATEGORY_NETWORK, url=url):
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+        except requests.exceptions.RequestException:
+            self._count('connection_errors')
+            breaker.record_failure()
+            self._remember_failure(key, CONNECTION_ERROR_TTL, None)
+            raise
+
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', None)
+        if retries:
+            self._count('retries', len(retries))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            self._count('http_errors')
+            breaker.record_failure()
+            retry_after = response.headers.get('Retry-After', '')
+            ttl = min(float(retry_after), FAILURE_TTL) if retry_after.isdigit() else FAILURE_TTL
+            self._remember_failure(key, ttl, response.status_code)
+            return response
+
+        # 其余响应（包括 400/401/403）说明主机可达，熔断器恢复；半开状态的探测请求也在这里结束
+        breaker.record_success()
+        if response.status_code < 400:
+            self._count('successes')
+        elif response.status_code == 404:
+            # 主机正常，只是资源不存在
+            self._count('not_found')
+            if not_found_ttl > 0:
+                self._remember_failure(key, not_found_ttl, 404)
+        else:
+            self._count('http_errors')
+
+        return response
+
+    def is_available(self, url: str) -> bool:
+        """主机当前是否未处于熔断状态（用于提前跳过网络层级）"""
+        return self._get_breaker(urlparse(url).netloc).state != 'open'
+
+    def get_metrics(self) -> dict:
+        """返回请求统计和各主机熔断器状态"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            breakers = dict(self._breakers)
+            metrics['negative_cache_entries'] = len(self._negative_cache)
+        metrics['hosts'] = {
+            host: {
+                'state': breaker.state,
+                'consecutive_failures': breaker.failures,
+                'open_count': breaker.open_count,
+                'retry_in': round(breaker.remaining_cooldown(), 1)
+            }
+            for host, breaker in breakers.items()
+        }
+        return metrics
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """获取进程内共享的HTTP客户端"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HttpClient()
+    return _http_client
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+异步识别任务
+POST /jobs 提交一个目录或文件列表，任务和每张图片的进度、结果持久化在 SQLite 中，
+由后台工作线程分批处理；支持暂停、继续、取消，进程重启后自动继续未完成的任务。
+
+图片通过数据库中的租约（claimed_at）领取，多个进程（gunicorn worker）共用同一个任务库时不会重复处理；
+进程崩溃时领取的图片在租约过期后由其他工作线程重新处理
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlite_store import SQLiteStore
+
+IMAGE_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp', '.heic',
+    '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.dng', '.raf', '.orf', '.rw2',
+    '.pef', '.srw', '.raw', '.rwl', '.3fr', '.fff', '.erf', '.mef', '.mos', '.mrw', '.x3f',
+}
+
+# 任务状态
+RUNNING, PAUSED, CANCELLED, COMPLETED = 'running', 'paused', 'cancelled', 'completed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    source TEXT,
+    options TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    resumed_at REAL,
+    active_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (job_id, status, idx);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+
+def list_image_files(directory: str, recursive: bool = True) -> List[str]:
+    """列出目录中的图片和RAW文件（按路径排序，跳过隐藏文件）"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.') and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return paths
+
+
+class JobStore(SQLiteStore):
+    """任务和图片进度的 SQLite 存储（每个线程独立连接，WAL 模式支持多进程并发读写）"""
+
+    def __init__(self, db_path: str):
+        # 自动提交模式，写操作由 _transaction 显式开始事务
+        super().__init__(db_path, SCHEMA, timeout=30, isolation_level=None)
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE 事务（写锁在开始时获取，避免多进程领取同一批图片）"""
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def create_job(self, paths: Sequence[str], options: dict, source: str = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, source, options, total, created_at, resumed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, RUNNING, source, json.dumps(options, ensure_ascii=False), len(paths), now, now))
+            conn.executemany("INSERT INTO job_items (job_id, idx, path) VALUES (?, ?, ?)",
+                             ((job_id, idx, path) for idx, path in enumerate(paths)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim_batch(self, batch_size: int,
+                    lease_seconds: float) -> Optional[Tuple[str, dict, List[Tuple[int, str]], float]]:
+        """
+        领取最早的运行中任务的一批待处理图片（包括租约已过期的图片）
+
+        Returns:
+            (任务ID, 任务参数, [(序号, 路径)], 租约时间)，没有可处理的图片时返回None；
+            租约时间在写回结果或放回时用于确认图片仍由本次领取持有
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            jobs = conn.execute("SELECT id, options FROM jobs WHERE status = ? ORDER BY created_at",
+                                (RUNNING,)).fetchall()
+            for job_id, options in jobs:
+                rows = conn.execute(
+                    "SELECT idx, path FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY idx LIMIT ?",
+                    (job_id, batch_size)).fetchall()
+                if len(rows) < batch_size:
+                    rows += conn.execute(
+                        "SELECT idx, path FROM job_items WHERE job_id = ? AND status = 'running' AND claimed_at < ? "
+                        "ORDER BY idx LIMIT ?", (job_id, now - lease_seconds, batch_size - len(rows))).fetchall()
+                if rows:
+                    conn.executemany(
+                        "UPDATE job_items SET status = 'running', claimed_at = ?, attempts = attempts + 1 "
+                        "WHERE job_id = ? AND idx = ?", ((now, job_id, idx) for idx, _ in rows))
+                    conn.execute("COMMIT")
+                    return job_id, json.loads(options), rows, now
+
+                # 没有待处理和处理中的图片：任务完成
+                in_flight = conn.execute("SELECT 1 FROM job_items WHERE job_id = ? AND status = 'running' LIMIT 1",
+                                         (job_id,)).fetchone()
+                if not in_flight:
+                    self._finish(conn, job_id, COMPLETED, now)
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete_items(self, job_id: str, claimed_at: float, outcomes: Sequence[Tuple[int, dict]]):
+        """
+        记录一批图片的识别结果（result['success'] 为 False 的记为失败）
+        只写回仍由本次领取（claimed_at）持有的图片：租约过期后已被其他工作线程重新领取的图片由对方写回，不重复计数
+        """
+        counts = {'done': 0, 'failed': 0}
+        conn = self._transaction()
+        try:
+            for idx, result in outcomes:
+                status = 'done' if result.get('success') else 'failed'
+                counts[status] += conn.execute(
+                    "UPDATE job_items SET status = ?, result = ?, error = ?, claimed_at = NULL "
+                    "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_at = ?",
+                    (status, json.dumps(result, ensure_ascii=False), None if result.get('success') else result.get('error'),
+                     job_id, idx, claimed_at)).rowcount
+            conn.execute("UPDATE jobs SET done = done + ?, failed = failed + ? WHERE id = ?",
+                         (counts['done'], counts['failed'], job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release_items(self, job_id: str, claimed_at: float, indices: Sequence[int], error: str, max_attempts: int,
+                      count_attempt: bool = True):
+        """
+        整批处理失败：放回待处理；重试次数用完的图片记为失败（count_attempt=False 时本次不计入重试次数）
+        与 complete_items 一样跳过已被重新领取的图片
+        """
+        conn = self._transaction()
+        try:
+            failed = 0
+            for idx in indices:
+                row = conn.execute("SELECT attempts FROM job_items WHERE job_id = ? AND idx = ? "
+                                   "AND status = 'running' AND claimed_at = ?", (job_id, idx, claimed_at)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] if count_attempt else row[0] - 1
+                status = 'failed' if attempts >= max_attempts else 'pending'
+                failed += status == 'failed'
+                conn.execute("UPDATE job_items SET status = ?, attempts = ?, error = ?, claimed_at = NULL "
+                             "WHERE job_id = ? AND idx = ?", (status, attempts, error, job_id, idx))
+            if failed:
+                conn.execute("UPDATE jobs SET failed = failed + ? WHERE id = ?", (failed, job_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _finish(conn, job_id: str, status: str, now: float):
+        """结束运行计时并设置状态（调用方持有事务）"""
+        conn.execute(
+            "UPDATE jobs SET status = ?, active_seconds = active_seconds + COALESCE(? - resumed_at, 0), "
+            "resumed_at = NULL, finished_at = CASE WHEN ? IN (?, ?) THEN ? ELSE finished_at END WHERE id = ?",
+            (status, now, status, COMPLETED, CANCELLED, now, job_id))
+
+    def set_status(self, job_id: str, status: str) -> bool:
+        """
+        暂停 / 继续 / 取消
+
+        Returns:
+            状态是否改变（例如已完成的任务不能再暂停）
+        """
+        allowed_from = {PAUSED: (RUNNING,), RUNNING: (PAUSED,), CANCELLED: (RUNNING, PAUSED)}[status]
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row or row[0] not in allowed_from:
+                conn.execute("COMMIT")
+                return False
+            if status == RUNNING:
+                conn.execute("UPDATE jobs SET status = ?, resumed_at = ? WHERE id = ?", (RUNNING, now, job_id))
+            else:
+                self._finish(conn, job_id, status, now)
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """任务状态、计数、吞吐量（张/分钟）和预计剩余时间（秒）"""
+        row = self._get_connection().execute(
+            "SELECT id, status, source, options, total, done, failed, created_at, finished_at, resumed_at, active_seconds "
+            "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        (job_id, status, source, options, total, done, failed,
+         created_at, finished_at, resumed_at, active_seconds) = row
+
+        now = time.time()
+        active = active_seconds + (now - resumed_at if resumed_at else 0)
+        processed = done + failed
+        remaining = total - processed
+        throughput = processed / active if active > 0 and processed else 0.0
+        return {
+            'job_id': job_id,
+            'status': status,
+            'source': source,
+            'options': json.loads(options),
+            'total': total,
+            'done': done,
+            'failed': failed,
+            'remaining': remaining,
+            'progress': round(processed / total * 100, 1) if total else 100.0,
+            'images_per_minute': round(throughput * 60, 1),
+            'eta_seconds': round(remaining / throughput) if status == RUNNING and throughput > 0 else None,
+            'active_seconds': round(active, 1),
+            'created_at': created_at,
+            'finished_at': finished_at
+        }
+
+    def list_jobs(self, limit: int = 50) -> List[dict]:
+        ids = self._get_connection().execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.get_job(job_id) for (job_id,) in ids]
+
+    def get_items(self, job_id: str, offset: int = 0, limit: int = 100, status: str = None) -> List[dict]:
+        """按序号分页读取图片结果"""
+        query = "SELECT idx, path, status, result, error FROM job_items WHERE job_id = ? AND idx >= ?"
+        params = [job_id, offset]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY idx LIMIT ?"
+        params.append(limit)
+        return [
+            {'index': idx, 'image_path': path, 'status': item_status,
+             'result': json.loads(result) if result else None, 'error': error}
+            for idx, path, item_status, result, error in self._get_connection().execute(query, params)
+        ]
+
+
+class JobManager:
+    """后台工作线程池：不断领取一批图片、识别、写回结果"""
+
+    def __init__(self, store: JobStore, process_batch: Callable[[List[str], dict], List[dict]],
+                 workers: int = 2, batch_size: int = 8, lease_seconds: float = 600,
+                 max_attempts: int = 3, poll_interval: float = 5.0, transient_errors: tuple = ()):
+        """
+        Args:
+            process_batch: (路径列表, 任务参数) -> 与路径顺序一致的结果字典列表（含 success）
+            workers: 工作线程数
+            batch_size: 每次领取的图片数
+            lease_seconds: 领取的租约时长，超时未完成的图片会被重新领取
+            max_attempts: 整批失败时每张图片的最大尝试次数
+            poll_interval: 空闲时检查新任务的间隔（其他进程提交的任务）
+            transient_errors: 暂时性错误（如服务器繁忙），整批放回且不计入重试次数
+        """
+        self.store = store
+        self.process_batch = process_batch
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.transient_errors = transient_errors
+
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self.batches = 0
+        self.batch_failures = 0
+
+    def start(self):
+        """启动工作线程（进程内只启动一次；会继续处理库中未完成的任务）"""
+        with self._condition:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run_worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        """有新任务或任务被继续时唤醒空闲的工作线程"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def submit(self, paths: Sequence[str], options: dict, source: str = None) -> str:
+        job_id = self.store.create_job(paths, options, source)
+        self.start()
+        self.notify()
+        return job_id
+
+    def pause(self, job_id: str) -> bool:
+        return self.store.set_status(job_id, PAUSED)
+
+    def resume(self, job_id: str) -> bool:
+        changed = self.store.set_status(job_id, RUNNING)
+        if changed:
+            self.start()
+            self.notify()
+        return changed
+
+    def cancel(self, job_id: str) -> bool:
+        return self.store.set_status(job_id, CANCELLED)
+
+    def _run_worker(self):
+        while True:
+            try:
+                claim = self.store.claim_batch(self.batch_size, self.lease_seconds)
+            except sqlite3.Error as e:
+                print(f"领取任务失败: {e}")
+                claim = None
+
+            if claim is None:
+                with self._condition:
+                    self._condition.wait(self.poll_interval)
+                continue
+
+            job_id, options, items, claimed_at = claim
+            try:
+                results = self.process_batch([path for _, path in items], options)
+                self.store.complete_items(job_id, claimed_at,
+                                          [(idx, result) for (idx, _), result in zip(items, results)])
+                self.batches += 1
+            except Exception as e:
+                self.batch_failures += 1
+                print(f"任务 {job_id} 处理失败，稍后重试: {e}")
+                try:
+                    self.store.release_items(job_id, claimed_at, [idx for idx, _ in items], str(e), self.max_attempts,
+                                             count_attempt=not isinstance(e, self.transient_errors))
+                except sqlite3.Error as release_error:
+                    # 放回失败时等租约过期后重新领取
+                    print(f"放回任务失败: {release_error}")
+                time.sleep(min(30, self.poll_interval * 2))
+
+    def get_stats(self) -> dict:
+        return {
+            'workers': len(self._threads),
+            'batch_size': self.batch_size,
+            'batches': self.batches,
+            'batch_failures': self.batch_failures
+        }
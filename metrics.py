@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+运行指标（Prometheus 文本格式）
+识别流程各阶段的调用次数、处理图片数和耗时直方图，缓存命中计数，以及模型加载时间；
+队列深度、缓存大小等即时值在输出时由注册的采集函数读取，不占用识别流程的时间。
+计时一个阶段需要两次读取时钟、一次加锁和二分查找（约3微秒，含追踪检查），对识别流程的开销可以忽略
+
+gunicorn 多进程时每次抓取只会到达其中一个 worker：各 worker 定期把指标快照写入共享目录，
+/metrics 由收到请求的 worker 汇总所有快照输出——计数器和直方图跨 worker 求和（已退出的 worker 的
+快照保留，总数不会倒退），即时值按 worker 标签分别输出（只包括仍在运行的 worker）。
+其他 worker 的数据最多滞后 MULTIPROCESS_FLUSH_INTERVAL 秒
+"""
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tracing import CATEGORY_STAGE, current_trace
+
+# 识别流程的阶段
+STAGE_LOAD_IMAGE = 'load_image'
+STAGE_METADATA = 'metadata'          # EXIF/GPS 读取和地区推断
+STAGE_YOLO = 'yolo'
+STAGE_PREPROCESS = 'preprocess'
+STAGE_FORWARD = 'forward'
+STAGE_EBIRD_FILTER = 'ebird_filter'  # 确定地理筛选的物种范围
+STAGE_DB_LOOKUP = 'db_lookup'        # 结果排序和名称、描述、eBird代码查询
+
+STAGES = (STAGE_LOAD_IMAGE, STAGE_METADATA, STAGE_YOLO, STAGE_PREPROCESS, STAGE_FORWARD,
+          STAGE_EBIRD_FILTER, STAGE_DB_LOOKUP)
+
+# 耗时直方图的桶上限（秒）：从毫秒级的缓存读取到数十秒的RAW解码
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 多进程模式下各 worker 写入指标快照的间隔（秒）
+MULTIPROCESS_FLUSH_INTERVAL = 5
+
+# 采集函数返回的指标: (名称, 类型, 说明, [(标签字典, 值), ...])；与内置指标同名时样本合并输出
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Histogram:
+    """累积直方图（调用方持有锁）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+
+class StageTimer:
+    """with 语句计时一个阶段，异常退出时计入错误数；有当前追踪时同时记录为追踪中的时间段"""
+    __slots__ = ('registry', 'stage', 'items', 'start')
+
+    def __init__(self, registry: 'MetricsRegistry', stage: str, items: int):
+        self.registry = registry
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.registry.observe(self.stage, end - self.start, self.items, error=exc_type is not None)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_span(self.stage, CATEGORY_STAGE, self.start, end, {'items': self.items} if self.items != 1 else None)
+        return False
+
+
+class MetricsRegistry:
+    """进程内的指标注册表（线程安全）"""
+
+    def __init__(self, prefix: str = 'superbirdid', buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._items: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._cache_lookups: Dict[Tuple[str, str], int] = {}
+        self._model_load_seconds: Dict[str, float] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self.multiprocess_dir: Optional[str] = None
+        self._flush_thread: Optional[threading.Thread] = None
+
+    def time(self, stage: str, items: int = 1) -> StageTimer:
+        """
+        计时一个阶段:
+
+            with pipeline_metrics.time(STAGE_FORWARD, items=len(images)):
+                ...
+
+        Args:
+            items: 本次处理的图片数（批量推理时一次调用处理多张）
+        """
+        return StageTimer(self, stage, items)
+
+    def observe(self, stage: str, seconds: float, items: int = 1, error: bool = False) -> None:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            self._items[stage] = self._items.get(stage, 0) + items
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def record_cache_lookup(self, cache: str, hit: bool) -> None:
+        """记录一次缓存查询（cache 为缓存名称，如 gps、ebird、result）"""
+        key = (cache, 'hit' if hit else 'miss')
+        with self._lock:
+            self._cache_lookups[key] = self._cache_lookups.get(key, 0) + 1
+
+    def set_model_load_time(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._model_load_seconds[model] = seconds
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """注册输出时调用的采集函数（读取队列深度、缓存大小等即时值）"""
+        self._collectors.append(collector)
+
+    def get_stats(self) -> dict:
+        """各阶段的调用次数和平均耗时（用于 /health）"""
+        with self._lock:
+            return {
+                stage: {
+                    'calls': histogram.count,
+                    'items': self._items.get(stage, 0),
+                    'errors': self._errors.get(stage, 0),
+                    'avg_ms': round(histogram.sum / histogram.count * 1000, 1) if histogram.count else 0
+                }
+                for stage, histogram in self._histograms.items()
+            }
+
+    def prepare_multiprocess(self, directory: str) -> None:
+        """在 fork worker 之前于主进程中调用：设置快照目录（worker 继承该设置）并清除旧快照"""
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+            os.remove(path)
+        self.multiprocess_dir = directory
+
+    def start_multiprocess(self, interval: float = MULTIPROCESS_FLUSH_INTERVAL) -> None:
+        """在每个 worker 进程启动后调用：定期写入本进程的指标快照（未设置快照目录时不做任何事）"""
+        if not self.multiprocess_dir or self._flush_thread is not None:
+            return
+
+        def run():
+            while True:
+                self.flush()
+                time.sleep(interval)
+
+        self._flush_thread = threading.Thread(target=run, name='metrics-flush', daemon=True)
+        self._flush_thread.start()
+
+    def flush(self) -> None:
+        """写入本进程的指标快照（先写临时文件再替换，读取方不会读到写了一半的文件）"""
+        path = os.path.join(self.multiprocess_dir, f'worker-{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'families': self.collect_local()}, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+
+    def collect(self) -> List[MetricFamily]:
+        """当前所有指标（多进程模式下汇总所有 worker）"""
+        if not self.multiprocess_dir:
+            return self.collect_local()
+        self.flush()
+        return merge_snapshots(self.multiprocess_dir)
+
+    def collect_local(self) -> List[MetricFamily]:
+        """本进程的指标"""
+        p = self.prefix
+        with self._lock:
+            stages = sorted(self._histograms.items())
+            histogram_samples = []  # (后缀, 标签字典, 值)
+            for stage, histogram in stages:
+                for bound, count in histogram.cumulative():
+                    histogram_samples.append(('_bucket', {'stage': stage, 'le': bound}, count))
+                histogram_samples.append(('_sum', {'stage': stage}, histogram.sum))
+                histogram_samples.append(('_count', {'stage': stage}, histogram.count))
+            families = [
+                (f'{p}_stage_duration_seconds', 'histogram', '识别流程各阶段每次调用的耗时', histogram_samples),
+                (f'{p}_stage_items_total', 'counter', '识别流程各阶段处理的图片数',
+                 [({'stage': stage}, count) for stage, count in sorted(self._items.items())]),
+                (f'{p}_stage_errors_total', 'counter', '识别流程各阶段抛出异常的次数',
+                 [({'stage': stage}, count) for stage, count in sorted(self._errors.items())]),
+                (f'{p}_cache_lookups_total', 'counter', '缓存查询次数（result 为 hit 或 miss）',
+                 [({'cache': cache, 'result': result}, count)
+                  for (cache, result), count in sorted(self._cache_lookups.items())]),
+                (f'{p}_model_load_seconds', 'gauge', '模型和数据的加载耗时',
+                 [({'model': model}, seconds) for model, seconds in sorted(self._model_load_seconds.items())]),
+            ]
+
+        by_name = {family[0]: family for family in families}
+        for collector in self._collectors:
+            try:
+                for family in collector():
+                    if family[0] in by_name:
+                        by_name[family[0]][3].extend(family[3])
+                    else:
+                        by_name[family[0]] = family
+                        families.append(family)
+            except Exception as e:
+                print(f"采集指标失败: {e}")
+        return families
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, metric_type, help_text, samples in self.collect():
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample in samples:
+                if metric_type == 'histogram':
+                    suffix, labels, value = sample
+                else:
+                    suffix, (labels, value) = '', sample
+                lines.append(f'{name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # 进程存在但无权发送信号
+    return True
+
+
+def merge_snapshots(directory: str) -> List[MetricFamily]:
+    """
+    汇总目录中各 worker 的指标快照：计数器和直方图按标签求和（包括已退出的 worker），
+    即时值加上 worker 标签（只包括仍在运行的 worker）
+    """
+    families = {}  # 名称 -> (类型, 说明, {样本键: 值})
+    for path in sorted(glob.glob(os.path.join(directory, 'worker-*.json'))):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # 正在被替换或已损坏，下次抓取时再读
+        pid = snapshot['pid']
+        alive = None
+        for name, metric_type, help_text, samples in snapshot['families']:
+            if metric_type == 'gauge':
+                if alive is None:
+                    alive = is_process_alive(pid)
+                if not alive:
+                    continue
+            family = families.setdefault(name, (metric_type, help_text, {}))
+            if help_text and not family[1]:
+                family = families[name] = (metric_type, help_text, family[2])
+            values = family[2]
+            for sample in samples:
+                suffix, labels, value = sample if metric_type == 'histogram' else ('', *sample)
+                if metric_type == 'gauge':
+                    labels = dict(labels, worker=str(pid))
+                key = (suffix, tuple(sorted(labels.items())))
+                values[key] = values.get(key, 0) + value
+
+    merged = []
+    for name, (metric_type, help_text, values) in families.items():
+        keys = sorted(values, key=_sample_order)
+        if metric_type == 'histogram':
+            samples = [(suffix, dict(labels), values[(suffix, labels)]) for suffix, labels in keys]
+        else:
+            samples = [(dict(labels), values[(suffix, labels)]) for suffix, labels in keys]
+        merged.append((name, metric_type, help_text, samples))
+    return merged
+
+
+_SUFFIX_ORDER = {'_bucket': 0, '_sum': 1, '_count': 2}
+
+
+def _sample_order(key):
+    """同一序列的直方图样本排在一起：桶按上限升序，之后是 _sum 和 _count"""
+    suffix, labels = key
+    le = dict(labels).get('le')
+    series = tuple(item for item in labels if item[0] != 'le')
+    return series, _SUFFIX_ORDER.get(suffix, 0), float(le) if le is not None else 0.0
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+# 进程级共享的识别流程指标
+pipeline_metrics = MetricsRegistry()
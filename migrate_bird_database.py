@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+bird_reference.sqlite 索引迁移工具
+为 BirdCountInfo 的热点查询创建索引（含覆盖索引），并输出迁移前后的 EXPLAIN QUERY PLAN
+
+用法:
+    python3 migrate_bird_database.py [数据库路径] [--dry-run]
+"""
+import os
+import sqlite3
+import sys
+import time
+
+# 与 BirdDatabaseManager 中查询条件一致的热点查询（参数只用于生成执行计划）
+HOT_QUERIES = [
+    ("按类别ID查询 (get_bird_by_class_id)",
+     "SELECT id, english_name, chinese_simplified, ebird_code, short_description_zh "
+     "FROM BirdCountInfo WHERE model_class_id = ?", (0,)),
+    ("批量类别ID查询 (get_birds_by_class_ids)",
+     "SELECT model_class_id, english_name FROM BirdCountInfo WHERE model_class_id IN (?, ?, ?)", (0, 1, 2)),
+    ("英文名 -> eBird代码 (get_ebird_code_by_english_name)",
+     "SELECT ebird_code FROM BirdCountInfo WHERE english_name = ? AND ebird_code IS NOT NULL", ('',)),
+    ("中文名查询 (get_bird_description_from_db)",
+     "SELECT english_name, short_description_zh FROM BirdCountInfo WHERE chinese_simplified = ? LIMIT 1", ('',)),
+    ("学名存在性检查 (check_species_in_region)",
+     "SELECT COUNT(*) FROM BirdCountInfo WHERE scientific_name = ?", ('',)),
+    ("eBird代码批量查询 (get_birds_by_ebird_codes)",
+     "SELECT id, english_name FROM BirdCountInfo WHERE ebird_code IN (?, ?)", ('', '')),
+]
+
+
+def explain_hot_queries(conn: sqlite3.Connection) -> dict:
+    """返回每个热点查询的执行计划（文本）"""
+    plans = {}
+    for label, sql, params in HOT_QUERIES:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        plans[label] = '; '.join(row[-1] for row in rows)
+    return plans
+
+
+def time_hot_queries(conn: sqlite3.Connection, rounds: int = 200) -> dict:
+    """每个热点查询的平均耗时（微秒）"""
+    timings = {}
+    for label, sql, params in HOT_QUERIES:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            conn.execute(sql, params).fetchall()
+        timings[label] = (time.perf_counter() - start) / rounds * 1e6
+    return timings
+
+
+def print_report(title: str, plans: dict, timings: dict):
+    print(f"\n=== {title} ===")
+    for label, plan in plans.items():
+        print(f"{label}: {timings[label]:.0f} µs")
+        print(f"    {plan}")
+
+
+def migrate(db_path: str, dry_run: bool = False) -> list:
+    """
+    创建缺失的索引并执行 ANALYZE
+
+    Returns:
+        创建的索引名列表（dry_run 时为将要创建的索引）
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"数据库文件不存在: {db_path}")
+
+    from bird_database_manager import BirdDatabaseManager
+    manager = BirdDatabaseManager(db_path)
+    missing = manager.get_missing_indexes()
+    manager.close()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        print_report("迁移前执行计划", explain_hot_queries(conn), time_hot_queries(conn))
+
+        if not missing:
+            print("\n✓ 所有索引均已存在，无需迁移")
+            return []
+
+        print(f"\n需要创建 {len(missing)} 个索引:")
+        for name, columns in missing:
+            print(f"  {name} ({', '.join(columns)})")
+        if dry_run:
+            return [name for name, _ in missing]
+
+        start = time.perf_counter()
+        with conn:
+            for name, columns in missing:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON BirdCountInfo ({", ".join(columns)})')
+            conn.execute("ANALYZE BirdCountInfo")
+        print(f"✓ 索引创建完成，耗时 {time.perf_counter() - start:.2f} 秒")
+
+        print_report("迁移后执行计划", explain_hot_queries(conn), time_hot_queries(conn))
+        return [name for name, _ in missing]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    path = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bird_reference.sqlite')
+    migrate(path, dry_run='--dry-run' in sys.argv)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+离线分布位图筛选
+birdinfo.json 每条记录名称之后的8个32位整数是256位的国家分布位图。
+本模块将其一次性解码为 (位 × 类别) 的布尔矩阵，并用离线国家物种列表校准"位 -> 国家"，
+无需 eBird 请求和数据库即可得到国家的类别掩码
+
+校准（python3 occurrence_filter.py --calibrate，需要数据库提供类别eBird代码），结果写入
+offline_ebird_data/occurrence_bits.json:
+    1. 对每个有离线列表的国家，按 Jaccard 相似度选出最匹配的位作为锚点
+    2. 位按国家英文名排序，相邻锚点之间的位数与 ebird_regions.json 中按名称排序的国家数一致时，
+       依次对齐补全锚点之间的国家
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+if getattr(sys, 'frozen', False):
+    _base_dir = sys._MEIPASS
+else:
+    _base_dir = os.path.dirname(os.path.abspath(__file__))
+
+BIRD_INFO_PATH = os.path.join(_base_dir, 'birdinfo.json')
+EBIRD_REGIONS_PATH = os.path.join(_base_dir, 'ebird_regions.json')
+OFFLINE_DIR = os.path.join(_base_dir, 'offline_ebird_data')
+# 校准结果与离线数据放在一起，随 offline_ebird_data 目录一起打包
+OCCURRENCE_BITS_PATH = os.path.join(OFFLINE_DIR, 'occurrence_bits.json')
+
+OCCURRENCE_WORDS = 8
+OCCURRENCE_BITS = OCCURRENCE_WORDS * 32
+
+# 锚点的最低 Jaccard 相似度
+MIN_ANCHOR_JACCARD = 0.3
+
+
+def decode_occurrence_bits(bird_info: list) -> np.ndarray:
+    """
+    将 birdinfo 记录的分布整数解码为 (位, 类别) 布尔矩阵
+
+    按位存储为行，取某个国家的类别掩码只是一次行切片
+    """
+    words = np.zeros((len(bird_info), OCCURRENCE_WORDS), dtype=np.uint32)
+    for class_id, record in enumerate(bird_info):
+        values = record[3:3 + OCCURRENCE_WORDS]
+        if len(values) == OCCURRENCE_WORDS:
+            words[class_id] = values
+    bits = np.unpackbits(words.astype('<u4').view(np.uint8), axis=1, bitorder='little')
+    return np.ascontiguousarray(bits.T.astype(bool))
+
+
+def _country_class_matrix(class_codes: List[Optional[str]], region_lists: Dict[str, frozenset],
+                          num_classes: int):
+    """(国家, 类别) 布尔矩阵：类别的eBird代码在该国家的离线列表中"""
+    countries = sorted(region_lists)
+    matrix = np.zeros((len(countries), num_classes), dtype=bool)
+    for row, country in enumerate(countries):
+        species = region_lists[country]
+        matrix[row] = [code is not None and code in species for code in class_codes[:num_classes]]
+    return countries, matrix
+
+
+def _agreement(bit_row: np.ndarray, country_row: np.ndarray, valid: np.ndarray) -> dict:
+    """位与离线列表在有eBird代码的类别上的一致性"""
+    bit_row = bit_row & valid
+    intersection = int(np.count_nonzero(bit_row & country_row))
+    bit_count = int(np.count_nonzero(bit_row))
+    list_count = int(np.count_nonzero(country_row))
+    union = bit_count + list_count - intersection
+    return {
+        'jaccard': round(intersection / union, 4) if union else 0.0,
+        'precision': round(intersection / bit_count, 4) if bit_count else 0.0,
+        'recall': round(intersection / list_count, 4) if list_count else 0.0
+    }
+
+
+def _load_region_lists(offline_dir: str) -> Dict[str, frozenset]:
+    """读取全部离线国家列表（优先读取打包文件）"""
+    from species_pack import get_species_pack
+
+    pack = get_species_pack(offline_dir)
+    if pack is not None:
+        return {region: pack.get_species(region) for region in pack.regions() if '-' not in region}
+
+    import glob
+    lists = {}
+    for path in glob.glob(os.path.join(offline_dir, "species_list_*.json")):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        region = data.get('country_code', '')
+        if region and '-' not in region:
+            lists[region] = frozenset(data.get('species', []))
+    return lists
+
+
+def calibrate_occurrence_bits(occurrence: np.ndarray, class_codes: List[Optional[str]],
+                              region_lists: Dict[str, frozenset], country_names: Dict[str, str] = None) -> dict:
+    """
+    校准"位 -> 国家"
+
+    Args:
+        occurrence: decode_occurrence_bits 的结果
+        class_codes: 下标为 model_class_id 的eBird代码
+        region_lists: 国家代码 -> 离线物种代码集合
+        country_names: 国家代码 -> 英文名（用于锚点之间的对齐补全）
+
+    Returns:
+        {'countries': {国家代码: {'bit', 'source', 'jaccard', 'precision', 'recall'}}, ...}
+    """
+    num_classes = occurrence.shape[1]
+    valid = np.array([code is not None for code in class_codes[:num_classes]] +
+                     [False] * max(0, num_classes - len(class_codes)), dtype=bool)
+    countries, country_matrix = _country_class_matrix(class_codes, region_lists, num_classes)
+
+    # Jaccard 矩阵 (位, 国家)
+    bits = (occurrence & valid).astype(np.float32)
+    lists = country_matrix.astype(np.float32)
+    intersection = bits @ lists.T
+    union = bits.sum(axis=1, keepdims=True) + lists.sum(axis=1) - intersection
+    jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    # 贪心一一匹配：相似度最高的 (位, 国家) 优先
+    mapping = {}
+    used_bits = set()
+    for flat in np.argsort(-jaccard, axis=None):
+        bit, col = np.unravel_index(flat, jaccard.shape)
+        if jaccard[bit, col] < MIN_ANCHOR_JACCARD:
+            break
+        country = countries[col]
+        if country in mapping or bit in used_bits:
+            continue
+        mapping[country] = {'bit': int(bit), 'source': 'jaccard'}
+        used_bits.add(int(bit))
+
+    # 锚点之间按国家英文名顺序对齐
+    if country_names:
+        ordered = sorted(country_names, key=lambda code: country_names[code])
+        position = {code: i for i, code in enumerate(ordered)}
+        anchors = sorted((entry['bit'], position[country]) for country, entry in mapping.items()
+                         if country in position)
+        for (bit_a, pos_a), (bit_b, pos_b) in zip(anchors, anchors[1:]):
+            if bit_b - bit_a != pos_b - pos_a:
+                continue
+            for offset in range(1, bit_b - bit_a):
+                country = ordered[pos_a + offset]
+                if country not in mapping:
+                    mapping[country] = {'bit': bit_a + offset, 'source': 'aligned'}
+
+    # 与离线列表的一致性（只对有离线列表的国家）
+    for row, country in enumerate(countries):
+        if country in mapping:
+            mapping[country].update(_agreement(occurrence[mapping[country]['bit']], country_matrix[row], valid))
+
+    calibrated = [entry for entry in mapping.values() if 'jaccard' in entry]
+    return {
+        'created_at': datetime.now().isoformat(),
+        'num_classes': num_classes,
+        'countries': dict(sorted(mapping.items())),
+        'summary': {
+            'anchors': sum(1 for entry in mapping.values() if entry['source'] == 'jaccard'),
+            'aligned': sum(1 for entry in mapping.values() if entry['source'] == 'aligned'),
+            'offline_countries': len(countries),
+            'mean_jaccard': round(float(np.mean([e['jaccard'] for e in calibrated])), 4) if calibrated else 0.0,
+            'mean_precision': round(float(np.mean([e['precision'] for e in calibrated])), 4) if calibrated else 0.0,
+            'mean_recall': round(float(np.mean([e['recall'] for e in calibrated])), 4) if calibrated else 0.0
+        }
+    }
+
+
+class OccurrenceFilter:
+    """按国家代码提供类别掩码的离线分布筛选器"""
+
+    def __init__(self, bird_info: list, calibration: dict):
+        self.occurrence = decode_occurrence_bits(bird_info)
+        self.num_classes = self.occurrence.shape[1]
+        self.country_bits: Dict[str, int] = {country: entry['bit']
+                                             for country, entry in calibration.get('countries', {}).items()}
+        self.summary = calibration.get('summary', {})
+        self.lookups = 0
+
+    def __contains__(self, country_code: str) -> bool:
+        return country_code in self.country_bits
+
+    def countries(self) -> List[str]:
+        return sorted(self.country_bits)
+
+    def class_mask(self, country_code: str) -> Optional[np.ndarray]:
+        """国家的类别掩码（只读视图，长度为类别数），未校准的国家返回None"""
+        bit = self.country_bits.get(country_code)
+        if bit is None:
+            return None
+        self.lookups += 1
+        return self.occurrence[bit]
+
+    def species_count(self, country_code: str) -> int:
+        mask = self.class_mask(country_code)
+        return int(np.count_nonzero(mask)) if mask is not None else 0
+
+    def contains(self, country_code: str, class_id: int) -> bool:
+        """类别是否分布于该国家"""
+        mask = self.class_mask(country_code)
+        return mask is not None and 0 <= class_id < self.num_classes and bool(mask[class_id])
+
+    def get_stats(self) -> dict:
+        return {
+            'countries': len(self.country_bits),
+            'lookups': self.lookups,
+            'agreement': self.summary
+        }
+
+
+_occurrence_filter = None
+_occurrence_filter_lock = threading.Lock()
+
+
+def get_occurrence_filter(bird_info: list = None) -> Optional[OccurrenceFilter]:
+    """
+    懒加载全局离线分布筛选器（需要 occurrence_bits.json），不可用时返回None
+
+    Args:
+        bird_info: 已加载的 birdinfo 数据（避免重复读取）
+    """
+    global _occurrence_filter
+    if _occurrence_filter is None:
+        with _occurrence_filter_lock:
+            if _occurrence_filter is None:
+                try:
+                    with open(OCCURRENCE_BITS_PATH, 'r', encoding='utf-8') as f:
+                        calibration = json.load(f)
+                    if bird_info is None:
+                        with open(BIRD_INFO_PATH, 'r', encoding='utf-8') as f:
+                            bird_info = json.load(f)
+                    _occurrence_filter = OccurrenceFilter(bird_info, calibration)
+                    print(f"✓ 离线分布筛选已加载: {len(_occurrence_filter.country_bits)} 个国家")
+                except Exception as e:
+                    print(f"离线分布筛选不可用: {e}")
+                    _occurrence_filter = False  # 标记为已尝试但失败
+    return _occurrence_filter if _occurrence_filter is not False else None
+
+
+def run_calibration(output_path: str = OCCURRENCE_BITS_PATH) -> dict:
+    """用数据库中的类别eBird代码和离线国家列表生成 occurrence_bits.json"""
+    from bird_database_manager import BirdDatabaseManager
+
+    with open(BIRD_INFO_PATH, 'r', encoding='utf-8') as f:
+        bird_info = json.load(f)
+    class_codes = BirdDatabaseManager().get_class_ebird_codes()
+    if not class_codes:
+        raise ValueError("数据库中没有类别eBird代码")
+
+    with open(EBIRD_REGIONS_PATH, 'r', encoding='utf-8') as f:
+        country_names = {c['code']: c['name'] for c in json.load(f).get('countries', [])}
+
+    calibration = calibrate_occurrence_bits(decode_occurrence_bits(bird_info), class_codes,
+                                            _load_region_lists(OFFLINE_DIR), country_names)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, ensure_ascii=False, indent=1)
+
+    summary = calibration['summary']
+    print(f"✓ 分布位校准完成: {summary['anchors']} 个锚点 + {summary['aligned']} 个对齐国家 -> {output_path}")
+    return calibration
+
+
+def benchmark_occurrence_filter(rounds: int = 10000):
+    """测试解码/掩码耗时，并输出与离线国家列表的一致性"""
+    with open(BIRD_INFO_PATH, 'r', encoding='utf-8') as f:
+        bird_info = json.load(f)
+
+    start = time.perf_counter()
+    occurrence = decode_occurrence_bits(bird_info)
+    decode_time = time.perf_counter() - start
+    print(f"分布位解码: {decode_time * 1000:.1f} ms，{occurrence.shape[1]} 个类别 × {occurrence.shape[0]} 位，"
+          f"平均每类 {occurrence.sum(axis=0).mean():.1f} 个国家")
+
+    occurrence_filter = get_occurrence_filter(bird_info)
+    if occurrence_filter is None:
+        return
+
+    countries = occurrence_filter.countries()
+    start = time.perf_counter()
+    for i in range(rounds):
+        occurrence_filter.class_mask(countries[i % len(countries)])
+    mask_time = (time.perf_counter() - start) / rounds
+    print(f"国家类别掩码: {mask_time * 1e6:.2f} µs/次")
+
+    summary = occurrence_filter.summary
+    print(f"与离线列表一致性（{summary.get('offline_countries', 0)} 个国家）: "
+          f"Jaccard {summary.get('mean_jaccard', 0):.3f}，精确率 {summary.get('mean_precision', 0):.3f}，"
+          f"召回率 {summary.get('mean_recall', 0):.3f}")
+
+    with open(OCCURRENCE_BITS_PATH, 'r', encoding='utf-8') as f:
+        entries = json.load(f)['countries']
+    worst = sorted((e['jaccard'], code) for code, e in entries.items() if 'jaccard' in e)[:5]
+    if worst:
+        print("一致性最低: " + "，".join(f"{code} {score:.2f}" for score, code in worst))
+
+
+if __name__ == "__main__":
+    # 用法: python3 occurrence_filter.py --calibrate | --benchmark
+    if '--calibrate' in sys.argv:
+        run_calibration()
+    benchmark_occurrence_filter()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+离线GPS地理编码器
+基于简化的国家边界多边形 + 规则网格索引，离线判断GPS坐标所在国家，
+并通过带eBird区域代码的城镇点（最近点）离线判断所在的州/省
+无需网络和 reverse_geocoder，单次查询为近似常数时间
+"""
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 支持 PyInstaller 打包环境
+if getattr(sys, 'frozen', False):
+    _data_dir = sys._MEIPASS
+else:
+    _data_dir = os.path.dirname(os.path.abspath(__file__))
+
+COUNTRY_BOUNDARIES_PATH = os.path.join(_data_dir, 'country_boundaries.json')
+ADMIN1_POINTS_PATH = os.path.join(_data_dir, 'admin1_points.json')
+
+# 网格标记：不在任何多边形内，但靠近边界，需要做最近边界吸附
+_NEAR_BOUNDARY = ()
+
+# 1:110m 边界数据中缺失的微型国家和特别行政区：(代码, 名称, 南, 西, 北, 东)
+# 这些矩形优先于多边形网格（否则新加坡会吸附到马来西亚，香港会解析为中国）；
+# 矩形为近似范围，陆地边界附近几百米内可能有偏差
+SMALL_TERRITORIES = [
+    ('SG', 'Singapore', 1.16, 103.60, 1.45, 104.10),
+    ('HK', 'Hong Kong', 22.15, 113.83, 22.50, 114.45),
+    ('MO', 'Macau', 22.10, 113.52, 22.22, 113.60),
+    ('BH', 'Bahrain', 25.55, 50.35, 26.35, 50.85),
+    ('MT', 'Malta', 35.78, 14.18, 36.09, 14.58),
+    ('LI', 'Liechtenstein', 47.05, 9.47, 47.27, 9.64),
+    ('MC', 'Monaco', 43.72, 7.40, 43.76, 7.44),
+    ('SM', 'San Marino', 43.89, 12.40, 43.99, 12.52),
+    ('AD', 'Andorra', 42.43, 1.41, 42.66, 1.79),
+    ('VA', 'Vatican City', 41.900, 12.445, 41.908, 12.459),
+    ('GI', 'Gibraltar', 36.10, -5.37, 36.16, -5.33),
+    ('MV', 'Maldives', -0.70, 72.60, 7.10, 73.80),
+    ('SC', 'Seychelles', -4.80, 55.20, -4.20, 55.90),
+    ('MU', 'Mauritius', -20.55, 57.30, -19.95, 57.80),
+    ('BB', 'Barbados', 13.03, -59.66, 13.34, -59.41),
+]
+
+
+class PolygonGridIndex:
+    """
+    多边形点查询索引
+
+    将全球划分为 cell_size 度的规则网格：
+    - 完全位于某个多边形内部（或外部）的网格直接记录结果，查询为一次数组访问
+    - 被边界穿过的网格记录候选代码，查询时只对该纬度带内的边做射线检测
+    """
+
+    def __init__(self, polygons: Dict[str, List[List[float]]], cell_size: float = 0.5,
+                 snap_distance: float = 0.0):
+        """
+        构建网格索引
+
+        Args:
+            polygons: {代码: [环, ...]}，每个环为扁平坐标列表 [lon0, lat0, lon1, lat1, ...]
+            cell_size: 网格大小（度）
+            snap_distance: 不在任何多边形内时，吸附到该距离（度）内最近的多边形，
+                           用于补偿简化边界在海岸线附近的误差
+        """
+        self.cell_size = cell_size
+        self.snap_distance = snap_distance
+        self.rows = int(math.ceil(180.0 / cell_size))
+        self.cols = int(math.ceil(360.0 / cell_size))
+
+        # 每个纬度带内各多边形的边 {row: {code: [(x1, y1, x2, y2), ...]}}
+        self._row_edges: List[Dict[str, List[Tuple[float, float, float, float]]]] = [
+            {} for _ in range(self.rows)
+        ]
+        # 边界网格的候选代码 {(row, col): set(code)}
+        boundary_cells: Dict[Tuple[int, int], set] = {}
+
+        for code, rings in polygons.items():
+            for ring in rings:
+                points = list(zip(ring[0::2], ring[1::2]))
+                if len(points) < 3:
+                    continue
+                if points[0] != points[-1]:
+                    points.append(points[0])
+                for (x1, y1), (x2, y2) in zip(points, points[1:]):
+                    self._add_edge(code, x1, y1, x2, y2, boundary_cells)
+
+        # 网格值: None（无国家）/ str（整格属于该国家）/ tuple（边界网格候选，空元组表示靠近边界）
+        self._grid: List[list] = [[None] * self.cols for _ in range(self.rows)]
+        for (row, col), codes in boundary_cells.items():
+            self._grid[row][col] = tuple(sorted(codes))
+
+        self._fill_interior_cells()
+
+        if snap_distance > 0:
+            self._mark_near_boundary_cells(boundary_cells)
+
+        self.boundary_cell_count = len(boundary_cells)
+
+    def _row_of(self, lat: float) -> int:
+        row = int((lat + 90.0) / self.cell_size)
+        return min(max(row, 0), self.rows - 1)
+
+    def _col_of(self, lon: float) -> int:
+        col = int((lon + 180.0) / self.cell_size)
+        return min(max(col, 0), self.cols - 1)
+
+    def _add_edge(self, code, x1, y1, x2, y2, boundary_cells):
+        """登记一条边：加入所经过纬度带的边表，并标记其经过的网格"""
+        row_start = self._row_of(min(y1, y2))
+        row_end = self._row_of(max(y1, y2))
+
+        for row in range(row_start, row_end + 1):
+            self._row_edges[row].setdefault(code, []).append((x1, y1, x2, y2))
+
+            # 计算该边在本纬度带内的经度范围
+            if y1 == y2:
+                lon_min, lon_max = min(x1, x2), max(x1, x2)
+            else:
+                band_low = -90.0 + row * self.cell_size
+                band_high = band_low + self.cell_size
+                t1 = (max(min(y1, y2), band_low) - y1) / (y2 - y1)
+                t2 = (min(max(y1, y2), band_high) - y1) / (y2 - y1)
+                xa = x1 + t1 * (x2 - x1)
+                xb = x1 + t2 * (x2 - x1)
+                lon_min, lon_max = min(xa, xb), max(xa, xb)
+
+            for col in range(self._col_of(lon_min), self._col_of(lon_max) + 1):
+                boundary_cells.setdefault((row, col), set()).add(code)
+
+    def _fill_interior_cells(self):
+        """扫描线填充：对每个纬度带的中线求交点，确定非边界网格的归属"""
+        for row in range(self.rows):
+            center_lat = -90.0 + (row + 0.5) * self.cell_size
+            grid_row = self._grid[row]
+
+            for code, edges in self._row_edges[row].items():
+                crossings = sorted(
+                    x1 + (center_lat - y1) * (x2 - x1) / (y2 - y1)
+                    for x1, y1, x2, y2 in edges
+                    if (y1 > center_lat) != (y2 > center_lat)
+                )
+                for i in range(0, len(crossings) - 1, 2):
+                    col_start = self._col_of(crossings[i])
+                    col_end = self._col_of(crossings[i + 1])
+                    for col in range(col_start, col_end + 1):
+                        if grid_row[col] is None:
+                            center_lon = -180.0 + (col + 0.5) * self.cell_size
+                            if crossings[i] <= center_lon <= crossings[i + 1]:
+                                grid_row[col] = code
+
+    def _mark_near_boundary_cells(self, boundary_cells):
+        """标记吸附距离内存在边界的空网格，其余空网格查询时直接返回None"""
+        reach = int(math.ceil(self.snap_distance / self.cell_size))
+        for row, col in boundary_cells:
+            for r in range(max(row - reach, 0), min(row + reach, self.rows - 1) + 1):
+                grid_row = self._grid[r]
+                for c in range(col - reach, col + reach + 1):
+                    if grid_row[c % self.cols] is None:
+                        grid_row[c % self.cols] = _NEAR_BOUNDARY
+
+    def _contains(self, code: str, row: int, lat: float, lon: float) -> bool:
+        """射线法判断点是否在多边形内（只检查该纬度带内的边）"""
+        inside = False
+        for x1, y1, x2, y2 in self._row_edges[row].get(code, ()):
+            if (y1 > lat) != (y2 > lat):
+                if lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        return inside
+
+    def lookup(self, lat: float, lon: float) -> Optional[str]:
+        """
+        查询坐标所在多边形的代码
+
+        Args:
+            lat: 纬度
+            lon: 经度
+
+        Returns:
+            多边形代码，不在任何多边形内（且超出吸附距离）返回None
+        """
+        row = self._row_of(lat)
+        cell = self._grid[row][self._col_of(lon)]
+        if cell.__class__ is tuple:
+            for code in cell:
+                if self._contains(code, row, lat, lon):
+                    return code
+            return self._nearest(lat, lon) if self.snap_distance > 0 else None
+        return cell
+
+    def _nearest(self, lat: float, lon: float) -> Optional[str]:
+        """在附近网格的边界中查找吸附距离内最近的多边形"""
+        reach = int(math.ceil(self.snap_distance / self.cell_size))
+        row, col = self._row_of(lat), self._col_of(lon)
+
+        best_code = None
+        best_dist_sq = self.snap_distance * self.snap_distance
+        seen = set()
+
+        for r in range(max(row - reach, 0), min(row + reach, self.rows - 1) + 1):
+            for c in range(col - reach, col + reach + 1):
+                cell = self._grid[r][c % self.cols]
+                if cell.__class__ is not tuple:
+                    continue
+                for code in cell:
+                    if (r, code) in seen:
+                        continue
+                    seen.add((r, code))
+                    for x1, y1, x2, y2 in self._row_edges[r].get(code, ()):
+                        dx, dy = x2 - x1, y2 - y1
+                        seg_len_sq = dx * dx + dy * dy
+                        t = 0.0 if seg_len_sq == 0 else ((lon - x1) * dx + (lat - y1) * dy) / seg_len_sq
+                        t = max(0.0, min(1.0, t))
+                        dist_sq = (lon - x1 - t * dx) ** 2 + (lat - y1 - t * dy) ** 2
+                        if dist_sq < best_dist_sq:
+                            best_dist_sq = dist_sq
+                            best_code = code
+
+        return best_code
+
+
+class CountryResolver:
+    """离线国家解析器（国家边界多边形 + 网格索引）"""
+
+    def __init__(self, boundaries_path: str = COUNTRY_BOUNDARIES_PATH, cell_size: float = 0.5,
+                 coastal_tolerance: float = 0.3, small_territories=SMALL_TERRITORIES):
+        """
+        Args:
+            boundaries_path: country_boundaries.json 路径
+            cell_size: 网格大小（度）
+            coastal_tolerance: 海岸附近吸附到最近国家的最大距离（度，约30km）
+            small_territories: 优先于多边形的矩形范围 [(代码, 名称, 南, 西, 北, 东), ...]
+        """
+        with open(boundaries_path, 'r', encoding='utf-8') as f:
+            boundaries = json.load(f)
+
+        countries = boundaries.get('countries', {})
+        self.country_names = {code: info.get('name', code) for code, info in countries.items()}
+        self.index = PolygonGridIndex(
+            {code: info.get('rings', []) for code, info in countries.items()},
+            cell_size=cell_size,
+            snap_distance=coastal_tolerance
+        )
+
+        # 矩形按所覆盖的网格登记，查询时只有落在这些网格内的坐标才需要比较矩形
+        self._territory_cells: Dict[Tuple[int, int], list] = {}
+        for code, name, south, west, north, east in small_territories:
+            self.country_names.setdefault(code, name)
+            for row in range(int(math.floor(south / cell_size)), int(math.floor(north / cell_size)) + 1):
+                for col in range(int(math.floor(west / cell_size)), int(math.floor(east / cell_size)) + 1):
+                    self._territory_cells.setdefault((row, col), []).append((code, south, west, north, east))
+        self._territory_cell_size = cell_size
+
+    def get_country_code(self, lat: float, lon: float) -> Optional[str]:
+        """返回坐标所在国家的ISO 2字母代码，海上或未知区域返回None"""
+        boxes = self._territory_cells.get((int(math.floor(lat / self._territory_cell_size)),
+                                           int(math.floor(lon / self._territory_cell_size))))
+        if boxes:
+            for code, south, west, north, east in boxes:
+                if south <= lat <= north and west <= lon <= east:
+                    return code
+        return self.index.lookup(lat, lon)
+
+    def get_country_name(self, country_code: str) -> str:
+        """返回国家英文名称"""
+        return self.country_names.get(country_code, country_code)
+
+
+class Admin1Resolver:
+    """
+    离线二级区域（州/省）解析器
+
+    先用国家边界确定国家，再在该国家的城镇点中查找最近点，返回其eBird区域代码
+    （相当于城镇点的 Voronoi 划分）。城镇点按 bucket_size 度分桶，查询只扫描附近的桶；
+    区域内部的桶预先记录结果，查询为一次字典访问。
+    """
+
+    def __init__(self, country_resolver: CountryResolver, points_path: str = ADMIN1_POINTS_PATH,
+                 bucket_size: float = 0.25, max_distance: float = 3.0):
+        """
+        Args:
+            country_resolver: 国家解析器
+            points_path: admin1_points.json 路径
+            bucket_size: 分桶大小（度）
+            max_distance: 最近点的最大搜索距离（度），超出则只返回国家
+        """
+        with open(points_path, 'r', encoding='utf-8') as f:
+            points_data = json.load(f)
+
+        self.country_resolver = country_resolver
+        self.bucket_size = bucket_size
+        self.max_distance = max_distance
+        self.region_codes: List[str] = points_data.get('regions', [])
+
+        # {国家代码: {(row, col): [(lat, lon, 区域索引), ...]}}
+        self._buckets: Dict[str, Dict[Tuple[int, int], list]] = {}
+        self.point_count = 0
+        for country_code, flat in points_data.get('countries', {}).items():
+            buckets = self._buckets.setdefault(country_code, {})
+            for i in range(0, len(flat), 3):
+                lat, lon = flat[i] / 100.0, flat[i + 1] / 100.0
+                key = (int(math.floor(lat / bucket_size)), int(math.floor(lon / bucket_size)))
+                buckets.setdefault(key, []).append((lat, lon, flat[i + 2]))
+                self.point_count += 1
+
+        # 本桶及相邻8个桶内的城镇点都属于同一区域时，桶内查询直接返回该区域，无需计算距离
+        self._uniform: Dict[str, Dict[Tuple[int, int], int]] = {}
+        for country_code, buckets in self._buckets.items():
+            uniform = self._uniform.setdefault(country_code, {})
+            for (row, col) in buckets:
+                indices = {idx for r in (row - 1, row, row + 1) for c in (col - 1, col, col + 1)
+                           for _, _, idx in buckets.get((r, c), ())}
+                if len(indices) == 1:
+                    uniform[(row, col)] = indices.pop()
+
+    def _nearest_region(self, country_code: str, lat: float, lon: float) -> Optional[str]:
+        """在国家内按环形逐步扩大搜索范围，查找最近城镇点的区域代码"""
+        buckets = self._buckets.get(country_code)
+        if not buckets:
+            return None
+
+        row = int(math.floor(lat / self.bucket_size))
+        col = int(math.floor(lon / self.bucket_size))
+
+        idx = self._uniform[country_code].get((row, col))
+        if idx is not None:
+            return self.region_codes[idx] if idx >= 0 else None
+
+        # 经度方向按纬度缩放距离，使高纬度地区的最近点更准确
+        lon_scale = max(math.cos(math.radians(lat)), 0.1) ** 2
+        max_reach = int(math.ceil(self.max_distance / self.bucket_size))
+
+        best_idx = None
+        best_dist_sq = self.max_distance * self.max_distance
+
+        for reach in range(max_reach + 1):
+            # 当前环之外的点距离至少为 (reach - 1) * bucket_size（经度方向按缩放计），已找到更近的点即可停止
+            if best_idx is not None and ((reach - 1) * self.bucket_size) ** 2 * lon_scale > best_dist_sq:
+                break
+            for r in range(row - reach, row + reach + 1):
+                edge_row = r == row - reach or r == row + reach
+                step = 1 if edge_row else 2 * reach
+                for c in range(col - reach, col + reach + 1, max(step, 1)):
+                    for p_lat, p_lon, idx in buckets.get((r, c), ()):
+                        dist_sq = (p_lat - lat) ** 2 + (p_lon - lon) ** 2 * lon_scale
+                        if dist_sq < best_dist_sq:
+                            best_dist_sq = dist_sq
+                            best_idx = idx
+
+        if best_idx is None or best_idx < 0:
+            return None
+        return self.region_codes[best_idx]
+
+    def get_region_code(self, lat: float, lon: float) -> Tuple[Optional[str], Optional[str]]:
+        """
+        返回 (region_code, country_code)
+
+        - 能确定州/省: ("AU-NT", "AU")
+        - 只能确定国家: ("AU", "AU")
+        - 海上或未知区域: (None, None)
+        """
+        country_code = self.country_resolver.get_country_code(lat, lon)
+        if not country_code:
+            return None, None
+        region_code = self._nearest_region(country_code, lat, lon)
+        return (region_code or country_code), country_code
+
+
+_country_resolver = None
+_admin1_resolver = None
+
+
+def get_country_resolver() -> Optional[CountryResolver]:
+    """懒加载全局国家解析器，边界数据缺失时返回None"""
+    global _country_resolver
+    if _country_resolver is None:
+        try:
+            _country_resolver = CountryResolver()
+        except Exception as e:
+            print(f"离线国家边界数据加载失败: {e}")
+            _country_resolver = False  # 标记为已尝试但失败
+    return _country_resolver if _country_resolver is not False else None
+
+
+def get_admin1_resolver() -> Optional[Admin1Resolver]:
+    """懒加载全局二级区域解析器，数据缺失时返回None"""
+    global _admin1_resolver
+    if _admin1_resolver is None:
+        country_resolver = get_country_resolver()
+        try:
+            if country_resolver is None:
+                raise FileNotFoundError(COUNTRY_BOUNDARIES_PATH)
+            _admin1_resolver = Admin1Resolver(country_resolver)
+        except Exception as e:
+            print(f"离线州/省数据加载失败: {e}")
+            _admin1_resolver = False  # 标记为已尝试但失败
+    return _admin1_resolver if _admin1_resolver is not False else None
+
+
+def benchmark_country_resolver(num_points: int = 1_000_000, seed: int = 42):
+    """测试离线国家解析器的查询性能（全球均匀随机点）"""
+    import random
+
+    start = time.perf_counter()
+    resolver = CountryResolver()
+    build_time = time.perf_counter() - start
+
+    index = resolver.index
+    print(f"索引构建: {build_time * 1000:.0f} ms，{len(resolver.country_names)} 个国家，"
+          f"网格 {index.rows}x{index.cols}，边界网格 {index.boundary_cell_count} 个")
+
+    rng = random.Random(seed)
+    points = [(rng.uniform(-90.0, 90.0), rng.uniform(-180.0, 180.0)) for _ in range(num_points)]
+
+    lookup = resolver.get_country_code
+    start = time.perf_counter()
+    results = [lookup(lat, lon) for lat, lon in points]
+    elapsed = time.perf_counter() - start
+
+    on_land = sum(1 for code in results if code)
+    print(f"查询 {num_points} 个随机点: {elapsed:.2f} 秒，平均 {elapsed / num_points * 1e6:.2f} µs/次，"
+          f"{on_land} 个点落在国家内")
+
+    # 示例坐标
+    samples = [
+        ("Darwin", -12.46, 130.84), ("Jakarta", -6.2, 106.8), ("Beijing", 39.9, 116.4),
+        ("Singapore", 1.35, 103.82), ("London", 51.5, -0.12), ("New York", 40.7, -74.0),
+        ("Nairobi", -1.29, 36.82), ("Lima", -12.05, -77.04)
+    ]
+    for name, lat, lon in samples:
+        print(f"  {name} ({lat}, {lon}) → {resolver.get_country_code(lat, lon)}")
+
+
+def benchmark_admin1_resolver(num_points: int = 200_000, seed: int = 42):
+    """测试离线州/省解析器的查询性能（在城镇点附近随机取点）"""
+    import random
+
+    start = time.perf_counter()
+    resolver = get_admin1_resolver()
+    if resolver is None:
+        return
+    build_time = time.perf_counter() - start
+    print(f"州/省索引构建: {build_time * 1000:.0f} ms，{resolver.point_count} 个城镇点，"
+          f"{len(resolver.region_codes)} 个区域")
+
+    # 以城镇点为中心加随机偏移，模拟陆地上的拍摄地点
+    anchors = [(lat, lon) for buckets in resolver._buckets.values()
+               for bucket in buckets.values() for lat, lon, _ in bucket]
+    rng = random.Random(seed)
+    points = []
+    for _ in range(num_points):
+        lat, lon = rng.choice(anchors)
+        points.append((lat + rng.uniform(-0.3, 0.3), lon + rng.uniform(-0.3, 0.3)))
+
+    lookup = resolver.get_region_code
+    start = time.perf_counter()
+    results = [lookup(lat, lon) for lat, lon in points]
+    elapsed = time.perf_counter() - start
+
+    with_region = sum(1 for region, country in results if region and region != country)
+    print(f"查询 {num_points} 个陆地点: {elapsed:.2f} 秒，平均 {elapsed / num_points * 1e6:.2f} µs/次，"
+          f"{with_region / num_points * 100:.1f}% 解析到州/省")
+
+    samples = [
+        ("Darwin", -12.46, 130.84), ("Sydney", -33.87, 151.21), ("Beijing", 39.9, 116.4),
+        ("Chengdu", 30.66, 104.07), ("Munich", 48.14, 11.58), ("Denver", 39.74, -104.99),
+        ("Bali", -8.65, 115.22), ("Lyon", 45.76, 4.84)
+    ]
+    for name, lat, lon in samples:
+        print(f"  {name} ({lat}, {lon}) → {resolver.get_region_code(lat, lon)}")
+
+
+def test_small_territories():
+    """测试微型国家和特别行政区优先于多边形网格"""
+    resolver = get_admin1_resolver()
+    assert resolver is not None, "离线边界数据缺失"
+
+    cases = [
+        ("Singapore", 1.35, 103.82, "SG"), ("Changi", 1.36, 103.99, "SG"),
+        ("Hong Kong", 22.30, 114.17, "HK"), ("Lantau", 22.26, 113.95, "HK"),
+        ("Johor Bahru", 1.49, 103.74, "MY"), ("Kuala Lumpur", 3.14, 101.69, "MY"),
+        ("Shenzhen", 22.55, 114.06, "CN"), ("Guangzhou", 23.13, 113.26, "CN"),
+    ]
+    for name, lat, lon, expected in cases:
+        region_code, country_code = resolver.get_region_code(lat, lon)
+        assert country_code == expected, f"{name} ({lat}, {lon}) → {country_code}，应为 {expected}"
+        if expected in ("SG", "HK"):
+            assert region_code == expected, f"{name} 区域代码 {region_code}，应为 {expected}"
+        print(f"  ✓ {name} ({lat}, {lon}) → {(region_code, country_code)}")
+
+    print("✓ 微型国家/特别行政区解析测试通过")
+
+
+if __name__ == "__main__":
+    if '--tests' in sys.argv:
+        test_small_territories()
+    else:
+        benchmark_country_resolver()
+        benchmark_admin1_resolver()
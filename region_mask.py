@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+区域物种掩码
+将 eBird 物种代码集合一次性转换为分类器输出上的布尔掩码（按区域缓存），
+地理筛选变为一次掩码 top-k，不再逐个候选查询数据库；
+同时保证即使区域内最可能的物种排在全局前100名之外也能被找到
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from species_pack import find_pack_region
+
+
+class RegionMaskIndex:
+    """模型类别 -> eBird代码 的映射，以及按物种集合缓存的类别掩码"""
+
+    def __init__(self, class_ebird_codes: List[Optional[str]], num_classes: int = None, cache_size: int = 64):
+        """
+        Args:
+            class_ebird_codes: 下标为 model_class_id 的eBird代码列表（无代码为None）
+            num_classes: 分类器输出维度（默认为列表长度）
+            cache_size: 缓存的掩码数量上限
+        """
+        self.num_classes = max(num_classes or 0, len(class_ebird_codes))
+        self.class_ebird_codes = list(class_ebird_codes) + [None] * (self.num_classes - len(class_ebird_codes))
+
+        # eBird代码 -> 类别ID数组（一个代码可能对应多个类别）
+        code_to_classes: Dict[str, List[int]] = {}
+        for class_id, code in enumerate(self.class_ebird_codes):
+            if code:
+                code_to_classes.setdefault(code, []).append(class_id)
+        self.code_to_classes = {code: np.array(ids, dtype=np.int64) for code, ids in code_to_classes.items()}
+
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[frozenset, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pack_loads = 0
+        self._pack_compatible: Dict[int, bool] = {}
+
+    def build_mask(self, species_codes) -> torch.Tensor:
+        """将物种代码集合转换为布尔掩码（不缓存）"""
+        mask = np.zeros(self.num_classes, dtype=bool)
+        ids = [self.code_to_classes[code] for code in species_codes if code in self.code_to_classes]
+        if ids:
+            mask[np.concatenate(ids)] = True
+        return torch.from_numpy(mask)
+
+    def _mask_from_pack(self, species_set: frozenset) -> Optional[torch.Tensor]:
+        """
+        物种集合来自离线打包文件时，直接展开该区域的类别位图作为掩码
+        （打包时的类别代码必须与当前数据库一致）
+        """
+        pack, region = find_pack_region(species_set)
+        if pack is None:
+            return None
+
+        compatible = self._pack_compatible.get(id(pack))
+        if compatible is None:
+            class_codes = pack.class_codes
+            compatible = (0 < len(class_codes) <= self.num_classes and
+                          class_codes + [None] * (self.num_classes - len(class_codes)) == self.class_ebird_codes)
+            self._pack_compatible[id(pack)] = compatible
+            if not compatible and class_codes:
+                print("⚠️ 离线打包文件的类别代码与数据库不一致，按物种代码生成掩码")
+        if not compatible:
+            return None
+
+        mask = pack.class_mask(region)
+        if len(mask) < self.num_classes:
+            mask = np.concatenate([mask, np.zeros(self.num_classes - len(mask), dtype=bool)])
+        self.pack_loads += 1
+        return torch.from_numpy(mask)
+
+    def mask_for(self, species_set) -> torch.Tensor:
+        """
+        获取物种集合对应的掩码
+
+        eBirdCountryFilter 返回的物种集合是共享的 frozenset，可直接作为缓存键（哈希值只计算一次）；
+        普通 set 会先转换为 frozenset
+        """
+        key = species_set if isinstance(species_set, frozenset) else frozenset(species_set)
+        with self._lock:
+            mask = self._cache.get(key)
+            if mask is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return mask
+            self.misses += 1
+
+        mask = self._mask_from_pack(key)
+        if mask is None:
+            mask = self.build_mask(key)
+        with self._lock:
+            self._cache[key] = mask
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return mask
+
+    def contains(self, mask: torch.Tensor, class_id: int) -> bool:
+        """类别是否在掩码内"""
+        return 0 <= class_id < self.num_classes and bool(mask[class_id])
+
+    @staticmethod
+    def _align(mask: torch.Tensor, n: int) -> torch.Tensor:
+        """将掩码长度对齐到分类器输出维度"""
+        if mask.shape[0] == n:
+            return mask
+        return mask[:n] if mask.shape[0] > n else torch.cat([mask, mask.new_zeros(n - mask.shape[0])])
+
+    @staticmethod
+    def masked_topk(probabilities: torch.Tensor, mask: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        只在掩码内的类别中取 top-k
+
+        Returns:
+            (概率, 类别ID)，按概率降序；掩码内类别不足k个时返回全部
+        """
+        mask = RegionMaskIndex._align(mask, probabilities.shape[-1])
+        k = min(k, int(mask.sum()))
+        if k <= 0:
+            return probabilities.new_empty(0), torch.empty(0, dtype=torch.long)
+        masked = probabilities.masked_fill(~mask, float('-inf'))
+        return torch.topk(masked, k)
+
+    @staticmethod
+    def select_candidates(probabilities: torch.Tensor, mask: torch.Tensor, k_inside: int,
+                          k_outside: int = 0, outside_search_k: int = 100
+                          ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        选出区域内的前 k_inside 个类别，以及全局前 outside_search_k 名中区域外的前 k_outside 个类别
+        （用于提示"被地理筛选过滤掉的物种"），合并后按概率降序返回
+
+        Returns:
+            (概率, 类别ID, 是否在区域内)
+        """
+        mask = RegionMaskIndex._align(mask, probabilities.shape[-1])
+        in_probs, in_ids = RegionMaskIndex.masked_topk(probabilities, mask, k_inside)
+
+        if k_outside > 0:
+            top_probs, top_ids = torch.topk(probabilities, min(outside_search_k, probabilities.shape[-1]))
+            inside = mask[top_ids]
+            out_probs, out_ids = top_probs[~inside][:k_outside], top_ids[~inside][:k_outside]
+        else:
+            out_probs, out_ids = probabilities.new_empty(0), torch.empty(0, dtype=torch.long)
+
+        probs = torch.cat([in_probs, out_probs])
+        ids = torch.cat([in_ids, out_ids])
+        flags = torch.cat([torch.ones(len(in_ids), dtype=torch.bool), torch.zeros(len(out_ids), dtype=torch.bool)])
+        order = torch.argsort(probs, descending=True)
+        return probs[order], ids[order], flags[order]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'num_classes': self.num_classes,
+                'mapped_codes': len(self.code_to_classes),
+                'cached_masks': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'pack_loads': self.pack_loads
+            }
+
+
+_region_mask_index = None
+_region_mask_lock = threading.Lock()
+
+
+def get_region_mask_index(db_manager, num_classes: int = None) -> Optional[RegionMaskIndex]:
+    """
+    懒加载全局区域掩码索引（需要数据库提供类别的eBird代码），不可用时返回None
+    """
+    global _region_mask_index
+    if _region_mask_index is None:
+        if db_manager is None:
+            return None
+        with _region_mask_lock:
+            if _region_mask_index is None:
+                try:
+                    codes = db_manager.get_class_ebird_codes()
+                    if not codes:
+                        raise ValueError("数据库中没有类别eBird代码")
+                    _region_mask_index = RegionMaskIndex(codes, num_classes=num_classes)
+                    print(f"✓ 区域掩码索引已加载: {len(_region_mask_index.code_to_classes)} 个eBird代码")
+                except Exception as e:
+                    print(f"区域掩码索引加载失败，使用逐个候选筛选: {e}")
+                    _region_mask_index = False  # 标记为已尝试但失败
+    return _region_mask_index if _region_mask_index is not False else None
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+识别结果缓存（按内容寻址）
+缓存键 = 文件内容哈希 + 识别参数 + 模型版本，同一张照片重复导出、改名或再次识别时直接返回结果；
+本地文件的内容哈希按 (路径, 大小, 修改时间) 记录，文件未变化时不必重新读取。
+缓存键同时作为 HTTP ETag，客户端带 If-None-Match 时无需解码图片即可返回 304
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from single_flight import SingleFlight
+from sqlite_store import LRUStore
+from tracing import CATEGORY_CACHE, span
+
+# 默认容量上限（字节）和有效期（eBird 物种列表会更新，地理筛选后的结果不宜永久使用）
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_VALIDITY_DAYS = 30
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 本地文件路径 -> 内容哈希（大小和修改时间未变化时复用）
+FILE_HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    cache_key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    cached_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_last_accessed ON results(last_accessed);
+""" + FILE_HASH_SCHEMA
+
+
+def hash_file(path: str) -> str:
+    """文件内容的 BLAKE2b 哈希（128位，按块读取）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def indexed_content_hash(conn: sqlite3.Connection, write_lock: threading.Lock, path: str,
+                         remember: bool = True) -> Tuple[str, bool]:
+    """
+    文件内容哈希；file_hashes 表中记录的路径、大小和修改时间都未变化时直接使用记录的哈希
+
+    Args:
+        remember: 是否记录路径对应的哈希（上传的临时文件不需要记录）
+
+    Returns:
+        (内容哈希, 是否复用了记录)
+    """
+    stat = os.stat(path)
+    if remember:
+        row = conn.execute("SELECT size, mtime_ns, content_hash FROM file_hashes WHERE path = ?",
+                           (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2], True
+
+    with span('hash_file', CATEGORY_CACHE, bytes=stat.st_size):
+        content_hash = hash_file(path)
+    if remember:
+        try:
+            with write_lock:
+                conn.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, content_hash) "
+                             "VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, content_hash))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"记录文件哈希失败: {e}")
+    return content_hash, False
+
+
+def make_cache_key(content_hash: str, params: dict, model_version: str) -> str:
+    """由内容哈希、识别参数和模型版本生成缓存键（同时用作 ETag）"""
+    payload = json.dumps([content_hash, params, model_version], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ResultCache(LRUStore):
+    """识别结果缓存（SQLite，线程安全，并发的相同请求只计算一次）"""
+    table = 'results'
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES, validity_days: int = DEFAULT_VALIDITY_DAYS):
+        """
+        Args:
+            db_path: 数据库文件路径
+            max_bytes: 容量上限，超出后淘汰最久未访问的结果
+            validity_days: 结果有效期（天）
+        """
+        super().__init__(db_path, SCHEMA, max_bytes)
+        self.validity_seconds = validity_days * 86400
+        self.flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.hash_reuses = 0
+
+    def content_hash(self, path: str, remember: bool = True) -> str:
+        """文件内容哈希（remember=False 用于上传的临时文件）"""
+        content_hash, reused = indexed_content_hash(self._get_connection(), self._write_lock, path, remember)
+        if reused:
+            self.hash_reuses += 1
+        return content_hash
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """读取未过期的结果，不存在返回None"""
+        conn = self._get_connection()
+        with span('result_cache', CATEGORY_CACHE):
+            row = conn.execute("SELECT result, cached_at, last_accessed FROM results WHERE cache_key = ?",
+                               (cache_key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.validity_seconds:
+            return None
+        self._touch(conn, [(cache_key, row[2])])
+        return json.loads(row[0])
+
+    def lookup(self, cache_key: str) -> Optional[dict]:
+        """读取结果并计入命中率统计"""
+        result = self.get(cache_key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, cache_key: str, result: dict) -> None:
+        """写入结果，并在超出容量上限时淘汰最久未访问的结果"""
+        result_json = json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            with self._write_lock:
+                replaced = self._replaced_bytes(conn, cache_key)
+                conn.execute("INSERT OR REPLACE INTO results (cache_key, result, cached_at, last_accessed, size_bytes) "
+                             "VALUES (?, ?, ?, ?, ?)", (cache_key, result_json, now, now, len(result_json)))
+                self._total_bytes += len(result_json) - replaced
+                self._enforce_quota(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"写入识别结果缓存失败: {e}")
+
+    def get_or_compute(self, cache_key: str, compute: Callable[[], dict]) -> Tuple[dict, bool]:
+        """
+        读取缓存，未命中时计算并写入（只缓存 success 为真的结果）；
+        同一缓存键的并发请求合并为一次计算
+
+        Returns:
+            (结果, 是否命中缓存)
+        """
+        result = self.get(cache_key)
+        if result is not None:
+            self.hits += 1
+            return result, True
+
+        def compute_once():
+            # 两次检查之间可能已有相同的请求刚完成并写入
+            cached = self.get(cache_key)
+            if cached is not None:
+                return cached, True
+            computed = compute()
+            if computed.get('success'):
+                self.put(cache_key, computed)
+            return computed, False
+
+        result, hit = self.flight.do(cache_key, compute_once)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return result, hit
+
+    def get_stats(self) -> dict:
+        entries = self._get_connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'size_mb': round(self._total_bytes / 1024 / 1024, 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0,
+            'hash_reuses': self.hash_reuses,
+            'coalescing': self.flight.get_stats()
+        }
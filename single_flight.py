@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+并发请求合并（single-flight）
+同一个键同时只执行一次，其余并发调用等待并共享这次执行的结果（或异常）
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """一次正在执行的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    按键合并并发调用
+
+    用法:
+        flight = SingleFlight()
+        result = flight.do(cache_key, lambda: fetch(cache_key))
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        执行 func，同一 key 已有调用在执行时等待其结果
+
+        func 抛出的异常会同样抛给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """正在执行的键数量"""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'shared': self.shared,
+                'in_flight': len(self._calls)
+            }
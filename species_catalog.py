@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+内存物种目录
+启动时将 BirdCountInfo 一次性读入按 model_class_id 索引的列式数组，
+候选结果的名称、学名、eBird代码和地理区域都是 O(1) 查找，不再为每个候选打开数据库连接；
+描述文本较大，按需从数据库读取并缓存
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+
+class SpeciesCatalog:
+    """按 model_class_id 索引的物种信息列存储"""
+
+    COLUMNS = ('english_name', 'chinese_simplified', 'chinese_traditional', 'scientific_name', 'ebird_code', 'region')
+
+    def __init__(self, records: Sequence[Optional[tuple]], region_of: Callable[[str], str] = None,
+                 db_manager=None, num_classes: int = None):
+        """
+        Args:
+            records: 下标为 model_class_id 的
+                     (id, english_name, chinese_simplified, chinese_traditional, scientific_name, ebird_code)，缺失为None
+            region_of: 由英文名推断地理区域的函数（默认不推断）
+            db_manager: 用于按需读取描述的数据库管理器（可为None）
+            num_classes: 类别数（默认为 records 长度）
+        """
+        self.num_classes = max(num_classes or 0, len(records))
+        self.db_manager = db_manager
+
+        self.ids = np.full(self.num_classes, -1, dtype=np.int64)
+        columns = {name: np.empty(self.num_classes, dtype=object) for name in self.COLUMNS}
+        self.known = np.zeros(self.num_classes, dtype=bool)
+
+        for class_id, record in enumerate(records):
+            if not record:
+                continue
+            bird_id, english_name, chinese_simplified, chinese_traditional, scientific_name, ebird_code = record
+            self.ids[class_id] = bird_id if bird_id is not None else -1
+            columns['english_name'][class_id] = english_name
+            columns['chinese_simplified'][class_id] = chinese_simplified
+            columns['chinese_traditional'][class_id] = chinese_traditional
+            columns['scientific_name'][class_id] = scientific_name
+            columns['ebird_code'][class_id] = ebird_code or None
+            columns['region'][class_id] = region_of(english_name) if region_of else 'Unknown'
+            self.known[class_id] = bool(chinese_simplified and english_name)
+
+        self.english_names = columns['english_name']
+        self.chinese_names = columns['chinese_simplified']
+        self.traditional_names = columns['chinese_traditional']
+        self.scientific_names = columns['scientific_name']
+        self.ebird_codes = columns['ebird_code']
+        self.regions = columns['region']
+
+        self._descriptions: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bird_info_record(row: list) -> Optional[tuple]:
+        if len(row) < 2:
+            return None
+        return None, row[1], row[0], None, row[2] if len(row) > 2 else None, None
+
+    @classmethod
+    def from_database(cls, db_manager, region_of: Callable[[str], str] = None,
+                      bird_info: list = None) -> 'SpeciesCatalog':
+        """
+        从数据库一次性加载（单次查询）
+
+        Args:
+            bird_info: 数据库中缺失的类别回退使用 birdinfo.json 的名称（与原逐个查询的回退逻辑一致）
+        """
+        records = list(db_manager.get_class_records())
+        if not records:
+            raise ValueError("数据库中没有类别信息")
+        if bird_info:
+            records.extend([None] * (len(bird_info) - len(records)))
+            for class_id, row in enumerate(bird_info):
+                if records[class_id] is None:
+                    records[class_id] = cls._bird_info_record(row)
+        return cls(records, region_of=region_of, db_manager=db_manager)
+
+    @classmethod
+    def from_bird_info(cls, bird_info: list, region_of: Callable[[str], str] = None) -> 'SpeciesCatalog':
+        """从 birdinfo.json 加载（无数据库时：只有名称和学名，没有eBird代码和描述）"""
+        return cls([cls._bird_info_record(row) for row in bird_info], region_of=region_of)
+
+    def __len__(self) -> int:
+        return self.num_classes
+
+    def contains(self, class_id: int) -> bool:
+        """类别是否有中英文名称"""
+        return 0 <= class_id < self.num_classes and bool(self.known[class_id])
+
+    def ebird_code(self, class_id: int) -> Optional[str]:
+        return self.ebird_codes[class_id] if 0 <= class_id < self.num_classes else None
+
+    def region(self, class_id: int) -> str:
+        return self.regions[class_id] if 0 <= class_id < self.num_classes else 'Unknown'
+
+    def get_descriptions(self, class_id: int) -> tuple:
+        """按需读取 (简短描述, 完整描述)，结果缓存"""
+        cached = self._descriptions.get(class_id)
+        if cached is not None:
+            return cached
+
+        descriptions = (None, None)
+        if self.db_manager is not None:
+            detail = self.db_manager.get_bird_by_class_id(class_id)
+            if detail:
+                descriptions = (detail.get('short_description_zh'), detail.get('full_description_zh'))
+        with self._lock:
+            self._descriptions[class_id] = descriptions
+        return descriptions
+
+    def get_bird(self, class_id: int, with_description: bool = False) -> Optional[dict]:
+        """
+        与 BirdDatabaseManager.get_bird_by_class_id 相同结构的字典
+
+        Args:
+            with_description: 是否读取描述（需要查询数据库）
+        """
+        if not self.contains(class_id):
+            return None
+        bird = {
+            'id': int(self.ids[class_id]) if self.ids[class_id] >= 0 else None,
+            'english_name': self.english_names[class_id],
+            'chinese_simplified': self.chinese_names[class_id],
+            'chinese_traditional': self.traditional_names[class_id],
+            'scientific_name': self.scientific_names[class_id],
+            'ebird_code': self.ebird_codes[class_id]
+        }
+        if with_description:
+            bird['short_description_zh'], bird['full_description_zh'] = self.get_descriptions(class_id)
+        return bird
+
+    def get_columns(self, class_ids: Sequence[int]) -> Dict[str, list]:
+        """批量取出一组候选的各列（向量化索引）"""
+        ids = np.asarray(class_ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < self.num_classes)]
+        return {
+            'class_id': ids.tolist(),
+            'english_name': self.english_names[ids].tolist(),
+            'chinese_simplified': self.chinese_names[ids].tolist(),
+            'scientific_name': self.scientific_names[ids].tolist(),
+            'ebird_code': self.ebird_codes[ids].tolist(),
+            'region': self.regions[ids].tolist(),
+            'known': self.known[ids].tolist()
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            'classes': self.num_classes,
+            'known': int(self.known.sum()),
+            'with_ebird_code': int(sum(1 for code in self.ebird_codes if code)),
+            'cached_descriptions': len(self._descriptions)
+        }
+
+
+def benchmark_species_catalog(catalog: SpeciesCatalog, db_manager=None, k: int = 1000, rounds: int = 20, seed: int = 42):
+    """
+    对比 k 个候选的信息组装耗时：内存目录 vs 逐个候选查询数据库
+    """
+    rng = np.random.default_rng(seed)
+    candidates = [rng.choice(catalog.num_classes, size=min(k, catalog.num_classes), replace=False).tolist()
+                  for _ in range(rounds)]
+
+    start = time.perf_counter()
+    for class_ids in candidates:
+        for class_id in class_ids:
+            if catalog.contains(class_id):
+                catalog.english_names[class_id], catalog.chinese_names[class_id]
+                catalog.ebird_code(class_id), catalog.region(class_id)
+    catalog_time = (time.perf_counter() - start) / rounds
+    print(f"内存目录组装 k={k}: {catalog_time * 1000:.2f} ms/次（{catalog_time / k * 1e6:.2f} µs/候选）")
+
+    start = time.perf_counter()
+    for class_ids in candidates:
+        catalog.get_columns(class_ids)
+    columns_time = (time.perf_counter() - start) / rounds
+    print(f"内存目录批量列读取 k={k}: {columns_time * 1000:.2f} ms/次")
+
+    if db_manager is not None:
+        db_rounds = max(1, rounds // 10)
+        start = time.perf_counter()
+        for class_ids in candidates[:db_rounds]:
+            for class_id in class_ids:
+                bird = db_manager.get_bird_by_class_id(class_id)
+                if bird:
+                    db_manager.get_ebird_code_by_english_name(bird['english_name'])
+        db_time = (time.perf_counter() - start) / db_rounds
+        print(f"逐个查询数据库 k={k}: {db_time * 1000:.1f} ms/次（内存目录快 {db_time / catalog_time:.0f} 倍）")
+
+
+if __name__ == "__main__":
+    import json
+    import os
+
+    from SuperBirdId import BIRD_INFO_PATH, get_bird_region, lazy_load_database
+
+    database = lazy_load_database()
+    if database:
+        species_catalog = SpeciesCatalog.from_database(database, region_of=get_bird_region)
+    else:
+        with open(BIRD_INFO_PATH, 'r', encoding='utf-8') as f:
+            species_catalog = SpeciesCatalog.from_bird_info(json.load(f), region_of=get_bird_region)
+    print(species_catalog.get_stats())
+    benchmark_species_catalog(species_catalog, database)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+离线物种列表打包文件
+将 offline_ebird_data 中所有国家/地区的物种列表编译为一个二进制文件：
+每个区域一行定长位图（按模型类别ID排列，其后为没有对应类别的eBird代码），
+运行时通过 mmap 只读映射，按需读取单行，几乎不占常驻内存
+
+文件布局（小端）:
+    头部      HEADER_FORMAT
+    区域索引  JSON {区域代码: [行号, 物种数]}
+    代码表    JSON [位 -> eBird代码]，前 num_class_bits 位对应 model_class_id（无代码为null）
+    位图      num_regions 行，每行 row_bytes 字节（8字节对齐），位序为 little
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+PACK_FILENAME = "species_pack.bin"
+PACK_MAGIC = b'SBSP'
+PACK_VERSION = 1
+
+# magic, version, 保留, 总位数, 类别位数, 区域数, 每行字节数, 索引长度, 代码表长度, 位图偏移
+HEADER_FORMAT = '<4sHHIIIIIIQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+def _align8(value: int) -> int:
+    return (value + 7) & ~7
+
+
+def _read_species_file(path: str) -> Tuple[str, List[str]]:
+    """读取 species_list_XX.json，返回 (区域代码, 物种代码列表)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    region = data.get('country_code') or os.path.basename(path)[len('species_list_'):-len('.json')]
+    return region, data.get('species', [])
+
+
+def _source_version(offline_dir: str) -> Optional[str]:
+    """离线数据版本（offline_index.json 的生成时间），用于判断打包文件是否过期"""
+    try:
+        with open(os.path.join(offline_dir, "offline_index.json"), 'r', encoding='utf-8') as f:
+            return json.load(f).get('created_at')
+    except Exception:
+        return None
+
+
+def build_species_pack(offline_dir: str, output_path: str = None,
+                       class_ebird_codes: List[Optional[str]] = None) -> dict:
+    """
+    将离线目录中的所有物种列表编译为打包文件
+
+    Args:
+        offline_dir: 离线数据目录（包含 species_list_*.json）
+        output_path: 输出文件路径，默认为 offline_dir/species_pack.bin
+        class_ebird_codes: 下标为 model_class_id 的eBird代码列表（来自数据库）；
+                           为None时所有代码都放在类别位之后，打包文件不提供类别掩码
+
+    Returns:
+        打包统计信息
+    """
+    output_path = output_path or os.path.join(offline_dir, PACK_FILENAME)
+    class_codes = list(class_ebird_codes or [])
+
+    regions: Dict[str, List[str]] = {}
+    for path in sorted(glob.glob(os.path.join(offline_dir, "species_list_*.json"))):
+        try:
+            region, species = _read_species_file(path)
+        except Exception as e:
+            print(f"⚠️ 跳过无法读取的物种列表 {path}: {e}")
+            continue
+        regions[region] = species
+
+    if not regions:
+        raise ValueError(f"离线目录中没有物种列表: {offline_dir}")
+
+    # 代码 -> 位（一个代码可能对应多个类别位）；不属于任何类别的代码追加在类别位之后
+    code_bits: Dict[str, List[int]] = {}
+    for bit, code in enumerate(class_codes):
+        if code:
+            code_bits.setdefault(code, []).append(bit)
+    all_codes = {code for species in regions.values() for code in species}
+    extra_codes = sorted(all_codes - code_bits.keys())
+    for offset, code in enumerate(extra_codes):
+        code_bits[code] = [len(class_codes) + offset]
+
+    num_class_bits = len(class_codes)
+    num_bits = num_class_bits + len(extra_codes)
+    row_bytes = _align8((num_bits + 7) // 8)
+
+    region_names = sorted(regions)
+    rows = np.zeros((len(region_names), row_bytes * 8), dtype=bool)
+    index = {}
+    for row, region in enumerate(region_names):
+        species = set(regions[region])
+        bits = [bit for code in species for bit in code_bits[code]]
+        rows[row, bits] = True
+        index[region] = [row, len(species)]
+    packed = np.packbits(rows, axis=1, bitorder='little')
+
+    index_blob = json.dumps({'created_at': datetime.now().isoformat(), 'source': _source_version(offline_dir),
+                             'regions': index},
+                            ensure_ascii=False).encode('utf-8')
+    codes_blob = json.dumps(class_codes + extra_codes, ensure_ascii=False).encode('utf-8')
+    data_offset = _align8(HEADER_SIZE + len(index_blob) + len(codes_blob))
+
+    header = struct.pack(HEADER_FORMAT, PACK_MAGIC, PACK_VERSION, 0, num_bits, num_class_bits,
+                         len(region_names), row_bytes, len(index_blob), len(codes_blob), data_offset)
+
+    # 先写临时文件再替换，避免运行中的进程映射到写了一半的文件
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(index_blob)
+        f.write(codes_blob)
+        f.write(b'\0' * (data_offset - f.tell()))
+        f.write(packed.tobytes())
+    os.replace(temp_path, output_path)
+
+    # 校验：解码结果必须与原始列表完全一致
+    pack = SpeciesPack(output_path)
+    try:
+        for region, species in regions.items():
+            if pack.get_species(region) != frozenset(species):
+                raise ValueError(f"打包校验失败: {region}")
+    finally:
+        pack.close()
+
+    stats = {
+        'regions': len(region_names),
+        'bits': num_bits,
+        'class_bits': num_class_bits,
+        'extra_codes': len(extra_codes),
+        'file_size': os.path.getsize(output_path),
+        'json_size': sum(os.path.getsize(p) for p in glob.glob(os.path.join(offline_dir, "species_list_*.json")))
+    }
+    print(f"✓ 物种打包文件已生成: {output_path}")
+    print(f"  {stats['regions']} 个区域，{num_bits} 位/行（{num_class_bits} 个类别位 + {len(extra_codes)} 个额外代码），"
+          f"{stats['file_size'] / 1024:.0f} KB（JSON 共 {stats['json_size'] / 1024:.0f} KB）")
+    return stats
+
+
+class SpeciesPack:
+    """物种打包文件的只读 mmap 读取器（线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, _, self.num_bits, self.num_class_bits, self.num_regions, self.row_bytes,
+             index_len, codes_len, data_offset) = struct.unpack_from(HEADER_FORMAT, self._mmap, 0)
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise ValueError(f"不支持的物种打包文件格式: {magic!r} v{version}")
+
+            index = json.loads(self._mmap[HEADER_SIZE:HEADER_SIZE + index_len].decode('utf-8'))
+            self.created_at = index.get('created_at')
+            self.source = index.get('source')
+            self._index: Dict[str, Tuple[int, int]] = {region: tuple(entry) for region, entry in index['regions'].items()}
+            self._codes_range = (HEADER_SIZE + index_len, HEADER_SIZE + index_len + codes_len)
+            self._rows = np.frombuffer(self._mmap, dtype=np.uint8, count=self.num_regions * self.row_bytes,
+                                       offset=data_offset).reshape(self.num_regions, self.row_bytes)
+        except Exception:
+            self.close()
+            raise
+
+        self._codes: Optional[np.ndarray] = None
+        self._species: Dict[str, frozenset] = {}
+        self._region_by_set: Dict[frozenset, str] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, region: str) -> bool:
+        return region in self._index
+
+    def regions(self) -> List[str]:
+        return sorted(self._index)
+
+    def species_count(self, region: str) -> int:
+        return self._index[region][1]
+
+    def _bits(self, region: str, count: int) -> np.ndarray:
+        row = self._rows[self._index[region][0]]
+        return np.unpackbits(row, count=count, bitorder='little').view(bool)
+
+    @property
+    def codes(self) -> np.ndarray:
+        """位 -> eBird代码（首次访问时解析）"""
+        if self._codes is None:
+            start, end = self._codes_range
+            codes = json.loads(self._mmap[start:end].decode('utf-8'))
+            self._codes = np.array([code or '' for code in codes], dtype=object)
+        return self._codes
+
+    @property
+    def class_codes(self) -> List[Optional[str]]:
+        """类别位对应的eBird代码（下标为 model_class_id）"""
+        return [code or None for code in self.codes[:self.num_class_bits]]
+
+    def class_mask(self, region: str) -> np.ndarray:
+        """区域的类别掩码（长度为 num_class_bits 的布尔数组），直接由位图展开"""
+        return self._bits(region, self.num_class_bits)
+
+    def get_species(self, region: str) -> Optional[frozenset]:
+        """解码区域的物种代码集合（同一区域返回同一个 frozenset 对象）"""
+        species = self._species.get(region)
+        if species is not None or region not in self._index:
+            return species
+
+        # 打包时只为有代码的位置位，解码结果不含空代码
+        bits = np.flatnonzero(self._bits(region, self.num_bits))
+        species = frozenset(self.codes[bits].tolist())
+        with self._lock:
+            species = self._species.setdefault(region, species)
+            self._region_by_set[species] = region
+        return species
+
+    def region_of(self, species_set) -> Optional[str]:
+        """如果物种集合是由本文件解码得到的，返回其区域代码"""
+        return self._region_by_set.get(species_set)
+
+    def close(self) -> None:
+        self._rows = None
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+_species_packs: Dict[str, Optional[SpeciesPack]] = {}
+_species_packs_lock = threading.Lock()
+
+
+def get_species_pack(offline_dir: str) -> Optional[SpeciesPack]:
+    """获取离线目录对应的共享打包文件读取器，文件不存在或无法读取时返回None"""
+    path = os.path.abspath(os.path.join(offline_dir, PACK_FILENAME))
+    if path in _species_packs:
+        return _species_packs[path]
+
+    with _species_packs_lock:
+        if path not in _species_packs:
+            pack = None
+            if os.path.exists(path):
+                try:
+                    pack = SpeciesPack(path)
+                    if pack.source != _source_version(offline_dir):
+                        # 离线数据更新后未重新打包
+                        pack.close()
+                        pack = None
+                        print("⚠️ 物种打包文件已过期，使用JSON离线数据（请重新运行 species_pack.py）")
+                    else:
+                        print(f"✓ 物种打包文件已映射: {pack.num_regions} 个区域")
+                except Exception as e:
+                    print(f"⚠️ 物种打包文件无法读取，使用JSON离线数据: {e}")
+            _species_packs[path] = pack
+    return _species_packs[path]
+
+
+def find_pack_region(species_set) -> Tuple[Optional[SpeciesPack], Optional[str]]:
+    """查找物种集合来自哪个已打开的打包文件及区域"""
+    for pack in list(_species_packs.values()):
+        if pack is not None:
+            region = pack.region_of(species_set)
+            if region is not None:
+                return pack, region
+    return None, None
+
+
+def benchmark_species_pack(offline_dir: str, rounds: int = 1000):
+    """对比打包文件与JSON的单区域加载耗时"""
+    pack = SpeciesPack(os.path.join(offline_dir, PACK_FILENAME))
+    regions = pack.regions()
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        pack.class_mask(regions[i % len(regions)])
+    mask_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for region in regions:
+        pack.get_species(region)
+    decode_time = (time.perf_counter() - start) / len(regions)
+
+    start = time.perf_counter()
+    for region in regions:
+        _read_species_file(os.path.join(offline_dir, f"species_list_{region}.json"))
+    json_time = (time.perf_counter() - start) / len(regions)
+
+    print(f"类别掩码: {mask_time * 1e6:.1f} µs/区域")
+    print(f"物种集合解码: {decode_time * 1e6:.0f} µs/区域（JSON 读取: {json_time * 1e6:.0f} µs/区域）")
+    pack.close()
+
+
+if __name__ == "__main__":
+    # 用法: python3 species_pack.py [离线数据目录] [--benchmark]
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    directory = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_ebird_data")
+
+    if '--benchmark' in sys.argv:
+        benchmark_species_pack(directory)
+    else:
+        codes = None
+        try:
+            from bird_database_manager import BirdDatabaseManager
+            codes = BirdDatabaseManager().get_class_ebird_codes()
+        except Exception as e:
+            print(f"⚠️ 数据库不可用，打包文件将不包含类别位: {e}")
+        build_species_pack(directory, class_ebird_codes=codes)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+物种全文搜索
+在内存 SQLite 中为英文名、简繁中文名、学名和拼音建立 FTS5 索引，支持前缀查询和相关度排序，
+替代逐个按键对整张表执行 LIKE '%q%' 的全表扫描
+
+中文名按单字切分后建索引，"头鹎" 这样的名称片段也能以短语方式匹配；
+安装 pypinyin 后额外索引全拼、连写全拼和首字母（如 "bai tou bei"、"baitoubei"、"btb"）
+"""
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+try:
+    from pypinyin import lazy_pinyin
+    PINYIN_AVAILABLE = True
+except ImportError:
+    PINYIN_AVAILABLE = False
+
+# 各列的 bm25 权重：名称命中优先于学名和拼音
+COLUMN_WEIGHTS = {
+    'english_name': 10.0,
+    'chinese_simplified': 10.0,
+    'chinese_traditional': 8.0,
+    'scientific_name': 5.0,
+    'pinyin': 4.0,
+}
+
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_TOKEN_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[0-9A-Za-z\u00c0-\u024f]+')
+
+
+def _spaced_chars(text: Optional[str]) -> str:
+    """中文名按单字切分（unicode61 分词器会把连续汉字当作一个词）"""
+    return ' '.join(_CJK_RE.findall(text or ''))
+
+
+def _pinyin_tokens(text: Optional[str]) -> str:
+    """全拼、连写全拼和首字母，未安装 pypinyin 时为空"""
+    if not PINYIN_AVAILABLE or not text:
+        return ''
+    syllables = [s.lower() for s in lazy_pinyin(''.join(_CJK_RE.findall(text))) if s.isalpha()]
+    if not syllables:
+        return ''
+    return ' '.join(syllables + [''.join(syllables), ''.join(s[0] for s in syllables)])
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    将用户输入转换为 FTS5 MATCH 表达式（各词之间为 AND）
+
+    中文片段作为单字短语匹配，其他词作为前缀匹配；无有效词时返回None
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(query or ''):
+        if _CJK_RE.match(token):
+            terms.append('"' + ' '.join(token) + '"')
+        else:
+            terms.append(f'"{token.lower()}"*')
+    return ' '.join(terms) if terms else None
+
+
+class SpeciesSearchIndex:
+    """内存 FTS5 物种索引（线程安全）"""
+
+    def __init__(self, records: Sequence[tuple]):
+        """
+        Args:
+            records: (id, model_class_id, english_name, chinese_simplified, chinese_traditional,
+                      scientific_name, ebird_code) 列表
+        """
+        start = time.perf_counter()
+        self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(f"""
+            CREATE VIRTUAL TABLE species_fts USING fts5(
+                {', '.join(COLUMN_WEIGHTS)},
+                tokenize = 'unicode61 remove_diacritics 2'
+            )""")
+
+        self._records: Dict[int, tuple] = {}
+        rows = []
+        for record in records:
+            bird_id, _, english_name, chinese_simplified, chinese_traditional, scientific_name, _ = record
+            self._records[bird_id] = record
+            rows.append((bird_id, english_name or '', _spaced_chars(chinese_simplified),
+                         _spaced_chars(chinese_traditional), scientific_name or '',
+                         _pinyin_tokens(chinese_simplified)))
+        with self._conn:
+            self._conn.executemany(f"INSERT INTO species_fts(rowid, {', '.join(COLUMN_WEIGHTS)}) "
+                                   f"VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT INTO species_fts(species_fts) VALUES ('optimize')")
+
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS.values())
+        self._search_sql = (f"SELECT rowid FROM species_fts WHERE species_fts MATCH ? "
+                            f"ORDER BY bm25(species_fts, {weights}) LIMIT ?")
+        self.build_time = time.perf_counter() - start
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        搜索物种，按相关度排序；名称与查询完全一致的结果排在最前
+
+        Returns:
+            与 BirdDatabaseManager.search_birds 相同结构的字典列表（另含 model_class_id）
+        """
+        match = build_match_query(query)
+        if match is None or limit <= 0:
+            return []
+
+        with self._lock:
+            self.queries += 1
+            # 多取一些结果，保证完全匹配的名称即使 bm25 排名靠后也能提到最前
+            ids = [row[0] for row in self._conn.execute(self._search_sql, (match, max(limit * 4, 20)))]
+
+        normalized = query.strip().lower()
+        records = [self._records[bird_id] for bird_id in ids]
+        records.sort(key=lambda r: not any(name and name.lower() == normalized for name in (r[2], r[3], r[4], r[5])))
+        return [
+            {
+                'id': record[0],
+                'model_class_id': record[1],
+                'english_name': record[2],
+                'chinese_simplified': record[3],
+                'ebird_code': record[6],
+                'scientific_name': record[5]
+            }
+            for record in records[:limit]
+        ]
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self._records),
+            'build_ms': round(self.build_time * 1000, 1),
+            'pinyin': PINYIN_AVAILABLE,
+            'queries': self.queries
+        }
+
+
+def benchmark_species_search(index: SpeciesSearchIndex, queries: Sequence[str], rounds: int = 200):
+    """每个查询的平均耗时"""
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            results = index.search(query)
+        elapsed = (time.perf_counter() - start) / rounds
+        top = results[0]['chinese_simplified'] if results else '-'
+        print(f"{query!r}: {elapsed * 1e6:.0f} µs, {len(results)} 条结果, 首位: {top}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    from bird_database_manager import BirdDatabaseManager
+
+    db_manager = BirdDatabaseManager(sys.argv[1] if len(sys.argv) > 1 else None)
+    search_index = SpeciesSearchIndex(db_manager.get_search_records())
+    print(search_index.get_stats())
+    benchmark_species_search(search_index, ['magpie', 'mag', '喜鹊', '白头', 'Pica pica', 'xique', 'btb'])
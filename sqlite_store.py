@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+SQLite 存储基类
+SQLiteStore: 每个线程独立连接（WAL 模式），供任务库和各缓存共用；
+LRUStore: 在此基础上按容量上限做LRU淘汰，识别结果、中间结果和 eBird 物种列表缓存都继承它
+"""
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+# 访问时间的更新间隔（秒），避免每次读取都产生写事务
+TOUCH_INTERVAL = 60
+
+
+class SQLiteStore:
+    """每个线程独立连接的 SQLite 数据库（WAL 模式支持多线程、多进程并发读写）"""
+
+    def __init__(self, db_path: str, schema: str, timeout: float = 10, isolation_level: Optional[str] = ''):
+        """
+        Args:
+            db_path: 数据库文件路径
+            schema: 建表语句（首次打开时执行）
+            timeout: 等待其他连接释放写锁的秒数
+            isolation_level: 传给 sqlite3.connect，None 表示自动提交（由调用方显式 BEGIN）
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+
+        conn = self._get_connection()
+        conn.executescript(schema)
+        conn.commit()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=self.isolation_level)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """关闭当前线程的连接（之后的查询会重新建立连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class LRUStore(SQLiteStore):
+    """
+    按容量上限做LRU淘汰的缓存表
+
+    子类设置 table，表中需有 cache_key（主键）、last_accessed 和 size_bytes 列；
+    写入在 _write_lock 下进行，并用 _replaced_bytes 维护 _total_bytes（供统计显示）；
+    同一数据库可能被多个进程写入，_enforce_quota 在写事务内重新统计实际大小后再决定是否淘汰
+    """
+    table = None
+
+    def __init__(self, db_path: str, schema: str, max_bytes: int):
+        super().__init__(db_path, schema)
+        self.max_bytes = max_bytes
+        self._write_lock = threading.Lock()
+        self._refresh_total_bytes(self._get_connection())
+
+    def _refresh_total_bytes(self, conn: sqlite3.Connection) -> int:
+        """从数据库重新统计总大小（其他进程的写入不会反映在本进程的 _total_bytes 中）"""
+        self._total_bytes = conn.execute(f"SELECT COALESCE(SUM(size_bytes), 0) FROM {self.table}").fetchone()[0]
+        return self._total_bytes
+
+    def _touch(self, conn: sqlite3.Connection, entries: Iterable[Tuple[str, float]]) -> None:
+        """
+        更新读取到的条目的访问时间（距上次更新不足 TOUCH_INTERVAL 的跳过）
+
+        Args:
+            entries: [(cache_key, 读取到的 last_accessed), ...]
+        """
+        now = time.time()
+        stale = [(now, cache_key) for cache_key, last_accessed in entries if now - last_accessed > TOUCH_INTERVAL]
+        if not stale:
+            return
+        try:
+            with self._write_lock:
+                conn.executemany(f"UPDATE {self.table} SET last_accessed = ? WHERE cache_key = ?", stale)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"更新缓存访问时间失败: {e}")
+
+    def _replaced_bytes(self, conn: sqlite3.Connection, cache_key: str) -> int:
+        """即将被覆盖的条目大小（写入前调用，调用方持有写锁）"""
+        row = conn.execute(f"SELECT size_bytes FROM {self.table} WHERE cache_key = ?", (cache_key,)).fetchone()
+        return row[0] if row else 0
+
+    def _enforce_quota(self, conn: sqlite3.Connection) -> int:
+        """
+        超出容量上限时按最久未访问顺序淘汰到上限的90%，避免每次写入都触发淘汰
+        （调用方持有写锁，且已在本连接的写事务中写入，统计结果包含其他进程已提交的写入）
+        """
+        if self._refresh_total_bytes(conn) <= self.max_bytes:
+            return 0
+        return self._evict_lru(conn, int(self.max_bytes * 0.9))
+
+    def _evict_lru(self, conn: sqlite3.Connection, target_bytes: int) -> int:
+        """按最久未访问顺序删除条目直到总大小不超过 target_bytes，返回删除的条目数"""
+        evicted = 0
+        while self._total_bytes > target_bytes:
+            rows = conn.execute(
+                f"SELECT cache_key, size_bytes FROM {self.table} ORDER BY last_accessed LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            victims = []
+            for cache_key, size_bytes in rows:
+                if self._total_bytes <= target_bytes:
+                    break
+                victims.append((cache_key,))
+                self._total_bytes -= size_bytes
+            conn.executemany(f"DELETE FROM {self.table} WHERE cache_key = ?", victims)
+            evicted += len(victims)
+        return evicted
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+识别中间结果缓存（按图片内容寻址）
+缓存每张图片的 YOLO 检测框和分类器原始 logits：更换筛选地区、top_k 或温度时只需重新做 softmax 和筛选，
+不必重新解码图片、检测和前向推理。API、GUI 和命令行通过 SuperBirdId.lazy_load_stage_cache() 共用同一个缓存
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from typing import Dict, Optional
+
+import numpy as np
+
+from result_cache import FILE_HASH_SCHEMA, indexed_content_hash
+from sqlite_store import LRUStore
+from tracing import CATEGORY_CACHE, span
+
+# 默认容量上限（字节）：logits 每张约 44KB（float32），256MB 约可缓存 5000 多张图片
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+STAGE_DETECTION = 'detection'
+STAGE_LOGITS = 'logits'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    cache_key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    data BLOB NOT NULL,
+    cached_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    size_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stages_last_accessed ON stages(last_accessed);
+""" + FILE_HASH_SCHEMA
+
+# 一张图片在某个处理流程下的缓存键
+StageKeys = namedtuple('StageKeys', ['detection', 'logits'])
+
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """模型文件标识（文件名 + 大小 + 修改时间），文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return f'{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}'
+
+
+def stage_key(content_hash: str, stage: str, params: dict, model_version: Optional[str]) -> str:
+    payload = json.dumps([content_hash, stage, params, model_version], sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class StageCache(LRUStore):
+    """检测框和 logits 缓存（SQLite，线程安全，按容量上限做LRU淘汰）"""
+    table = 'stages'
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES, model_versions: Dict[str, str] = None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            max_bytes: 容量上限，超出后淘汰最久未访问的条目
+            model_versions: 各阶段使用的模型标识 {'detection': ..., 'logits': ...}，模型更新后旧条目自动失效
+        """
+        super().__init__(db_path, SCHEMA, max_bytes)
+        self.model_versions = model_versions or {}
+
+        self.hits = {STAGE_DETECTION: 0, STAGE_LOGITS: 0}
+        self.misses = {STAGE_DETECTION: 0, STAGE_LOGITS: 0}
+
+    def content_hash(self, path: str, remember: bool = True) -> str:
+        """文件内容哈希（remember=False 用于上传的临时文件）"""
+        return indexed_content_hash(self._get_connection(), self._write_lock, path, remember)[0]
+
+    def keys_for(self, image_path: str, pipeline: str, use_yolo: bool = True,
+                 remember: bool = True, content_hash: str = None) -> Optional[StageKeys]:
+        """
+        图片的检测框和 logits 缓存键
+
+        Args:
+            pipeline: 分类预处理流程名称（API、GUI、命令行的缩放/裁剪方式不同，logits 不能混用）
+            use_yolo: 是否先做YOLO裁剪（影响 logits；YOLO不可用时调用方应传 False）
+            remember: 是否记录路径对应的内容哈希（上传的临时文件不需要记录）
+            content_hash: 调用方已计算的内容哈希（API 与结果缓存共用，避免同一文件读取两遍）
+
+        Returns:
+            StageKeys，文件无法读取时返回None
+        """
+        if content_hash is None:
+            try:
+                content_hash = self.content_hash(image_path, remember)
+            except OSError:
+                return None
+        return StageKeys(
+            stage_key(content_hash, STAGE_DETECTION, {}, self.model_versions.get(STAGE_DETECTION)),
+            stage_key(content_hash, STAGE_LOGITS,
+                      {'pipeline': pipeline, 'use_yolo': bool(use_yolo),
+                       'detector': self.model_versions.get(STAGE_DETECTION) if use_yolo else None},
+                      self.model_versions.get(STAGE_LOGITS))
+        )
+
+    def _get(self, cache_key: str, stage: str) -> Optional[bytes]:
+        conn = self._get_connection()
+        with span(f'stage_cache.{stage}', CATEGORY_CACHE):
+            row = conn.execute("SELECT data, last_accessed FROM stages WHERE cache_key = ?", (cache_key,)).fetchone()
+        if row is None:
+            self.misses[stage] += 1
+            return None
+        self.hits[stage] += 1
+        self._touch(conn, [(cache_key, row[1])])
+        return row[0]
+
+    def _put(self, cache_key: str, stage: str, data: bytes) -> None:
+        now = time.time()
+        conn = self._get_connection()
+        try:
+            with self._write_lock:
+                replaced = self._replaced_bytes(conn, cache_key)
+                conn.execute("INSERT OR REPLACE INTO stages (cache_key, stage, data, cached_at, last_accessed, size_bytes) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (cache_key, stage, data, now, now, len(data)))
+                self._total_bytes += len(data) - replaced
+                self._enforce_quota(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"写入识别中间结果缓存失败: {e}")
+
+    def get_detection(self, cache_key: str) -> Optional[dict]:
+        """
+        YOLO检测结果: {'bbox': [x1, y1, x2, y2], 'confidence': float}（bbox 为已加边距的裁剪区域），
+        未检测到鸟类时为 {'bbox': None, 'message': str}
+        """
+        data = self._get(cache_key, STAGE_DETECTION)
+        return json.loads(data) if data is not None else None
+
+    def put_detection(self, cache_key: str, detection: dict) -> None:
+        self._put(cache_key, STAGE_DETECTION, json.dumps(detection, ensure_ascii=False).encode('utf-8'))
+
+    def get_logits(self, cache_key: str) -> Optional[np.ndarray]:
+        """分类器原始输出 (num_classes,) float32"""
+        data = self._get(cache_key, STAGE_LOGITS)
+        return np.frombuffer(data, dtype=np.float32).copy() if data is not None else None
+
+    def put_logits(self, cache_key: str, logits) -> None:
+        if hasattr(logits, 'detach'):
+            logits = logits.detach().cpu().numpy()
+        self._put(cache_key, STAGE_LOGITS, np.asarray(logits, dtype=np.float32).tobytes())
+
+    def get_stats(self) -> dict:
+        entries = self._get_connection().execute("SELECT COUNT(*) FROM stages").fetchone()[0]
+        return {
+            'entries': entries,
+            'size_mb': round(self._total_bytes / 1024 / 1024, 2),
+            'max_mb': round(self.max_bytes / 1024 / 1024),
+            'hits': dict(self.hits),
+            'misses': dict(self.misses)
+        }
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+请求级耗时追踪和 Chrome trace 导出
+识别请求或批量任务开始时创建 Trace 并用 use_trace() 设为当前追踪，期间识别流程各阶段（metrics 计时）、
+缓存查询和网络请求都在当前追踪上记录时间段；没有当前追踪时 span() 只读取一次 ContextVar。
+导出的 JSON 为 Chrome trace event 格式，可在 chrome://tracing 或 https://ui.perfetto.dev 中打开
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+CATEGORY_REQUEST = 'request'
+CATEGORY_STAGE = 'stage'
+CATEGORY_CACHE = 'cache'
+CATEGORY_NETWORK = 'network'
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """一个请求（或一批任务）的时间段记录（线程安全，线程池中的任务记录在各自的线程上）"""
+
+    def __init__(self, name: str, **args):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.args = args
+        self.tid = threading.get_ident()  # 创建追踪的请求线程
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, category: str, start: float, end: float, args: dict = None) -> None:
+        """记录一个时间段（start/end 为 time.perf_counter() 的值）"""
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self.start) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident()
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def get_timings(self) -> dict:
+        """
+        按阶段汇总的耗时（毫秒）:
+        {'total_ms': ..., 'stages': {'load_image': ..., ...}, 'cache_ms': ..., 'network_ms': ...}
+        批量识别中多张图片一起处理的阶段按整批计时；线程池中并行的时间段会重复计入
+        """
+        end = self.end if self.end is not None else time.perf_counter()
+        stages = defaultdict(float)
+        by_category = defaultdict(float)
+        with self._lock:
+            for event in self.events:
+                if event['cat'] == CATEGORY_STAGE:
+                    stages[event['name']] += event['dur']
+                else:
+                    by_category[event['cat']] += event['dur']
+        return {
+            'total_ms': round((end - self.start) * 1000, 1),
+            'stages': {stage: round(us / 1000, 1) for stage, us in stages.items()},
+            'cache_ms': round(by_category[CATEGORY_CACHE] / 1000, 1),
+            'network_ms': round(by_category[CATEGORY_NETWORK] / 1000, 1)
+        }
+
+    def to_chrome_trace(self) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        worker_ids = sorted({event['tid'] for event in events} - {self.tid})
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                     'args': {'name': f'SuperBirdID {self.name}'}},
+                    {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': self.tid, 'args': {'name': 'request'}}]
+        metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': f'loader-{n}'}}
+                     for n, tid in enumerate(worker_ids, 1)]
+        root = {'name': self.name, 'cat': CATEGORY_REQUEST, 'ph': 'X', 'ts': 0,
+                'dur': round((end - self.start) * 1e6, 1), 'pid': pid, 'tid': self.tid, 'args': self.args}
+        return {
+            'traceEvents': metadata + [root] + events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'trace_id': self.trace_id,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at))
+            }
+        }
+
+    def save(self, directory: str) -> str:
+        """写入 Chrome trace JSON 文件，返回文件路径"""
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{self.name}-{self.trace_id}.json"
+        path = os.path.join(directory, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return path
+
+
+class Span:
+    """with 语句记录一个时间段"""
+    __slots__ = ('trace', 'name', 'category', 'args', 'start')
+
+    def __init__(self, trace: Trace, name: str, category: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args or {}, error=exc_type.__name__)
+        self.trace.add_span(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def span(name: str, category: str, **args):
+    """在当前追踪上记录一个时间段；没有当前追踪时不做任何记录"""
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name, category, args)
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """
+    在 with 块内将 trace 设为当前追踪（trace 为 None 时不做任何事）
+    不要跨越生成器的 yield 使用：ContextVar 的 token 必须在同一上下文中恢复
+    """
+    if trace is None:
+        yield None
+        return
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def run_in_trace(trace: Optional[Trace], func: Callable, *args, **kwargs):
+    """在 trace 中执行 func（线程池的线程不继承提交者的当前追踪）"""
+    with use_trace(trace):
+        return func(*args, **kwargs)
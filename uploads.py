@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+图片上传接收
+multipart 文件或原始请求体按块写入临时文件，保留原始字节和扩展名：
+EXIF/GPS 读取和 RAW 解码都直接使用原文件，不再经过 base64 传输和 JPEG 重新编码（重新编码会丢失 EXIF）
+"""
+import base64
+import os
+import tempfile
+import time
+from io import BytesIO
+from typing import BinaryIO, Optional
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024          # 每次读写 1MB
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024     # 单个上传的大小上限
+
+CONTENT_TYPE_SUFFIXES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/tiff': '.tif',
+    'image/webp': '.webp',
+    'image/bmp': '.bmp',
+    'image/heic': '.heic',
+    'image/x-adobe-dng': '.dng',
+    'image/x-canon-cr2': '.cr2',
+    'image/x-canon-cr3': '.cr3',
+    'image/x-nikon-nef': '.nef',
+    'image/x-sony-arw': '.arw',
+    'image/x-fuji-raf': '.raf',
+    'image/x-olympus-orf': '.orf',
+    'image/x-panasonic-rw2': '.rw2',
+}
+
+
+class UploadError(Exception):
+    """上传内容无效"""
+
+
+class UploadTooLarge(UploadError):
+    """上传超过大小上限"""
+
+
+def sniff_suffix(head: bytes) -> Optional[str]:
+    """根据文件头判断扩展名（没有文件名和具体 Content-Type 时使用）"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG'):
+        return '.png'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return '.webp'
+    if head.startswith(b'FUJIFILMCCD-RAW'):
+        return '.raf'
+    if head[4:12] == b'ftypcrx ':
+        return '.cr3'
+    if head.startswith((b'IIRO', b'IIRS', b'MMOR')):
+        return '.orf'
+    if head.startswith(b'IIU\x00'):
+        return '.rw2'
+    if head.startswith((b'II*\x00', b'MM\x00*')):
+        # TIFF 结构的RAW（NEF/ARW/DNG等）无法仅凭文件头区分，只识别 CR2
+        return '.cr2' if head[8:10] == b'CR' else '.tif'
+    return None
+
+
+def upload_suffix(filename: Optional[str] = None, content_type: Optional[str] = None, head: bytes = b'') -> str:
+    """
+    确定临时文件扩展名（load_image 按扩展名选择 RAW 或普通图片解码）
+
+    优先级: 原文件名 > Content-Type > 文件头
+    """
+    if filename:
+        suffix = os.path.splitext(filename)[1].lower()
+        if suffix:
+            return suffix
+    if content_type in CONTENT_TYPE_SUFFIXES:
+        return CONTENT_TYPE_SUFFIXES[content_type]
+    return sniff_suffix(head) or '.jpg'
+
+
+def save_upload(stream: BinaryIO, filename: Optional[str] = None, content_type: Optional[str] = None,
+                max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    将上传流按块写入临时文件（不在内存中保留整个文件）
+
+    Returns:
+        临时文件路径（调用方负责删除）
+
+    Raises:
+        UploadTooLarge: 超过大小上限
+        UploadError: 上传为空
+    """
+    head = stream.read(UPLOAD_CHUNK_SIZE)
+    if not head:
+        raise UploadError("上传内容为空")
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=upload_suffix(filename, content_type, head))
+    try:
+        with temp_file:
+            size = 0
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"上传超过 {max_bytes // (1024 * 1024)} MB 上限")
+                temp_file.write(chunk)
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        return temp_file.name
+    except Exception:
+        remove_upload(temp_file.name)
+        raise
+
+
+def save_base64_upload(image_base64: str, filename: Optional[str] = None,
+                       max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Base64 图片按原始字节写入临时文件（不重新编码，保留 EXIF）"""
+    if len(image_base64) * 3 // 4 > max_bytes:
+        raise UploadTooLarge(f"上传超过 {max_bytes // (1024 * 1024)} MB 上限")
+    return save_upload(BytesIO(base64.b64decode(image_base64)), filename, max_bytes=max_bytes)
+
+
+def remove_upload(path: Optional[str]):
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def benchmark_upload(path: str, rounds: int = 3):
+    """
+    对比一个文件通过旧的 base64 + JPEG 重新编码方式和直接上传的传输量与服务端CPU时间
+    """
+    from PIL import Image
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+    encoded = base64.b64encode(raw).decode('ascii')
+    print(f"文件: {os.path.basename(path)} ({len(raw) / 1024 / 1024:.1f} MB)")
+    print(f"传输量: base64 JSON {len(encoded) / 1024 / 1024:.1f} MB，直接上传 {len(raw) / 1024 / 1024:.1f} MB "
+          f"（减少 {(1 - len(raw) / len(encoded)) * 100:.0f}%）")
+
+    def old_path():
+        image = Image.open(BytesIO(base64.b64decode(encoded)))
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+            image.save(temp_file.name, 'JPEG')
+        remove_upload(temp_file.name)
+
+    def new_path():
+        remove_upload(save_upload(BytesIO(raw), os.path.basename(path)))
+
+    for label, func in (('base64 + 重新编码', old_path), ('直接上传', new_path)):
+        try:
+            start = time.process_time()
+            for _ in range(rounds):
+                func()
+            print(f"{label}: 服务端CPU {(time.process_time() - start) / rounds * 1000:.0f} ms")
+        except Exception as e:
+            print(f"{label}: 失败 ({e})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python3 uploads.py <图片或RAW文件>")
+        sys.exit(1)
+    benchmark_upload(sys.argv[1])